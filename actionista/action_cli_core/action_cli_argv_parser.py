@@ -92,6 +92,36 @@ def parse_argv(argv=None):
     return (base_args, base_kwargs), action_groups
 
 
+def parse_script(lines):
+    """ Parse a script with one action chain per line, e.g. for `-script`.
+
+    Blank lines and lines starting with "#" are skipped.
+    Long chains can be continued on the next line with a trailing backslash.
+
+    Args:
+        lines: Iterable of lines, e.g. an open file.
+
+    Yields:
+        (line_number, line, ((base_args, base_kwargs), action_groups)) for each action chain,
+        where `line_number` is the (first) line number of the chain, and the rest is as returned by `parse_argv()`.
+    """
+    chain, first_line_number = "", None
+    for line_number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not chain and (not line or line.startswith("#")):
+            continue
+        if first_line_number is None:
+            first_line_number = line_number
+        if line.endswith("\\"):
+            chain += line[:-1] + " "
+            continue
+        chain += line
+        yield first_line_number, chain, parse_argv(shlex.split(chain))
+        chain, first_line_number = "", None
+    if chain.strip():
+        yield first_line_number, chain, parse_argv(shlex.split(chain))
+
+
 def parse_action_args(action_groups):
     """ Parse action group args. E.g. if we need anything advanced like yaml parsing. """
     pass
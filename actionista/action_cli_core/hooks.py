@@ -0,0 +1,128 @@
+# Copyright 2019, Rasmus Sorensen <rasmusscholer@gmail.com>
+"""
+
+Hook registry, for attaching e.g. tracing and timing code around action dispatch, sync, and commit,
+without modifying the action CLI.
+
+Hooks are called with keyword arguments (so hook functions should accept `**kwargs`, for forward compatibility):
+
+    before_action:  action, args, kwargs, n_tasks
+    after_action:   action, args, kwargs, n_tasks_in, n_tasks_out, duration, error
+    before_sync:    api, resource_types
+    after_sync:     api, resource_types, response, n_items, duration
+    before_commit:  api, n_commands, chunk_size
+    after_commit:   api, n_commands, n_errors, duration, error
+
+`duration` is in seconds, and `error` is the exception raised (the exception is re-raised after the hooks),
+or None. Exceptions raised by hooks are printed as warnings, and do not stop the action chain.
+
+Registering hooks in code:
+
+    >>> from actionista.action_cli_core.hooks import register_hook
+    >>> @register_hook("after_action")
+    ... def log_action(action, duration, n_tasks_in, n_tasks_out, **kwargs):
+    ...     print(f"{action}: {duration:.3f} s, {n_tasks_in} -> {n_tasks_out} tasks")
+
+Registering hooks from another package, with an entry point in the `actionista.hooks` group,
+where the entry point name is the hook name:
+
+    setup(..., entry_points={'actionista.hooks': ['after_action = mypackage.tracing:log_action']})
+
+Entry point discovery is opt-in, since searching for entry points reads the metadata of every installed
+distribution (tens of milliseconds, on every run): enable it with `discover_hooks(load_entry_points=True)`
+(`hook_entry_points=1` in the action CLI config or arguments), before the first hook is run.
+Each entry point is only imported the first time its hook is run.
+When no hooks are registered, running a hook is a dict lookup.
+
+"""
+import sys
+
+HOOK_NAMES = ("before_action", "after_action", "before_sync", "after_sync", "before_commit", "after_commit")
+HOOKS_ENTRY_POINT_GROUP = "actionista.hooks"
+
+_hooks = {name: [] for name in HOOK_NAMES}  # {hook_name: [hook functions]}
+_entry_points = {}  # {hook_name: [entry points that have not been loaded yet]}
+_discovered = False
+
+
+def register_hook(name, func=None):
+    """ Register a hook function. Can also be used as a decorator, `@register_hook("after_action")`.
+
+    Args:
+        name: The hook name, one of `HOOK_NAMES`.
+        func: The hook function, which is called with keyword arguments (see module docstring).
+
+    Returns:
+        The hook function (or a decorator, if `func` is not given).
+    """
+    if name not in _hooks:
+        raise ValueError(f"Unknown hook {name!r}; must be one of {', '.join(HOOK_NAMES)}.")
+    if func is None:
+        return lambda func: register_hook(name, func)
+    _hooks[name].append(func)
+    return func
+
+
+def unregister_hook(name, func):
+    """ Remove a hook function registered with `register_hook()`. """
+    _hooks[name].remove(func)
+
+
+def get_entry_points(group):
+    """ Return the entry points in `group`, using `importlib.metadata` (Python 3.8+) or `pkg_resources`. """
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:
+        import pkg_resources
+        return list(pkg_resources.iter_entry_points(group))
+    eps = entry_points()
+    if hasattr(eps, "select"):  # Python 3.10+
+        return list(eps.select(group=group))
+    return list(eps.get(group, ()))
+
+
+def discover_hooks(load_entry_points=False):
+    """ Find hooks registered as entry points (only once per process). The entry points are not imported yet.
+
+    Args:
+        load_entry_points: If False (default), entry points are not searched (only hooks registered in code are used).
+    """
+    global _discovered
+    if _discovered:
+        return
+    _discovered = True
+    if not load_entry_points:
+        return
+    for entry_point in get_entry_points(HOOKS_ENTRY_POINT_GROUP):
+        if entry_point.name not in _hooks:
+            print(f"\nWARNING: Ignoring entry point {entry_point!r}: {entry_point.name!r} is not a hook name "
+                  f"(must be one of {', '.join(HOOK_NAMES)}).", file=sys.stderr)
+            continue
+        _entry_points.setdefault(entry_point.name, []).append(entry_point)
+
+
+def get_hooks(name):
+    """ Return the hook functions for `name`, importing hooks registered as entry points on first use. """
+    if not _discovered:
+        discover_hooks()
+    if _entry_points.get(name):
+        for entry_point in _entry_points.pop(name):
+            try:
+                _hooks[name].append(entry_point.load())
+            except Exception as exc:
+                print(f"\nWARNING: Could not load hook {entry_point!r}: {exc!r}", file=sys.stderr)
+    return _hooks[name]
+
+
+def has_hooks(name):
+    """ Return True if any hooks are registered for `name`, e.g. to skip collecting hook arguments. """
+    return bool(get_hooks(name))
+
+
+def run_hooks(name, **kwargs):
+    """ Call all hook functions registered for `name` with the given keyword arguments. """
+    for hook in get_hooks(name):
+        try:
+            hook(**kwargs)
+        except Exception as exc:
+            print(f"\nWARNING: Hook {getattr(hook, '__name__', hook)!r} ({name}) failed: {exc!r}", file=sys.stderr)
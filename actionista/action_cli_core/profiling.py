@@ -0,0 +1,137 @@
+# Copyright 2019, Rasmus Sorensen <rasmusscholer@gmail.com>
+"""
+
+Per-action profiling for action chains (`todoist-action-cli profile=1 ...`).
+
+Each phase (loading the cache, injecting task fields, syncing, and every action in the chain) is timed,
+recording wall time, CPU time, the number of tasks going in and out, and the memory allocated during the phase.
+A summary table is printed to stderr at the end:
+
+    $ todoist-action-cli profile=1 -sync -due before today -sort -print
+    $ todoist-action-cli profile=1 profile_file=chain.pstats -filter content startswith RS -print
+    $ todoist-action-cli profile=1 tracemalloc_file=chain.snapshot -sync all
+
+Optionally, the whole run is also profiled with `cProfile` (`profile_file`, inspect with `python -m pstats FILE`),
+and/or a `tracemalloc` snapshot is saved at the end (`tracemalloc_file`, load with `tracemalloc.Snapshot.load()`).
+
+Note: Memory tracing slows down the program (typically 2-3x), which also affects the wall and CPU times;
+use `profile_memory=0` to only measure times.
+
+"""
+import sys
+import time
+import contextlib
+
+PROFILE_TABLE_COLUMNS = ("Phase", "Wall [ms]", "CPU [ms]", "Tasks in", "Tasks out", "Alloc [KiB]", "Peak [KiB]")
+
+
+class ActionProfiler:
+    """ Records timing and memory for each phase of an action chain. Disabled profilers do (almost) nothing. """
+
+    def __init__(self, enabled=True, *, profile_memory=True, profile_file=None, tracemalloc_file=None):
+        """
+        Args:
+            enabled: If False, `phase()` does not record anything, and `finish()` does not print anything.
+            profile_memory: Trace memory allocations (with `tracemalloc`).
+            profile_file: If given, profile the run with `cProfile`, and dump the stats to this file.
+            tracemalloc_file: If given, save a `tracemalloc` snapshot to this file at the end.
+        """
+        self.enabled = enabled
+        self.profile_memory = enabled and (profile_memory or bool(tracemalloc_file))
+        self.profile_file = profile_file if enabled else None
+        self.tracemalloc_file = tracemalloc_file if enabled else None
+        self.records = []
+        self._stack = []  # Records of the phases currently running (phases can be nested, e.g. sync -> inject).
+        self._cprofile = None
+
+    def start(self):
+        if self.profile_memory:
+            import tracemalloc
+            tracemalloc.start()
+        if self.profile_file:
+            import cProfile
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+        return self
+
+    @contextlib.contextmanager
+    def phase(self, name, tasks=None):
+        """ Context manager, recording a phase. Set `record['n_out']` for the number of tasks after the phase.
+
+        Yields:
+            The record dict for the phase.
+        """
+        record = {"name": name, "depth": len(self._stack),
+                  "n_in": len(tasks) if tasks is not None else None, "n_out": None}
+        if not self.enabled:
+            yield record
+            return
+        if self.profile_memory:
+            import tracemalloc
+            current, peak = tracemalloc.get_traced_memory()
+            if self._stack:
+                # The peak is reset for the nested phase, so record the parent's peak so far:
+                self._stack[-1]["_peak"] = max(self._stack[-1]["_peak"], peak)
+            record["_start_mem"] = record["_peak"] = current
+            if hasattr(tracemalloc, "reset_peak"):  # Python 3.9+
+                tracemalloc.reset_peak()
+        self._stack.append(record)
+        self.records.append(record)
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        try:
+            yield record
+        finally:
+            record["wall"] = time.perf_counter() - wall_start
+            record["cpu"] = time.process_time() - cpu_start
+            self._stack.pop()
+            if self.profile_memory:
+                current, peak = tracemalloc.get_traced_memory()
+                record["_peak"] = max(record["_peak"], peak)
+                record["alloc"] = current - record["_start_mem"]
+                if hasattr(tracemalloc, "reset_peak"):
+                    record["peak"] = record["_peak"] - record["_start_mem"]
+                if self._stack:
+                    self._stack[-1]["_peak"] = max(self._stack[-1]["_peak"], record["_peak"])
+
+    def format_report(self):
+        """ Return the summary table, with one row per phase (nested phases are indented). """
+        def fmt(value, scale=None):
+            if value is None:
+                return "-"
+            return f"{value:,}" if scale is None else f"{value * scale:,.0f}"
+        rows = [PROFILE_TABLE_COLUMNS]
+        for record in self.records:
+            rows.append((
+                "  " * record["depth"] + record["name"],
+                fmt(record.get("wall"), 1000), fmt(record.get("cpu"), 1000),
+                fmt(record["n_in"]), fmt(record["n_out"]),
+                fmt(record.get("alloc"), 1/1024), fmt(record.get("peak"), 1/1024),
+            ))
+        widths = [max(len(row[i]) for row in rows) for i in range(len(PROFILE_TABLE_COLUMNS))]
+        lines = ["  ".join(cell.ljust(width) if i == 0 else cell.rjust(width)
+                           for i, (cell, width) in enumerate(zip(row, widths))) for row in rows]
+        lines.insert(1, "-" * len(lines[0]))
+        top_level = [record for record in self.records if record["depth"] == 0 and "wall" in record]
+        lines.append(f"Total: {sum(record['wall'] for record in top_level) * 1000:,.0f} ms wall, "
+                     f"{sum(record['cpu'] for record in top_level) * 1000:,.0f} ms CPU.")
+        return "\n".join(lines)
+
+    def finish(self, file=None):
+        """ Stop profiling, print the summary table, and write the cProfile stats and tracemalloc snapshot files. """
+        if not self.enabled:
+            return
+        file = file or sys.stderr
+        if self._cprofile is not None:
+            self._cprofile.disable()
+            self._cprofile.dump_stats(self.profile_file)
+            self._cprofile = None
+        print("\nProfile:\n" + self.format_report(), file=file)
+        if self.profile_file:
+            print(f" - cProfile stats written to {self.profile_file} (use `python -m pstats {self.profile_file}`).",
+                  file=file)
+        if self.profile_memory:
+            import tracemalloc
+            if self.tracemalloc_file:
+                tracemalloc.take_snapshot().dump(self.tracemalloc_file)
+                print(f" - tracemalloc snapshot written to {self.tracemalloc_file}.", file=file)
+            tracemalloc.stop()
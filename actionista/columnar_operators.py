@@ -0,0 +1,262 @@
+# Copyright 2019, Rasmus Sorensen <rasmusscholer@gmail.com>
+"""
+
+Column-wise versions of the operators in `binary_operators`, with the same names.
+
+Each operator takes a column (a list with the non-missing values of a task field, for all tasks)
+and the comparison value, and returns a sequence of booleans (a list, or a numpy array), equivalent to
+`[binary_operators.<name>(a, b) for a in column]`, e.g.
+
+    >>> lt([1, 2, 3, 4], 3)
+    [True, True, False, False]
+
+The column storage (the "kind") is determined by the type of the values: `int`, `float`, `str`,
+or `datetime` (timezone-aware datetimes, compared as integer microseconds since the epoch with NumPy).
+Columns with mixed types (or other types, e.g. lists of labels) have no columnar implementation,
+and neither do comparison values of an incompatible type; `get_operator()` returns None for these,
+and the caller should use the scalar operator instead (which also reproduces its errors).
+
+If NumPy is installed, comparisons and string operations use NumPy (vectorized comparisons,
+and `numpy.char` for strings) for columns of at least `NUMPY_MIN_SIZE` values. Otherwise,
+the operators are evaluated in a single list comprehension, with e.g. glob and regex patterns compiled once.
+
+`benchmarks/bench_columnar_filter.py` checks that all columnar operators give the same result
+as the scalar operators, and compares their speed.
+
+"""
+import re as _re
+import datetime
+import operator
+from fnmatch import translate as _glob_to_regex
+
+NUMPY_MIN_SIZE = 64  # Below this, converting the column to a numpy array costs more than it saves.
+EPOCH_UTC = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+MICROSECOND = datetime.timedelta(microseconds=1)
+
+_numpy = False  # The numpy module, None if not installed; False until the first import attempt.
+
+
+def get_numpy():
+    """ Return the numpy module, or None if it is not installed. Imported on first use. """
+    global _numpy
+    if _numpy is False:
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        _numpy = numpy
+    return _numpy
+
+
+def get_column_kind(column):
+    """ Return the kind of a column ("int", "float", "str", or "datetime"), or None if it has no columnar kind. """
+    types = set(map(type, column))
+    if len(types) != 1:
+        return None
+    column_type = types.pop()
+    if column_type is int:
+        return "int"
+    if column_type is float:
+        return "float"
+    if column_type is str:
+        return "str"
+    if column_type is datetime.datetime and all(value.tzinfo is not None for value in column):
+        return "datetime"
+    return None
+
+
+def is_compatible(kind, b):
+    """ Return True if a column of `kind` can be compared with `b` column-wise. """
+    if kind == "int":
+        return type(b) is int
+    if kind == "float":
+        return type(b) in (int, float)
+    if kind == "str":
+        return type(b) is str
+    if kind == "datetime":
+        return type(b) is datetime.datetime and b.tzinfo is not None
+    return False
+
+
+def to_microseconds(dt):
+    """ Return a timezone-aware datetime as integer microseconds since the epoch (exact, unlike `timestamp()`). """
+    return (dt - EPOCH_UTC) // MICROSECOND
+
+
+def as_array(column, kind):
+    """ Return (values, numpy) for the column, where `values` is a numpy array, or the column if numpy is not used.
+
+    Datetimes are converted to integer microseconds for numpy (lists of datetimes are compared directly).
+    """
+    np = get_numpy() if len(column) >= NUMPY_MIN_SIZE else None
+    if np is None:
+        return column, None
+    if kind == "datetime":
+        column = [to_microseconds(value) for value in column]
+    if kind == "int" and not all(-2**63 <= value < 2**63 for value in (min(column), max(column))):
+        return column, None  # Too large for int64.
+    return np.array(column), np
+
+
+def _comparison(op, doc):
+    def column_op(column, b):
+        kind = get_column_kind(column)
+        values, np = as_array(column, kind)
+        if np is not None:
+            return op(values, to_microseconds(b) if kind == "datetime" else b)
+        return [op(a, b) for a in values]
+    column_op.__doc__ = doc
+    column_op.kinds = ("int", "float", "str", "datetime")
+    column_op.numpy_only = True  # Without numpy, the scalar operator is just as fast.
+    return column_op
+
+
+eq = _comparison(operator.eq, "Column-wise `a == b`.")
+ne = _comparison(operator.ne, "Column-wise `a != b`.")
+lt = _comparison(operator.lt, "Column-wise `a < b`.")
+le = _comparison(operator.le, "Column-wise `a <= b`.")
+gt = _comparison(operator.gt, "Column-wise `a > b`.")
+ge = _comparison(operator.ge, "Column-wise `a >= b`.")
+
+
+def _string_op(func, *, lower=False, kinds=("str",), numpy_only=False):
+    """ Decorator for string operators, `func(values, b, np)`, with optional lower-casing of both operands. """
+    def column_op(column, b):
+        b = str(b)
+        values, np = as_array(column, "str")
+        if lower:
+            b = b.lower()
+            values = np.char.lower(values) if np is not None else [a.lower() for a in values]
+        return func(values, b, np)
+    column_op.__name__ = func.__name__
+    column_op.__doc__ = func.__doc__
+    column_op.kinds = kinds
+    column_op.numpy_only = numpy_only
+    return column_op
+
+
+def _startswith(values, b, np):
+    """ Column-wise `str(a).startswith(str(b))`. """
+    if np is not None:
+        return np.char.startswith(values, b)
+    return [a.startswith(b) for a in values]
+
+
+def _endswith(values, b, np):
+    """ Column-wise `str(a).endswith(str(b))`. """
+    if np is not None:
+        return np.char.endswith(values, b)
+    return [a.endswith(b) for a in values]
+
+
+def _contains(values, b, np):
+    """ Column-wise `b in a`. """
+    if np is not None:
+        return np.char.find(values, b) >= 0
+    return [b in a for a in values]
+
+
+def _in(values, b, np):
+    """ Column-wise `a in b`. """
+    return [a in b for a in values]
+
+
+def _eq(values, b, np):
+    """ Column-wise `a == b`. """
+    if np is not None:
+        return values == b
+    return [a == b for a in values]
+
+
+def _ne(values, b, np):
+    """ Column-wise `a != b`. """
+    if np is not None:
+        return values != b
+    return [a != b for a in values]
+
+
+def _lt(values, b, np):
+    """ Column-wise `a < b`. """
+    if np is not None:
+        return values < b
+    return [a < b for a in values]
+
+
+def _gt(values, b, np):
+    """ Column-wise `a > b`. """
+    if np is not None:
+        return values > b
+    return [a > b for a in values]
+
+
+def _fnmatch(values, b, np):
+    """ Column-wise glob-style matching, `fnmatchcase(a, b)`, with the pattern compiled once. """
+    match = _re.compile(_glob_to_regex(b)).match
+    return [match(a) is not None for a in values]
+
+
+def _match(values, b, np):
+    """ Column-wise `bool(re.match(b, a))`, with the pattern compiled once. """
+    match = _re.compile(b).match
+    return [bool(match(a)) for a in values]
+
+
+startswith = _string_op(_startswith)
+istartswith = _string_op(_startswith, lower=True)
+endswith = _string_op(_endswith)
+iendswith = _string_op(_endswith, lower=True)
+contains = _string_op(_contains, numpy_only=True)  # `b in a` is just as fast as a scalar operator.
+icontains = _string_op(_contains, lower=True)
+# Note: `in_` (`a in b`) is just as fast as a scalar operator, so only the case-insensitive version is columnar.
+iin = _string_op(_in, lower=True)
+ieq = _string_op(_eq, lower=True)
+ine = _string_op(_ne, lower=True)
+ilt = _string_op(_lt, lower=True)
+igt = _string_op(_gt, lower=True)
+# Note: `binary_operators.ige` is currently the same as `igt`, so it does not have a columnar version.
+glob = _string_op(_fnmatch)
+ifnmatch = _string_op(_fnmatch, lower=True)
+re = _string_op(_match)
+ire = _string_op(_match, lower=True)
+
+# Aliases, same as in `binary_operators`:
+equals = equal = eq
+neq = nequal = ne
+less = lessthan = lt
+greater = greaterthan = gt
+iglob = ifnmatch
+matches = re
+imatches = ire
+
+
+def has_operator(op_name, n_values):
+    """ Return True if `op_name` may have a columnar implementation for a column of `n_values` values.
+
+    This is checked before collecting the column values; `get_operator()` then checks the column itself.
+    """
+    column_op = globals().get(op_name)
+    if getattr(column_op, 'kinds', None) is None or not n_values:
+        return False
+    return not getattr(column_op, 'numpy_only', False) or (n_values >= NUMPY_MIN_SIZE and get_numpy() is not None)
+
+
+def get_operator(op_name, column, b):
+    """ Return the columnar operator `op_name` for the column and comparison value, or None if there is none.
+
+    Args:
+        op_name: The operator name, as in `binary_operators`, e.g. "eq" or "startswith".
+        column: List of (non-missing) values.
+        b: The comparison value.
+
+    Returns:
+        The columnar operator function, or None if the operator has no columnar implementation
+        for this kind of column, or for comparison with `b`. Comparisons (`eq`, `lt`, etc.) are only
+        returned if they use NumPy, since they are not faster than the scalar operators otherwise.
+    """
+    if not has_operator(op_name, len(column)):
+        return None
+    column_op = globals()[op_name]
+    kind = get_column_kind(column)
+    if kind not in column_op.kinds or not is_compatible(kind, b):
+        return None
+    return column_op
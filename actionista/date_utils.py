@@ -6,9 +6,8 @@ Module dealing specifically with dates and times.
 """
 import datetime
 
-import parsedatetime
 from dateutil import tz
-import dateparser
+# dateparser and parsedatetime are slow to import, so they are imported in the functions that use them.
 # import datetime
 # import pendulum
 
@@ -40,6 +39,7 @@ def utc_time_to_local(utcdatetime, timezone=None, fmt="datetime"):
     if timezone is None:
         timezone = tz.tzlocal()
     if isinstance(utcdatetime, str):
+        import dateparser
         utcdatetime = dateparser.parse(utcdatetime)
     if utcdatetime.tzinfo is None:
         utcdatetime.replace(tzinfo=tz.gettz('UTC'))
@@ -61,6 +61,7 @@ def local_time_to_utc(localtime, timezone=None, fmt="datetime"):
     if timezone is None:
         timezone = tz.tzlocal()
     if isinstance(localtime, str):
+        import dateparser
         localtime = dateparser.parse(localtime)
     if localtime.tzinfo is None:
         localtime.replace(tzinfo=timezone)
@@ -94,6 +95,7 @@ def human_date_to_iso(human_date, fmt=ISO_8601_FMT):
     The returned datetime object does not by default have any timezone information,
     so the iso datestring is basically local time.
     """
+    import dateparser
     dt = dateparser.parse(human_date)
     if dt is None:
         print(f"\nERROR: FAILED to parse human input date {human_date!r}.\n")
@@ -108,6 +110,7 @@ def get_rfc3339_datestr(datestr: str):
         # If datetime.datetime.fromisoformat() is unable to parse the date_str,
         # then it is probably not an iso string and we should re-parse it.
         # Note that dateutil.parser.parse("monday") works just fine.
+        import parsedatetime
         cal = parsedatetime.Calendar()
         time_struct, context = cal.parse(datestr, version=2)
         dt = datetime.datetime(*time_struct[:6])
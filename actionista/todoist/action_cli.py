@@ -28,17 +28,36 @@ The module uses the [official "Todoist Python API" package](https://pypi.org/pro
 
 """
 
+import io
 import sys
+import json
+import time
+import difflib
+import inspect
+import datetime
+import contextlib
 import todoist
 import shutil
 from pprint import pprint
 
 from actionista import binary_operators
 from actionista.todoist import action_commands
-from actionista.action_cli_core.action_cli_argv_parser import parse_argv
-from actionista.todoist.action_commands import ACTIONS
-from actionista.todoist.tasks_utils import add_custom_task_fields
+from actionista.action_cli_core.action_cli_argv_parser import parse_argv, parse_script
+from actionista.action_cli_core.profiling import ActionProfiler
+from actionista.action_cli_core.hooks import discover_hooks, run_hooks
+from actionista.todoist.action_commands import ACTIONS, READ_ONLY_ACTIONS, get_required_resource_types
+from actionista.todoist.tasks_utils import add_custom_task_fields, reset_custom_task_data
 from actionista.todoist.config import get_config, get_token
+from actionista.todoist.rate_limit import install_rate_limiter
+from actionista.todoist.metrics import enable_metrics, add_metric
+from actionista.todoist.name_resolver import NameResolver
+from actionista.todoist.action_shell import ActionShell
+from actionista.todoist.explain import DEFAULT_EXPLAIN_SAMPLE_SIZE, explain_chain, format_plan
+from actionista.todoist.result_cache import DEFAULT_RESULT_CACHE_MAX_SIZE, ResultCache, is_cacheable
+from actionista.todoist.sync_utils import commit_chunked, has_state_changes, read_cache_file
+from actionista.todoist.sync_utils import sync_resource_types, start_background_resource_sync, apply_resource_responses
+from actionista.todoist.sync_utils import resume_commit as resume_commit_pending
+from actionista.todoist.sync_utils import defer_commit, flush_outbox, load_outbox, load_pending_commands
 
 NEWLINE = '\n'
 
@@ -112,8 +131,36 @@ def action_cli(argv=None, verbose=0):
 
     -Note: -sync is currently implied as the first action.-  (Edit: No, using cache for while testing.)
 
+    Stale-while-revalidate: Use `stale_while_revalidate=1` (before the first action, or in the config file)
+    to start evaluating the action chain on the cached tasks right away, while syncing in the background:
+
+        $ todoist-action-cli stale_while_revalidate=1 -due today -print
+
+    If the sync changes the selected tasks, the read-only part of the chain is re-run and printed again.
+    Actions that modify tasks or talk to the server always wait for the fresh data.
+
+    Partial sync: `-sync` only fetches updates for the resource types that the action chain needs
+    (items, plus projects and labels for the derived task fields), leaving everything else in the cache as-is.
+    Use `-sync all` for a full sync, or list the resource types explicitly, e.g. `-sync items notes`.
+    The default can also be set with `sync_resource_types` (e.g. `sync_resource_types=all`).
+
+    Profiling: Use `profile=1` (before the first action) to print a table with the wall time, CPU time,
+    number of tasks in and out, and memory allocated for each action (and for loading the cache, syncing,
+    and injecting task fields) at the end. Add `profile_file=FILE` to also dump `cProfile` stats,
+    `tracemalloc_file=FILE` to save a `tracemalloc` snapshot, or `profile_memory=0` to only measure times:
+
+        $ todoist-action-cli profile=1 -sync -due before today -sort -print
+
+    Result cache: Use `result_cache=1` (before the first action, or in the config file) to cache the output
+    of chains that only use read-only actions (filtering, sorting, printing). The output is replayed,
+    without loading the cache, until the local data changes (e.g. after `-sync`), the config changes,
+    or the date changes. The cache size is bounded by `result_cache_max_size` (bytes, LRU eviction):
+
+        $ todoist-action-cli result_cache=1 -due today -sort -print
+
     Available actions include:
         -sync:          Sync changes with the server. NOTE that sync will reset all previous task filters!
+                        Use `-sync all` to sync all resource types, not just the ones needed by the action chain.
         -filter         filter the task list.
         -due            shorthand for filtering by due date.
         -sort           sort the task list.
@@ -121,9 +168,29 @@ def action_cli(argv=None, verbose=0):
         -reschedule     reschedule all tasks in the current task list, usually after filter-selecting.
         -mark-completed mark all tasks in the tasks list as completed.
         -commit:        Commit local changes. Will ask for confirmation if `-y` has not been given beforehand.
+                        Large change sets are committed in chunks, e.g. `-commit 50` to use 50 commands per request.
+        -resume-commit: Re-submit commands from a commit that was interrupted (e.g. by a timeout).
+        -flush:         Commit all commands deferred to the local outbox with `-commit later`.
+        -completed:     Replace the task list with completed tasks from the local archive, e.g. `-completed monday`.
+                        Tasks completed since the last run are fetched first (use `fetch=0` to skip).
+        -activity:      Replace the task list with events from the local activity log, e.g. `-activity monday`
+                        for tasks completed since monday, or `-activity monday event_type=added` for added tasks.
+                        New events are fetched first (use `fetch=0` to skip).
+        -stats:         Print statistics for completed tasks: completed tasks per project per day, habit streaks,
+                        and rolling averages, e.g. `-stats`, or `-stats habits rolling window=28`.
+        -script:        Run action chains from a file (or stdin), one chain per line, starting each chain from
+                        the same loaded tasks, e.g. `-script morning.txt -commit` (one commit for all chains).
+        -shell:         Start an interactive shell, which keeps the loaded tasks in memory, and accepts action chains
+                        line by line, with Tab completion of action, field, and project names.
+        -watch:         Keep running, syncing every INTERVAL seconds, and re-evaluate (and print) the rest of the
+                        chain when the tasks change, e.g. `-watch 60 -due today -print`. Use `diff=1` to only print
+                        the changed lines.
+        -explain:       Print the query plan for the rest of the chain, without executing it: how each action
+                        is executed, tasks in and out, filter selectivity, commands and HTTP requests, and syncs,
+                        e.g. `-explain -due before today -reschedule today -commit`.
         -y, -yes:       Skip all confirmation prompts.
 
-    For a full list of commands, refer to the `action_cli.ACTIONS` module attribute.
+    For a full list of commands, refer to the `action_commands.ACTIONS` module attribute.
     (Is also printed when invoking `todoist-action-cli --help`).
 
     You can chain as many operations as you need, but you cannot fork the pipeline.
@@ -293,11 +360,41 @@ def action_cli(argv=None, verbose=0):
 
     """
     (base_args, base_kwargs), action_groups = parse_argv(argv=argv)
+    # The actions that need the `api` object (closures defined below) are added to a copy of `ACTIONS`:
+    actions = dict(ACTIONS)
 
     config = get_config() or {}
     config.update(base_kwargs)
+    # Per-phase timing and memory report, e.g. `profile=1` (see `action_cli_core/profiling.py`):
+    profiler = ActionProfiler(
+        enabled=bool(int(config.get('profile', 0))), profile_memory=bool(int(config.get('profile_memory', 1))),
+        profile_file=config.get('profile_file'), tracemalloc_file=config.get('tracemalloc_file'),
+    ).start()
+    # Optional run metrics export, if `metrics_file` or `metrics_textfile_dir` is configured (see `metrics.py`):
+    enable_metrics(config)
+    # Hooks registered as entry points (see `action_cli_core/hooks.py`) are only used with `hook_entry_points=1`:
+    discover_hooks(load_entry_points=bool(int(config.get('hook_entry_points', 0))))
     token = get_token(raise_if_missing=True, config=config)
-    api = todoist.TodoistAPI(token=token)
+    # Replay the output of read-only chains from the result cache, if enabled (see `result_cache.py`):
+    result_cache = result_key = None
+    if (int(config.get('result_cache', 0)) and is_cacheable(action_groups) and not profiler.enabled
+            and not int(config.get('stale_while_revalidate', 0))):
+        result_cache = ResultCache(max_size=config.get('result_cache_max_size', DEFAULT_RESULT_CACHE_MAX_SIZE),
+                                   verbose=verbose)
+        result_key = result_cache.get_key(token, action_groups, config)
+        output = result_cache.get(result_key)
+        if output is not None:
+            sys.stdout.write(output)
+            return
+    with profiler.phase("load cache") as record:
+        # Read the cache incrementally, rather than letting `TodoistAPI.__init__` load the whole file at once:
+        api = todoist.TodoistAPI(token=token, cache=None)
+        read_cache_file(api)
+        record['n_out'] = len(api.state['items'])
+    # Share the request rate limit with other running instances (e.g. cron jobs):
+    rate_limiter = install_rate_limiter(api.session, config=config)
+    # Project/label/section name lookups, shared by all `-add-task` actions in the chain:
+    resolver = NameResolver(api)
     if config.get('api_url'):
         # Current default: 'https://api.todoist.com/sync/v8/' (including the last '/')
         assert config.get('api_url').endswith('/')
@@ -306,6 +403,7 @@ def action_cli(argv=None, verbose=0):
         api.get_api_url = lambda: config.get('api_url')
     # Regarding caching:
     # By default, TodoistAPI.__init__ will load cache files (.json and .sync) from path given by `cache` parameter.
+    # (We use `read_cache_file()` instead, which does the same, but without parsing the whole file in one go.)
     # api.sync() will invoke `_write_cache()` after `_post()` and `_update_state()`.
     # api.sync()  # Sync not always strictly needed; can load values from cache, e.g. for testing.
 
@@ -316,7 +414,14 @@ def action_cli(argv=None, verbose=0):
     # so we should have `todoist.model.Item` object instances (not just the dicts received from the server):
     task_items = api.state['items']
 
-    add_custom_task_fields(tasks=task_items, api=api, verbose=verbose, **base_kwargs)
+    with profiler.phase("inject task fields", task_items):
+        add_custom_task_fields(tasks=task_items, api=api, verbose=verbose, **base_kwargs)
+
+    # Only sync the resource types needed by the action chain (unless configured otherwise):
+    required_resource_types = config.get('sync_resource_types') or get_required_resource_types(
+        action_groups, **base_kwargs)
+    if isinstance(required_resource_types, str):
+        required_resource_types = required_resource_types.split(',')
 
     def increment_verbosity(tasks, **kwargs):
         """ Increase program informational output verbosity. """
@@ -325,7 +430,7 @@ def action_cli(argv=None, verbose=0):
         nonlocal verbose
         verbose += 1
         return tasks
-    ACTIONS['v'] = ACTIONS['verbose'] = increment_verbosity
+    actions['v'] = actions['verbose'] = increment_verbosity
 
     ask_before_commit = True
 
@@ -335,12 +440,17 @@ def action_cli(argv=None, verbose=0):
         ask_before_commit = False
         return tasks
 
-    ACTIONS['y'] = ACTIONS['yes'] = ACTIONS['no-prompt'] = disable_confirmation_prompt
+    actions['y'] = actions['yes'] = actions['no-prompt'] = disable_confirmation_prompt
 
     # Better to define sync here rather than relying on getting api from existing task
-    def sync(tasks, **kwargs):
+    def sync(tasks, *resource_types, **kwargs):
         """ Pull task updates from the server to synchronize the local task data cache.
         Note: api.sync() without arguments will just fetch updates (no commit of local changes).
+
+        Args:
+            tasks: The current task list (ignored; sync always returns all tasks).
+            *resource_types: The resource types to sync, e.g. `items notes`, or `all` for a full sync.
+                Default: The resource types needed by the action chain.
         """
         # Remove custom fields (in preparation for JSON serialization during `_write_cache()`:
         n_before = len(tasks)
@@ -349,17 +459,31 @@ def action_cli(argv=None, verbose=0):
         # for task in api.state['items']:
         #     for k in CUSTOM_FIELDS:
         #         task.data.pop(k, None)  # pop(k, None) returns None if key doesn't exists, unlike `del task[k]`.
-        api.sync()
+        with profiler.phase("fetch and apply") as record:
+            response = sync_resource_types(api, list(resource_types) or required_resource_types, verbose=verbose)
+            record['n_out'] = len(response.get('items', []))
+        resolver.invalidate(response)
         tasks = api.state['items']
+        reset_custom_task_data(tasks, task_ids={item['id'] for item in response.get('items', [])})
         n_after = len(tasks)
         print(f" - {n_after} tasks after sync ({n_before} tasks in the task list before sync).")
-        add_custom_task_fields(tasks=tasks, api=api, verbose=verbose, **base_kwargs)
+        with profiler.phase("inject task fields", tasks):
+            add_custom_task_fields(tasks=tasks, api=api, verbose=verbose, **base_kwargs)
         return tasks
 
-    ACTIONS['sync'] = sync
+    actions['sync'] = sync
+
+    def commit(tasks, chunk_size=None, pipeline=1, *, raise_on_error=True, verbose=0):
+        """ Commit is a sync that includes local commands from the queue, emptying the queue. Raises SyncError.
 
-    def commit(tasks, *, raise_on_error=True, verbose=0):
-        """ Commit is a sync that includes local commands from the queue, emptying the queue. Raises SyncError. """
+        Large queues are committed in chunks of `chunk_size` commands (default: config `commit_chunk_size`,
+        or 100), e.g. `-commit 50`. Errors are collected for all chunks before raising.
+        With `pipeline=1` (default), the next chunk is submitted while the previous response is parsed.
+        Use `-commit later` to add the commands to the local outbox instead, and `-flush` to commit them later.
+        """
+        if chunk_size == 'later':
+            defer_commit(api, verbose=verbose)
+            return tasks
         # Prompt if needed:
         if ask_before_commit:
             answer = input(f"\nPROMPT: About to commit {len(api.queue)} updates. Continue? [Y/n] ") or 'Y'
@@ -373,12 +497,62 @@ def action_cli(argv=None, verbose=0):
         #     for k in CUSTOM_FIELDS:
         #         task.data.pop(k, None)  # pop(k, None) returns None if key doesn't exists, unlike `del task[k]`.
         # Commit changes (includes an automatic sync), and re-parse task items:
-        api.commit(raise_on_error=raise_on_error)
+        if chunk_size is None:
+            chunk_size = config.get('commit_chunk_size')
+        commit_chunked(api, chunk_size=chunk_size, resource_types=required_resource_types,
+                       pipeline=bool(int(pipeline)), raise_on_error=raise_on_error,
+                       max_retries=int(config.get('commit_max_retries', 5)), verbose=verbose)
         tasks = api.state['items']
+        reset_custom_task_data(tasks)  # Committed tasks may have new ids and data.
         add_custom_task_fields(tasks=tasks, api=api, verbose=verbose, **base_kwargs)
         return tasks
 
-    ACTIONS['commit'] = commit
+    actions['commit'] = commit
+
+    def resume_commit(tasks, chunk_size=None, *, raise_on_error=True, verbose=0):
+        """ Resume an interrupted commit, re-submitting pending commands that were not confirmed by the server.
+
+        Commands are identified by their uuid, so commands that were already applied are not applied twice.
+        """
+        queued_uuids = {cmd['uuid'] for cmd in api.queue}
+        n_pending = sum(cmd['uuid'] not in queued_uuids for cmd in load_pending_commands(api))
+        if ask_before_commit and n_pending:
+            answer = input(f"\nPROMPT: About to commit {n_pending + len(api.queue)} updates "
+                           f"(including {n_pending} pending commands). Continue? [Y/n] ") or 'Y'
+            if answer[0].lower() == 'n':
+                print(" - OK, ABORTING resume-commit.")
+                return tasks
+        if verbose > -1:
+            print("\nResuming interrupted commit...")
+        if chunk_size is None:
+            chunk_size = config.get('commit_chunk_size')
+        resume_commit_pending(api, chunk_size=chunk_size, resource_types=required_resource_types,
+                              raise_on_error=raise_on_error, verbose=verbose)
+        tasks = api.state['items']
+        reset_custom_task_data(tasks)  # Committed tasks may have new ids and data.
+        add_custom_task_fields(tasks=tasks, api=api, verbose=verbose, **base_kwargs)
+        return tasks
+
+    actions['resume-commit'] = resume_commit
+
+    def flush(tasks, chunk_size=None, *, raise_on_error=True, verbose=0):
+        """ Commit all deferred commands in the outbox (from `-commit later`) in a single chunked commit. """
+        if ask_before_commit:
+            answer = input(f"\nPROMPT: About to commit {len(load_outbox(api)) + len(api.queue)} updates "
+                           f"from the outbox. Continue? [Y/n] ") or 'Y'
+            if answer[0].lower() == 'n':
+                print(" - OK, ABORTING flush.")
+                return tasks
+        if chunk_size is None:
+            chunk_size = config.get('commit_chunk_size')
+        flush_outbox(api, chunk_size=chunk_size, resource_types=required_resource_types,
+                     raise_on_error=raise_on_error, verbose=verbose)
+        tasks = api.state['items']
+        reset_custom_task_data(tasks)  # Committed tasks may have new ids and data.
+        add_custom_task_fields(tasks=tasks, api=api, verbose=verbose, **base_kwargs)
+        return tasks
+
+    actions['flush'] = flush
 
     # Better to define sync here rather than relying on getting api from existing task
     def show_queue(tasks, *, fmt="json", width=200, indent=2, verbose=0):
@@ -404,8 +578,8 @@ def action_cli(argv=None, verbose=0):
             raise ValueError(f"Argument `fmt` value {fmt} not recognized. Should be one of 'pprint', 'yaml', or 'json'.")
         return tasks
 
-    ACTIONS['show-queue'] = show_queue
-    ACTIONS['print-queue'] = show_queue
+    actions['show-queue'] = show_queue
+    actions['print-queue'] = show_queue
 
     def delete_cache(tasks, *, verbose=0):
         """ Delete local todoist data cache.
@@ -418,7 +592,28 @@ def action_cli(argv=None, verbose=0):
             print("delete_cache: API does not have any cache specified, so cannot delete cache.")
         return tasks
 
-    ACTIONS['delete-cache'] = delete_cache
+    actions['delete-cache'] = delete_cache
+
+    def fetch_completed(tasks, since=None, until=None, *, fetch=1, verbose=0):
+        """ Replace the task list with completed tasks. See `action_commands.fetch_completed_tasks()`. """
+        return action_commands.fetch_completed_tasks(tasks, since, until, fetch=fetch, api=api, verbose=verbose)
+
+    actions['completed'] = actions['fetch-completed'] = fetch_completed
+
+    def fetch_activity(tasks, since=None, until=None, *, event_type="completed", object_type="item",
+                       fetch=1, verbose=0):
+        """ Replace the task list with events from the activity log. See `action_commands.fetch_activity_tasks()`. """
+        return action_commands.fetch_activity_tasks(
+            tasks, since, until, event_type=event_type, object_type=object_type, fetch=fetch, api=api,
+            verbose=verbose)
+
+    actions['activity'] = fetch_activity
+
+    def print_stats(tasks, *reports, verbose=0, **kwargs):
+        """ Print statistics for completed tasks. See `action_commands.print_completion_stats_action()`. """
+        return action_commands.print_completion_stats_action(tasks, *reports, api=api, verbose=verbose, **kwargs)
+
+    actions['stats'] = print_stats
 
     def print_help(tasks, cmd=None, *, verbose=0):
         """ Print help messages. Use `-help <action>` to get help on a particular action. """
@@ -431,7 +626,7 @@ def action_cli(argv=None, verbose=0):
             print("    -------------------------------------\n")
             print("\n".join(
                 f"      -{action:20} {(func.__doc__ or '').split(NEWLINE, 1)[0]}"
-                for action, func in list(ACTIONS.items())))
+                for action, func in list(actions.items())))
             print("\n")
         elif cmd == "operators":
             print("""
@@ -455,17 +650,17 @@ argument to convert input values to e.g. integers.
 """)
             print(binary_operators.__doc__)
         else:
-            if cmd not in ACTIONS:
+            if cmd not in actions:
                 print(f"\nERROR: {cmd!r} command not recognized.\n")
                 return print_help(tasks)
             else:
-                print(ACTIONS[cmd].__doc__)
+                print(actions[cmd].__doc__)
         return tasks
 
-    ACTIONS['h'] = ACTIONS['help'] = ACTIONS['-help'] = print_help
+    actions['h'] = actions['help'] = actions['-help'] = print_help
 
     def add_task(tasks, task_content, *, project=None, due=None, priority=None, labels=None,
-                 auto_reminder=True, auto_parse_labels=True, verbose=0):
+                 auto_reminder=True, auto_parse_labels=True, commit=0, verbose=0):
         """ Forward arguments to action_commands.add_task, injecting the `api` object. """
         print("add_task function invoked with args:")
         pprint(dict(
@@ -476,12 +671,153 @@ argument to convert input values to e.g. integers.
         return action_commands.add_task(
             tasks=tasks, api=api, task_content=task_content,
             project=project, due=due, priority=priority, labels=labels,
-            auto_reminder=True, auto_parse_labels=auto_parse_labels, verbose=verbose
+            auto_reminder=True, auto_parse_labels=auto_parse_labels, commit=commit, verbose=verbose,
+            resolver=resolver,
         )
 
-    ACTIONS['add-task'] = ACTIONS['-add-task'] = add_task
+    actions['add-task'] = actions['-add-task'] = add_task
+
+    def run_script(tasks, filepath="-", *, verbose=0):
+        """ Run action chains from a script file (or stdin), one chain per line, e.g. `-script morning.txt -commit`.
+
+        Every chain starts from the task list given to `-script` (i.e. the loaded tasks, with the derived fields
+        already injected), and all chains share the same `api` object and command queue,
+        so a single `-commit` after `-script` commits the changes from all chains.
+        Blank lines and lines starting with "#" are skipped. Returns the task list unchanged.
+
+        Args:
+            tasks: The task list that each chain starts from.
+            filepath: The script file, or "-" to read the script from stdin.
+        """
+        if filepath == "-":
+            chains = list(parse_script(sys.stdin))
+        else:
+            with open(filepath) as fp:
+                chains = list(parse_script(fp))
+        # Check all chains before running any of them:
+        for line_number, line, ((chain_args, chain_kwargs), chain_groups) in chains:
+            unrecognized = [agroup[0] for agroup in chain_groups if agroup[0] not in actions]
+            if chain_args or chain_kwargs or unrecognized:
+                raise ValueError(
+                    f"Error in script {filepath!r}, line {line_number}: {line!r} "
+                    + (f"(actions not recognized: {unrecognized})" if unrecognized
+                       else "(arguments must be given after an action, e.g. `-print`)"))
+        if verbose > -1:
+            print(f"\nRunning {len(chains)} action chains from script {filepath!r}...", file=sys.stderr)
+        for line_number, line, (_, chain_groups) in chains:
+            if verbose > 0:
+                print(f"\n - Script line {line_number}: {line}", file=sys.stderr)
+            run_actions(tasks, chain_groups)
+        return tasks
+
+    actions['script'] = run_script
+
+    def run_shell(tasks, *, verbose=0):
+        """ Start an interactive shell, where action chains are entered line by line (see `action_shell.py`).
+
+        The api object, tasks, and name indexes are kept in memory between chains.
+        Each chain continues from the task list left by the previous chain; use `reset` to start from all tasks.
+        Returns the task list left by the last chain, e.g. `-shell -print`.
+        """
+        shell = ActionShell(api, actions, run_actions, tasks)
+        shell.cmdloop()
+        return shell.tasks
+
+    actions['shell'] = run_shell
+
+    def watch(tasks, interval=60, *, diff=0, max_polls=0, verbose=0, action_groups=()):
+        """ Keep running, and re-evaluate the rest of the action chain whenever the tasks change, e.g.
+        `-watch 60 -due today -print` (poll every 60 seconds), or `-watch 60 diff=1 -due today -print`.
+
+        Each poll is an incremental sync (using the stored sync tokens) of only the resource types needed
+        by the action chain. The chain is only re-evaluated if the sync returned changes (or the date changed),
+        and the output is only printed if it changed. With `diff=1`, only the changed output lines are printed
+        (prefixed with "+" or "-"). Only read-only actions (e.g. filtering, sorting, and printing) can follow `-watch`.
+        Stop with Ctrl+C, or after `max_polls` polls.
+
+        Args:
+            tasks: The task list to start from.
+            interval: Seconds between polls.
+            diff: Only print the lines of the output that changed.
+            max_polls: Stop after this many polls (0: never).
+            action_groups: The actions that follow `-watch` (added by `run_actions()`).
+        """
+        interval, diff, max_polls = float(interval), int(diff), int(max_polls)
+        not_read_only = [agroup[0] for agroup in action_groups if agroup[0] not in READ_ONLY_ACTIONS]
+        if not_read_only:
+            raise ValueError(f"Only read-only actions can follow `-watch` (got: {not_read_only}).")
+
+        def evaluate(tasks):
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                tasks = run_actions(tasks, action_groups)
+            return tasks, output.getvalue()
+
+        selected, last_output = evaluate(tasks)
+        sys.stdout.write(last_output)
+        last_date = datetime.date.today()
+        n_polls = 0
+        try:
+            while not max_polls or n_polls < max_polls:
+                time.sleep(interval)  # Between polls, the process just sleeps.
+                n_polls += 1
+                try:
+                    response = sync_resource_types(api, required_resource_types, verbose=verbose - 1)
+                except Exception as exc:
+                    print(f"\nWARNING: Sync failed ({exc!r}); retrying in {interval} seconds.", file=sys.stderr)
+                    continue
+                # Relative dates (e.g. `-due today`) change at midnight, even if the tasks did not:
+                date_changed = datetime.date.today() != last_date
+                if not (has_state_changes(response) or date_changed):
+                    continue
+                last_date = datetime.date.today()
+                resolver.invalidate(response)
+                tasks = api.state['items']
+                if date_changed or response.get('full_sync') or response.get('projects') or response.get('labels'):
+                    reset_custom_task_data(tasks)  # Project/label names and relative dates are used by all tasks.
+                else:
+                    reset_custom_task_data(tasks, task_ids={item['id'] for item in response.get('items', [])})
+                add_custom_task_fields(tasks=tasks, api=api, verbose=verbose - 1, **base_kwargs)
+                selected, output = evaluate(tasks)
+                if output == last_output:
+                    continue
+                print(f"\n[{datetime.datetime.now():%Y-%m-%d %H:%M:%S}] Updated:", file=sys.stderr)
+                if diff:
+                    sys.stdout.writelines(
+                        line for line in difflib.ndiff(last_output.splitlines(True), output.splitlines(True))
+                        if line[:2] in ("+ ", "- "))
+                else:
+                    sys.stdout.write(output)
+                sys.stdout.flush()
+                last_output = output
+        except KeyboardInterrupt:
+            print("\nStopped watching.", file=sys.stderr)
+        return selected
+
+    actions['watch'] = watch
+
+    def explain(tasks, *, sample_size=DEFAULT_EXPLAIN_SAMPLE_SIZE, verbose=0, action_groups=()):
+        """ Print the query plan for the rest of the action chain, without executing it (see `explain.py`), e.g.
+        `-explain -due before today -reschedule today -commit`.
+
+        Filters are evaluated on a sample of up to `sample_size` tasks to estimate their selectivity;
+        actions that change tasks or talk to the server are not invoked.
+
+        Args:
+            tasks: The task list the chain would start from.
+            sample_size: The maximum number of tasks to evaluate the filters on.
+            action_groups: The actions that follow `-explain` (added by `run_actions()`).
+        """
+        steps, summary = explain_chain(
+            tasks, action_groups, actions, api=api, required_resource_types=required_resource_types,
+            config=config, base_kwargs=base_kwargs, sample_size=int(sample_size))
+        print(f"\nQuery plan for {len(steps)} actions on {len(tasks):,} tasks:\n")
+        print(format_plan(steps, summary))
+        return tasks
+
+    actions['explain'] = explain
 
-    unrecognized_actions = [agroup[0] for agroup in action_groups if agroup[0] not in ACTIONS]
+    unrecognized_actions = [agroup[0] for agroup in action_groups if agroup[0] not in actions]
     if unrecognized_actions:
         print("\nERROR, the following actions were not recognized:", unrecognized_actions)
         for act_str in unrecognized_actions:
@@ -494,15 +830,108 @@ argument to convert input values to e.g. integers.
         # Print default help
         action_groups.append(('help', [], {}))
 
-    # For each action in the action chain, invoke the action providing the (remaining) tasks as first argument.
-    for action_key, action_args, action_kwargs in action_groups:
-        n_tasks = len(task_items)
-        if verbose >= 1:
-            print(f"\nInvoking '{action_key}' action on {n_tasks} tasks with args: {action_args!r}", file=sys.stderr)
-        action_func = ACTIONS[action_key]
-        # TODO: Pass `config=config` to all action commands (or move from functional to object-oritented flow).
-        task_items = action_func(task_items, *action_args, verbose=verbose, **action_kwargs)
-        assert task_items is not None
+    def nest_action_groups(action_groups, action_name):
+        """ Move the actions following the first `action_name` action into its `action_groups` keyword argument. """
+        index = next((i for i, agroup in enumerate(action_groups) if agroup[0] == action_name), None)
+        if index is None:
+            return action_groups
+        _, action_args, action_kwargs = action_groups[index]
+        action_kwargs = dict(action_kwargs, action_groups=action_groups[index + 1:])
+        return list(action_groups[:index]) + [(action_name, action_args, action_kwargs)]
+
+    def run_actions(tasks, action_groups):
+        """ Invoke each action in the action chain, providing the (remaining) tasks as first argument. """
+        # The actions after `-watch` are re-evaluated by the watch action, and the actions after `-explain`
+        # are planned, but not executed. This is done here, rather than when parsing argv,
+        # so it also applies to the chains in `-script` files and at the `-shell` prompt:
+        action_groups = nest_action_groups(nest_action_groups(action_groups, 'watch'), 'explain')
+        for action_key, action_args, action_kwargs in action_groups:
+            n_tasks = len(tasks)
+            if verbose >= 1:
+                print(f"\nInvoking '{action_key}' action on {n_tasks} tasks with args: {action_args!r}",
+                      file=sys.stderr)
+            action_func = actions[action_key]
+            if 'config' not in action_kwargs and 'config' in inspect.signature(action_func).parameters:
+                # Actions use the config loaded above, rather than loading it again:
+                action_kwargs = dict(action_kwargs, config=config)
+            run_hooks("before_action", action=action_key, args=action_args, kwargs=action_kwargs, n_tasks=n_tasks)
+            start_time = time.perf_counter()
+            try:
+                with profiler.phase(action_key, tasks) as record:
+                    tasks = action_func(tasks, *action_args, verbose=verbose, **action_kwargs)
+                    assert tasks is not None
+                    record['n_out'] = len(tasks)
+            except Exception as exc:
+                run_hooks("after_action", action=action_key, args=action_args, kwargs=action_kwargs,
+                          n_tasks_in=n_tasks, n_tasks_out=None, duration=time.perf_counter() - start_time, error=exc)
+                raise
+            duration = time.perf_counter() - start_time
+            add_metric("action_duration_seconds", duration, action=action_key)
+            add_metric("action_calls", action=action_key)
+            run_hooks("after_action", action=action_key, args=action_args, kwargs=action_kwargs,
+                      n_tasks_in=n_tasks, n_tasks_out=len(tasks), duration=duration, error=None)
+        return tasks
+
+    def run_actions_stale_while_revalidate(tasks, action_groups):
+        """ Evaluate the read-only part of the action chain on the cached tasks while syncing in the background.
+
+        When the sync response arrives, it is applied to the local state. If the sync delta changed
+        the selected tasks, the read-only part of the chain is re-run on the fresh tasks and printed again.
+        Actions that change tasks (e.g. `-reschedule`) or talk to the server (e.g. `-sync`, `-commit`)
+        are only invoked after the fresh state has been applied.
+        """
+        n_read_only = next((i for i, agroup in enumerate(action_groups) if agroup[0] not in READ_ONLY_ACTIONS),
+                           len(action_groups))
+        read_only_groups, remaining_groups = action_groups[:n_read_only], action_groups[n_read_only:]
+        run_hooks("before_sync", api=api, resource_types=required_resource_types)
+        sync_start_time = time.perf_counter()
+        future = start_background_resource_sync(api, required_resource_types, verbose=verbose)
+        tasks = run_actions(tasks, read_only_groups)
+        # Snapshot the result before the sync response updates the task objects in-place:
+        stale_result = [json.dumps(task.data, sort_keys=True, default=str) for task in tasks]
+        try:
+            results = future.result()
+        except Exception as exc:
+            print(f"\nWARNING: Background sync failed ({exc!r}); continuing with cached data.", file=sys.stderr)
+            return run_actions(tasks, remaining_groups)
+        with profiler.phase("apply background sync"):
+            response = apply_resource_responses(api, results, write_cache=True)
+        run_hooks("after_sync", api=api, resource_types=required_resource_types, response=response,
+                  n_items=len(response.get('items', [])), duration=time.perf_counter() - sync_start_time)
+        resolver.invalidate(response)
+        if has_state_changes(response):
+            fresh_tasks = api.state['items']
+            reset_custom_task_data(fresh_tasks, task_ids={item['id'] for item in response.get('items', [])})
+            with profiler.phase("inject task fields", fresh_tasks):
+                add_custom_task_fields(tasks=fresh_tasks, api=api, verbose=verbose, **base_kwargs)
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                fresh_tasks = run_actions(fresh_tasks, read_only_groups)
+            fresh_result = [json.dumps(task.data, sort_keys=True, default=str) for task in fresh_tasks]
+            if fresh_result != stale_result:
+                print(f"\nNOTICE: Sync changed the selected tasks ({len(stale_result)} tasks before sync, "
+                      f"{len(fresh_result)} tasks after sync). Updated output:", file=sys.stderr)
+                sys.stdout.write(output.getvalue())
+            elif verbose > -1:
+                print("\n - Sync did not change the selected tasks.", file=sys.stderr)
+            tasks = fresh_tasks
+        elif verbose > -1:
+            print("\n - Sync: No changes since the last sync.", file=sys.stderr)
+        return run_actions(tasks, remaining_groups)
+
+    try:
+        if int(config.get('stale_while_revalidate', 0)) and not any(agroup[0] == 'explain' for agroup in action_groups):
+            run_actions_stale_while_revalidate(task_items, action_groups)
+        elif result_cache is not None:
+            # Store the output, so the next run with the same key can replay it:
+            with result_cache.recording(result_key, argv=list(sys.argv[1:] if argv is None else argv)):
+                run_actions(task_items, action_groups)
+        else:
+            run_actions(task_items, action_groups)
+    finally:
+        profiler.finish()
+    if verbose > 0 or rate_limiter.total_wait >= 1:
+        print("\n" + rate_limiter.format_stats(), file=sys.stderr)
 
 
 if __name__ == '__main__':
@@ -11,11 +11,11 @@ import operator
 import sys
 import builtins
 
-import parsedatetime
 from dateutil import tz
 from todoist.models import Item
 
 from actionista import binary_operators
+from actionista import columnar_operators
 # 'in' is a reserved keyword, so the equivalent command is `in_`:
 setattr(binary_operators, 'in', binary_operators.in_)
 from actionista.date_utils import ISO_8601_FMT, start_of_day, DATE_DAY_FMT, end_of_day
@@ -23,16 +23,20 @@ from actionista.date_utils import local_time_to_utc, get_rfc3339_datestr
 from actionista.todoist.config import DEFAULT_TASK_PRINT_FMT, DEFAULT_TASK_SORT_KEYS, DEFAULT_TASK_SORT_ORDER
 from actionista.todoist.config import get_config
 from actionista.todoist.tasks_utils import get_task_value, get_recurring_tasks, is_recurring
-from actionista.todoist.tasks_utils import inject_tasks_project_fields
+from actionista.todoist.tasks_utils import inject_tasks_project_fields, inject_tasks_date_fields
+from actionista.todoist.tasks_utils import inject_tasks_labels_fields
 from actionista.todoist import api_commands
-
-
-CONFIG = get_config()
+from actionista.todoist.history import update_completed_archive, load_completed_archive
+from actionista.todoist.history import update_activity_log, load_activity_events, get_event_task_dict
+from actionista.todoist.utils import get_todoist_api
+from actionista.todoist.analytics import CompletionColumns, print_completion_stats, STATS_REPORTS
+from actionista.todoist.analytics import DEFAULT_STATS_SINCE, DEFAULT_REPORT_DAYS, DEFAULT_ROLLING_WINDOW
+from actionista.todoist.analytics import DEFAULT_HABIT_LABEL
 
 
 def print_tasks(
         tasks: list,
-        print_fmt: str = DEFAULT_TASK_PRINT_FMT,
+        print_fmt: str = None,
         header=None, sep: str = "\n",
         *,
         data_attr: str = "_custom_data",
@@ -58,7 +62,8 @@ def print_tasks(
             but I prefer to add derived data fields in a separate Item._custom_data,
             so that they don't get persisted when writing the cache to disk.
         verbose: The verbosity to print informational messages with during the filtering process.
-        config: Optional configuration dict.
+        config: Optional configuration dict, used for the default `print_fmt` (`default_task_print_fmt` key).
+            Default: Load config from file (see `config.get_config()`).
 
     Returns: List of tasks.
 
@@ -86,9 +91,9 @@ def print_tasks(
         # We also have the same above fields for `date_added` and `completed_date`.
 
     """
-    if config is None:
-        config = CONFIG
     if print_fmt is None:
+        if config is None:
+            config = get_config()
         print_fmt = config.get('default_task_print_fmt', DEFAULT_TASK_PRINT_FMT) if config else DEFAULT_TASK_PRINT_FMT
     if verbose > -1:
         print(f"\n - Printing {len(tasks)} tasks",
@@ -106,17 +111,20 @@ def print_tasks(
     return tasks
 
 
-def sort_tasks(tasks, keys=DEFAULT_TASK_SORT_KEYS, order=DEFAULT_TASK_SORT_ORDER,
+def sort_tasks(tasks, keys=None, order=None,
                *, data_attr="_custom_data", verbose=0, config=None):
     """ Sort the list of tasks, by task attribute in ascending or descending order.
 
     Args:
         tasks: The tasks to sort (dicts or todoist.moddl.Item objects).
         keys: The keys to sort by. Should be a list or comma-separated string.
+            Default: The `default_task_sort_keys` config key, or `DEFAULT_TASK_SORT_KEYS`.
         order: The sort order, either ascending or descending.
+            Default: The `default_task_sort_order` config key, or `DEFAULT_TASK_SORT_ORDER`.
         # Keyword only arguments:
         data_attr: Ues this attribute for task data. For instance, if the
         verbose: The verbosity to print informational messages with during the filtering process.
+        config: Optional configuration dict. Default: Load config from file (see `config.get_config()`).
 
     Examples:
 
@@ -131,8 +139,8 @@ def sort_tasks(tasks, keys=DEFAULT_TASK_SORT_KEYS, order=DEFAULT_TASK_SORT_ORDER
         due_date,priority,item_order
 
     """
-    if config is None:
-        config = CONFIG
+    if config is None and (keys is None or order is None):
+        config = get_config()
     if keys is None:
         keys = config.get('default_task_sort_keys', DEFAULT_TASK_SORT_KEYS) if config else DEFAULT_TASK_SORT_KEYS
     if order is None:
@@ -157,7 +165,7 @@ def filter_tasks(
         missing="exclude", default=None,
         value_transform=None, negate=False,
         data_attr="_custom_data",
-        *, verbose=0):
+        *, columnar=True, verbose=0):
     """ Generic task filtering method based on comparison with a specific task attribute.
 
     CLI signature:
@@ -182,6 +190,9 @@ def filter_tasks(
             Note: Negate applies to the transform, but not to tasks included/excluded due to missing value.
         data_attr: Instead of using task or task.data, use `getatr(task, data_attr)`.
             This is useful if you are setting custom task data on `task._custom_data` to keep them separate.
+        columnar: Evaluate the filter on all task values at once, using the columnar version of the operator
+            (see `columnar_operators`), if there is one for the type of the task values.
+            Has no effect with `verbose > 0`, which prints each evaluation, or with missing="raise".
         verbose: The verbosity to print informational messages with during the filtering process.
 
     Returns:
@@ -283,6 +294,23 @@ def filter_tasks(
             value = type(task_value)(value)
         return task_value
 
+    if (columnar and verbose <= 0 and missing in ("include", "exclude", "default")
+            and columnar_operators.has_operator(op_name, len(tasks))):
+        # Get the task values once, and evaluate the operator on the whole column:
+        column = [get_value(task, default) for task in tasks] if missing == "default" else list(map(get_value, tasks))
+        present = [task_value for task_value in column if task_value is not None]
+        column_op = columnar_operators.get_operator(op_name, present, value)
+        if column_op is not None and (missing != "default" or len(present) == len(column)):
+            matches = column_op(present, value)
+            matches = iter(matches.tolist() if hasattr(matches, 'tolist') else matches)
+            if missing == "include":
+                return [task for task, task_value in zip(tasks, column)
+                        if task_value is None or next(matches) != negate]
+            if missing == "exclude":
+                return [task for task, task_value in zip(tasks, column)
+                        if task_value is not None and next(matches) != negate]
+            return [task for task in tasks if next(matches) != negate]
+
     if missing == "raise":
         def filter_eval(task):
             task_value = get_value(task)
@@ -419,6 +447,7 @@ def special_is_filter(tasks, *args, **kwargs):
         # dt, accuracy = date_data['date_obj'], date_data['period']  # Max 'period' precision is 'day' :(
         # Using parsedatetime, since dateparser has a poor concept of accuracy:
         # parsedatetime also understands e.g. "in two days", etc.
+        import parsedatetime  # Imported here, since it is only needed for due date filters.
         cal = parsedatetime.Calendar()
         # Note: cal.parse returns a time.struct_time, not datetime object,
         # use cal.parseDT() to get a datetime object. Or just dt = datetime.datetime(*dt[:6])
@@ -903,7 +932,7 @@ def add_task(tasks, api, task_content, *,
              project=None, due=None, priority=None, labels=None,
              auto_reminder=True, auto_parse_labels=True,
              sync=0, commit=0, show_queue=0,
-             verbose=0):
+             verbose=0, resolver=None):
     """ Add a new task API method 'item_add'.
 
     See: https://developer.todoist.com/sync/v8/?shell#add-an-item
@@ -917,7 +946,11 @@ def add_task(tasks, api, task_content, *,
         priority: Task priority, either number [1-4] or str ["p4", "p3", 'p2", "p1"].
         auto_reminder: Automatically add a default reminder to the task, if task is due at a specific time of day.
         auto_parse_labels: Automatically extract "@label" strings from the task content.
+        sync: Sync before adding the task.
+        commit: Commit the new task right away. Use `commit=later` to add it to the outbox (see `-flush`).
+        show_queue: Show the API queue after adding the task.
         verbose: Increase or decrease the verbosity of the information printed during function run.
+        resolver: NameResolver for looking up project and label ids (re-used between `-add-task` actions).
 
     Returns:
         tasks:  List of tasks (after deleting them).
@@ -935,27 +968,130 @@ def add_task(tasks, api, task_content, *,
         priority=priority,
         auto_reminder=auto_reminder,
         auto_parse_labels=auto_parse_labels,
-        sync=bool(int(sync)), commit=bool(int(commit)), show_queue=bool(int(show_queue)),
+        sync=bool(int(sync)), commit=commit if commit == 'later' else bool(int(commit)),
+        show_queue=bool(int(show_queue)),
         verbose=verbose,
-        api=api,
+        api=api, resolver=resolver,
     )
     # tasks.append(new_task)  # This should not be needed, because api.items.add() updates the `tasks` list.
 
     return tasks
 
 
-def fetch_completed_tasks(tasks, *, verbose=0):
-    """ This will replace `tasks` with a list of completed tasks dicts. May not work nicely. Only for playing around.
+def fetch_completed_tasks(tasks, since=None, until=None, *, fetch=1, api=None, verbose=0):
+    """ Replace `tasks` with completed tasks (dicts) from the local archive of completed tasks.
+
+    Tasks completed since the last fetch are first fetched from the server and added to the archive
+    (see `history.update_completed_archive()`), unless `fetch=0`, in which case no requests are made.
+
+    Args:
+        tasks: The current task list (discarded).
+        since: Only include tasks completed after this date/time, e.g. "monday" or "2019-09-01".
+        until: Only include tasks completed before this date/time.
+        fetch: Fetch newly completed tasks from the server before loading the archive.
+        api: TodoistAPI object (default: `get_todoist_api()`).
+        verbose: Increase or decrease the verbosity of the information printed during function run.
+
+    Examples:
+        $ todoist-action-cli -completed "monday" -sort completed_date_iso -print "{completed_date_iso} {content}"
+        $ todoist-action-cli -completed "2019-09-01" "2019-09-30" fetch=0 -project Work -print
 
-    You should probably use the old CLI instead:
-        $ todoist print-completed-today --print-fmt "* {title}"
     """
+    if api is None:
+        api = get_todoist_api()
     if verbose > -1:
-        print(f"Discarting the current {len(tasks)} tasks, and fetching completed tasks instead...")
-    from actionista.todoist.adhoc_cli import completed_get_all
-    # This will use a different `api` object instance to fetch completed tasks:
-    tasks, projects = completed_get_all()
-    inject_tasks_project_fields(tasks, projects)
+        print(f"Discarding the current {len(tasks)} tasks, and using completed tasks instead...", file=sys.stderr)
+    if int(fetch):
+        update_completed_archive(api, verbose=verbose)
+    tasks, projects = load_completed_archive(api, since=since, until=until)
+    inject_tasks_date_fields(tasks, strict=False)
+    inject_tasks_project_fields(tasks, projects, strict=False)
+    # Completed items do not have labels, but the default print format uses the label fields:
+    inject_tasks_labels_fields(tasks, api.labels.all())
+    if verbose > -1:
+        print(f" - {len(tasks)} completed tasks.", file=sys.stderr)
+    return tasks
+
+
+def fetch_activity_tasks(tasks, since=None, until=None, *, event_type="completed", object_type="item",
+                         fetch=1, api=None, verbose=0):
+    """ Replace `tasks` with tasks (dicts) made from events in the local activity log.
+
+    Events since the last fetch are first fetched from the server and added to the log
+    (see `history.update_activity_log()`), unless `fetch=0`, in which case no requests are made.
+    Each task has the event's `event_type` and `event_date` fields, and completed tasks have `completed_date`.
+
+    Args:
+        tasks: The current task list (discarded).
+        since: Only include events after this date/time, e.g. "monday" or "2019-09-01".
+        until: Only include events before this date/time.
+        event_type: Only include events of this type, e.g. "added", "updated", or "completed" (empty for all).
+        object_type: Only include events for this type of object (default: "item", i.e. tasks).
+        fetch: Fetch new events from the server before loading the activity log.
+        api: TodoistAPI object (default: `get_todoist_api()`).
+        verbose: Increase or decrease the verbosity of the information printed during function run.
+
+    Examples:
+        $ todoist-action-cli -activity "monday" fetch=0 -print "{event_date_iso} {content}"
+        $ todoist-action-cli -activity "1 week ago" event_type=added -project Work -print
+
+    """
+    if api is None:
+        api = get_todoist_api()
+    if verbose > -1:
+        print(f"Discarding the current {len(tasks)} tasks, and using activity log events instead...", file=sys.stderr)
+    if int(fetch):
+        update_activity_log(api, verbose=verbose)
+    events = load_activity_events(api, since=since, until=until, object_type=object_type, event_type=event_type)
+    tasks = [get_event_task_dict(event) for event in events]
+    inject_tasks_date_fields(tasks, date_keys=("completed_date", "event_date"), strict=False)
+    inject_tasks_project_fields(tasks, api.projects.all(), strict=False)
+    inject_tasks_labels_fields(tasks, api.labels.all())
+    if verbose > -1:
+        print(f" - {len(tasks)} events.", file=sys.stderr)
+    return tasks
+
+
+def print_completion_stats_action(tasks, *reports, since=DEFAULT_STATS_SINCE, days=DEFAULT_REPORT_DAYS,
+                                  window=DEFAULT_ROLLING_WINDOW, habit_label=DEFAULT_HABIT_LABEL,
+                                  fetch=1, api=None, verbose=0):
+    """ Print statistics for completed tasks (from the local archive of completed tasks).
+
+    The task list is not changed. Available reports are "projects" (completed tasks per project per day),
+    "habits" (streaks for tasks labelled @habit), and "rolling" (completed tasks per day, with rolling average).
+    Default is to print all reports. See `analytics.py` for details.
+
+    Args:
+        tasks: The current task list (returned unchanged).
+        *reports: The reports to print.
+        since: Load completed tasks since this date/time (default: 1 year ago).
+        days: The number of days to show in the reports.
+        window: The number of days to average over, for the rolling average.
+        habit_label: The label used for habit tasks.
+        fetch: Fetch newly completed tasks from the server before loading the archive.
+        api: TodoistAPI object (default: `get_todoist_api()`).
+        verbose: Increase or decrease the verbosity of the information printed during function run.
+
+    Examples:
+        $ todoist-action-cli -stats
+        $ todoist-action-cli -stats habits rolling window=28 days=14 fetch=0
+
+    """
+    if api is None:
+        api = get_todoist_api()
+    if int(fetch):
+        update_completed_archive(api, verbose=verbose)
+    items, projects = load_completed_archive(api, since=since)
+    # Completed items do not have labels, so we get the labels from the (active) tasks:
+    habit_label_ids = {label['id'] for label in api.labels.all() if label['name'] == habit_label}
+    # Tasks added locally (e.g. with `-add-task`, without labels) have no 'labels' key:
+    habit_task_ids = {item['id'] for item in api.state['items']
+                      if habit_label_ids.intersection(item.data.get('labels') or [])}
+    columns = CompletionColumns(items, projects, habit_task_ids=habit_task_ids, habit_label=habit_label)
+    if verbose > 0:
+        print(f"Loaded {len(columns)} completed tasks since {since} "
+              f"({'numpy' if columns.np is not None else 'hash'} aggregation).", file=sys.stderr)
+    print_completion_stats(columns, reports or STATS_REPORTS, days=int(days), window=int(window))
     return tasks
 
 
@@ -1012,15 +1148,85 @@ ACTIONS = {
     'uncomplete': uncomplete_tasks,
     'archive': archive_tasks,
     'complete_and_update': complete_and_update_date_for_recurring_tasks,
-    # 'fetch-completed': fetch_completed_tasks,  # WARNING: Not sure how this works, but probably doesn't work well.
     # The following actions are overwritten when the api object is created inside the action_cli() function:
+    'completed': fetch_completed_tasks, 'fetch-completed': fetch_completed_tasks,
+    'activity': fetch_activity_tasks,
+    'stats': print_completion_stats_action,
     'verbose': None, 'v': None,  # Increase verbosity.
     'delete-cache': None,  # Delete local cache files.
     'sync': None,  # Pulls updates from the server, but does not push changes to the server.
     'commit': None,  # Push changes to the server.
+    'resume-commit': None,  # Re-submit pending commands from an interrupted commit.
+    'flush': None,  # Commit commands deferred to the outbox with `-commit later`.
     'show-queue': None,  # Show the command queue, that will be pushed to the server on `commit`.
+    'script': None,  # Run action chains from a file, sharing the loaded tasks and the command queue.
+    'shell': None,  # Interactive shell (REPL) for action chains.
+    'watch': None,  # Re-evaluate the rest of the action chain when the tasks change.
+    'explain': None,  # Print the query plan for the rest of the action chain, without executing it.
+}
+
+# Actions that neither change tasks nor talk to the server; they only select, sort, or print tasks.
+# Read-only actions can safely be evaluated on cached data while a sync is in progress (and be re-evaluated).
+READ_ONLY_ACTIONS = {
+    'print', 'sort', 'filter', 'has', 'is', 'not', 'due',
+    'contains', 'startswith', 'endswith', 'glob', 'iglob', 'eq', 'ieq',
+    'content', 'name', 'project', 'label',
+    'priority', 'priority-eq', 'priority-ge', 'priority-str', 'priority-str-eq', 'p1', 'p2', 'p3', 'p4',
+    'verbose', 'v', 'y', 'yes', 'no-prompt', 'show-queue', 'print-queue', 'help', 'h', '-help',
+}
+
+# Read-only actions that do not remove any tasks from the task list (all other read-only actions are filters):
+PASS_THROUGH_ACTIONS = {
+    'print', 'sort', 'verbose', 'v', 'y', 'yes', 'no-prompt', 'show-queue', 'print-queue', 'help', 'h', '-help',
+}
+
+# Sync API command queued for each task by the actions that change tasks (used by `-explain`):
+TASK_ACTION_COMMANDS = {
+    'reschedule': 'item_update',
+    'reschedule-due-date': 'item_update',
+    'reschedule-by-string': 'item_update',
+    'reschedule-fixed-timezone': 'item_update',
+    'rename': 'item_update',
+    'mark-completed': 'item_close',
+    'close': 'item_close',
+    'reopen': 'item_uncomplete',
+    'uncomplete': 'item_uncomplete',
+    'archive': 'item_archive',
+    'complete_and_update': 'item_update_date_complete',
+}
+
+# Sync API resource types needed by the derived task fields (see `add_custom_task_fields()`):
+TASK_RESOURCE_TYPES = {
+    'inject_task_project_fields': 'projects',
+    'inject_task_labels_fields': 'labels',
 }
 
+# Sync API resource types needed by specific actions, in addition to 'items':
+ACTION_RESOURCE_TYPES = {
+    'add-task': ['projects', 'labels'],
+}
+
+
+def get_required_resource_types(action_groups, **base_kwargs):
+    """ Return the Sync API resource types needed to evaluate the given action chain.
+
+    Args:
+        action_groups: List of (action_name, args, kwargs) tuples, as returned by `parse_argv()`.
+        **base_kwargs: Base keyword arguments, e.g. `inject_task_project_fields=0` (the derived
+            task fields are injected by default, and these require both projects and labels).
+
+    Returns:
+        Sorted list of resource types, e.g. `['items', 'labels', 'projects']`.
+    """
+    resource_types = {'items'}
+    for key, rtype in TASK_RESOURCE_TYPES.items():
+        if int(base_kwargs.get(key, 1)):
+            resource_types.add(rtype)
+    for action_name, _, _ in action_groups:
+        resource_types.update(ACTION_RESOURCE_TYPES.get(action_name, ()))
+    return sorted(resource_types)
+
+
 # These are actions that requires the full `api` object to work,
 # e.g. because they need to convert a project-name to project-id.
 API_ACTIONS = {
@@ -0,0 +1,163 @@
+# Copyright 2019, Rasmus Sorensen <rasmusscholer@gmail.com>
+"""
+
+Interactive shell for the action CLI (`todoist-action-cli -shell`).
+
+The shell keeps the `api` object, the loaded tasks (with derived fields injected), and the name indexes in memory,
+so action chains can be entered one line at a time without paying the startup and cache load for each chain:
+
+    $ todoist-action-cli -shell
+    todoist [412 tasks]> -due before today -print
+    todoist [7 tasks]> -project Work -print
+    todoist [3 tasks]> -reschedule tomorrow -commit
+    todoist [3 tasks]> reset
+    todoist [412 tasks]> sync
+
+Each chain continues from the task list left by the previous chain; use `reset` to start from all tasks again.
+Action names (after "-"), task field names, and project and label names can be completed with Tab.
+
+"""
+import os
+import cmd
+import sys
+import shlex
+
+from actionista.action_cli_core.action_cli_argv_parser import parse_argv
+from actionista.todoist.sync_utils import get_cache_dir
+
+SHELL_HISTORY_FILENAME = "shell_history"
+SHELL_HISTORY_LENGTH = 1000
+N_TASKS_FOR_FIELD_NAMES = 50  # Collect field names from the first N tasks (fields like `due` are optional).
+PROJECT_NAME_ACTIONS = ("-project", "project_name")  # Complete project names after these words.
+LABEL_NAME_ACTIONS = ("-label", "label_names", "labels_str")  # Complete label names after these words.
+
+
+class ActionShell(cmd.Cmd):
+    """ REPL for action chains, see module docstring. """
+
+    intro = ("\nActionista action shell. Enter action chains, e.g. `-due before today -print`.\n"
+             "Commands: `reset` (start from all tasks), `sync [resource types]`, `help [action]`, `quit`.\n")
+
+    def __init__(self, api, actions, run_actions, tasks):
+        """
+        Args:
+            api: TodoistAPI object.
+            actions: Dict of available actions (`action_cli.ACTIONS`).
+            run_actions: Function that invokes an action chain, `run_actions(tasks, action_groups)`.
+            tasks: The task list to start from.
+        """
+        super().__init__()
+        self.api = api
+        self.actions = actions
+        self.run_actions = run_actions
+        self.tasks = tasks
+        self.history_filepath = os.path.join(get_cache_dir(api), SHELL_HISTORY_FILENAME)
+
+    @property
+    def prompt(self):
+        return f"todoist [{len(self.tasks)} tasks]> "
+
+    def preloop(self):
+        try:
+            import readline
+        except ImportError:
+            return  # E.g. on Windows; the shell works, just without completion and history.
+        # Complete "-due" and "project=Work" as whole words:
+        readline.set_completer_delims(" \t\n\"'=")
+        try:
+            readline.read_history_file(self.history_filepath)
+        except (IOError, OSError):
+            pass
+
+    def postloop(self):
+        try:
+            import readline
+        except ImportError:
+            return
+        readline.set_history_length(SHELL_HISTORY_LENGTH)
+        try:
+            readline.write_history_file(self.history_filepath)
+        except (IOError, OSError) as exc:
+            print(f"\nWARNING: Could not save shell history: {exc!r}", file=sys.stderr)
+
+    def emptyline(self):
+        pass  # Do not repeat the last chain (cmd.Cmd default), which could e.g. reschedule tasks twice.
+
+    def default(self, line):
+        """ Run an action chain, e.g. `-due before today -print`, continuing from the current task list. """
+        try:
+            (base_args, base_kwargs), action_groups = parse_argv(shlex.split(line))
+        except ValueError as exc:
+            print(f"ERROR: {exc}")
+            return
+        if base_args or base_kwargs:
+            print(f"ERROR: Unknown command {line.split()[0]!r}. Actions must start with '-', e.g. `-print`.")
+            return
+        unrecognized = [agroup[0] for agroup in action_groups if agroup[0] not in self.actions]
+        if unrecognized:
+            print("ERROR, the following actions were not recognized:", unrecognized)
+            return
+        try:
+            self.tasks = self.run_actions(self.tasks, action_groups)
+        except KeyboardInterrupt:
+            print("\nInterrupted.")
+        except Exception as exc:
+            # Keep the shell (and the warm state) alive; the task list is left as it was before the chain.
+            print(f"ERROR: {exc!r}")
+
+    def do_reset(self, arg):
+        """ Start the next chain from all tasks (undoing the filters applied so far). """
+        self.tasks = self.api.state['items']
+
+    def do_sync(self, arg):
+        """ Fetch updates from the server (only the resource types needed), e.g. `sync`, or `sync all`. """
+        self.default(f"-sync {arg}")
+
+    def do_help(self, arg):
+        """ Print help, or help for a particular action, e.g. `help due`. """
+        if arg:
+            self.actions['help']([], arg.lstrip('-'))
+        else:
+            print(self.intro)
+            print("Available actions:", ", ".join(f"-{action}" for action in sorted(self.actions)))
+
+    def do_quit(self, arg):
+        """ Exit the shell. Note: Changes that have not been committed (with `-commit`) are not sent to the server. """
+        if self.api.queue:
+            print(f"NOTICE: {len(self.api.queue)} commands in the queue have not been committed.")
+        return True
+
+    do_exit = do_quit
+
+    def do_EOF(self, arg):
+        print()
+        return self.do_quit(arg)
+
+    def get_field_names(self):
+        field_names = set()
+        for task in self.api.state['items'][:N_TASKS_FOR_FIELD_NAMES]:
+            field_names.update(getattr(task, '_custom_data', None) or task.data)
+        return sorted(field_names)
+
+    def get_object_names(self, resource_type):
+        return sorted(obj['name'] for obj in self.api.state[resource_type] if not obj.data.get('is_deleted'))
+
+    def completenames(self, text, *ignored):
+        if text.startswith("-"):
+            return [f"-{action}" for action in sorted(self.actions) if f"-{action}".startswith(text)]
+        return super().completenames(text, *ignored)
+
+    def completedefault(self, text, line, begidx, endidx):
+        """ Complete action names, project and label names (after e.g. `-project`), and task field names. """
+        if text.startswith("-"):
+            return self.completenames(text)
+        # E.g. "-project Wo", "-project not Wo", "-filter project_name eq Wo", or "-add-task Foo project=Wo":
+        last_words = line[:begidx].split()[-2:]
+        if any(word in PROJECT_NAME_ACTIONS or word.endswith("project=") for word in last_words):
+            candidates = self.get_object_names('projects')
+        elif any(word in LABEL_NAME_ACTIONS or word.endswith("labels=") for word in last_words):
+            candidates = self.get_object_names('labels')
+        else:
+            candidates = self.get_field_names()
+        text = text.casefold()
+        return [candidate for candidate in candidates if candidate.casefold().startswith(text)]
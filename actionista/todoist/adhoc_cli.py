@@ -367,6 +367,8 @@ from todoist.models import Project
 
 from actionista.todoist.tasks_utils import inject_tasks_date_fields, parse_tasks_content, inject_tasks_project_fields
 from actionista.todoist.utils import get_todoist_api
+from actionista.todoist.history import iter_completed_pages, COMPLETED_PAGE_SIZE
+from actionista.todoist.history import update_activity_log, load_activity_events
 
 
 def todoist_query(query, token=None):
@@ -597,7 +599,7 @@ def get_overdue_items(token=None, query="overdue", incl_time=False):
 def completed_get_all(
         token=None, verbose=1,
         project_id=None, since=None, until=None, limit=None, offset=None, annotate_notes=None,
-
+        all_pages=False,
 ):
     """ Get completed items, using the 'completed/get_all' endpoint (via CompletedManager).
 
@@ -616,6 +618,9 @@ def completed_get_all(
     * limit, offset: Maximum number of events to return, and paging offset.
     * annotate_notes: Return notes together with the completed items (a true or false value).
 
+    If `all_pages` is True, all pages are fetched (concurrently), using `history.iter_completed_pages()`.
+    See also `history.update_completed_archive()`, which keeps a local archive of completed items.
+
     Note that while the regular Sync API uses ridiculous time format, the 'completed' API takes sane
     ISO-8601 formatted datetime strings for `since` and `until` params.
 
@@ -644,6 +649,14 @@ def completed_get_all(
     kwargs = {k: v for k, v in kwargs.items() if v is not None}
     if verbose:
         print("\nRetrieving completed tasks from the Todoist `completed/get_all` endpoint...")
+    if all_pages:
+        kwargs.pop('offset', None)
+        items, projects = [], {}
+        for page_items, page_projects in iter_completed_pages(
+                api, page_size=kwargs.pop('limit', COMPLETED_PAGE_SIZE), verbose=verbose, **kwargs):
+            items.extend(page_items)
+            projects.update(page_projects)
+        return items, projects
     res = api.completed.get_all(**kwargs)
     # from pprint import pprint; pprint(res)
     return res['items'], res['projects']
@@ -693,24 +706,23 @@ def activity(
 
 
 def get_todays_completed_events(token=None, sync=True, verbose=1):
-    """ Get all today's completed events using ActivityManager (against the 'activity/get' endpoint).
-    See `activity()` for info.
+    """ Get all today's completed events from the local activity log.
     Since only tasks can be completed, this is basically just another way to get completed tasks.
+    The local activity log is first updated with new events from the 'activity/get' endpoint (unless `sync=False`),
+    see `history.update_activity_log()`. If the log is empty, only events since the start of today are fetched.
     Better alternative: Use `get_todays_completed_items()`, which uses the CompletedManager.
+
+    Returns:
+        List of compact event dicts (as stored in the log, see `history.compact_event()`), oldest first.
     """
     api = get_todoist_api(token)
+    today = datetime.date.today().strftime("%Y-%m-%d")
     if sync:
         if verbose:
-            print("Syncing with the server...")
-        api.sync()
-    kwargs = dict(
-        since="{:%Y-%m-%dT06:00}".format(datetime.date.today()),
-        object_type='item',
-        event_type='completed',
-        limit=40,
-    )
-    events = api.activity.get(**kwargs)
-    return events
+            print("Fetching new events from the activity log...")
+        # `since` is only used for the first ingestion (later ingestions continue from the log's cursor):
+        update_activity_log(api, since=today, verbose=verbose - 1)
+    return load_activity_events(api, since=today, object_type='item', event_type='completed')
 
 
 def get_todays_completed_items(token=None, verbose=1):
@@ -0,0 +1,264 @@
+# Copyright 2019, Rasmus Sorensen <rasmusscholer@gmail.com>
+"""
+
+Analytics over the history of completed tasks (see `history.py`), e.g. for weekly reviews.
+
+Completed items are loaded into columns (`CompletionColumns`), with one array per field
+(the local completion day, and integer codes for the project and the task), in a single pass over the archive.
+The reports are then computed from the columns, each with a single pass: If NumPy is installed,
+by combining the columns into integer keys and counting with `numpy.bincount()` / `numpy.unique()`,
+otherwise with a dict-based hash aggregation.
+
+Reports:
+    projects:   Number of completed tasks per project per day, for the last `days` days.
+    habits:     Current and longest streaks (consecutive days) for tasks labelled @habit.
+    rolling:    Completed tasks per day, with a rolling average over `window` days.
+
+Usage, via the `-stats` action:
+
+    $ todoist-action-cli -stats
+    $ todoist-action-cli -stats habits
+    $ todoist-action-cli -stats rolling since="1 year ago" window=28 days=14
+
+Install NumPy (`pip install actionista-todoist[analytics]`) for faster aggregation.
+
+"""
+import datetime
+
+from dateutil import tz
+
+from actionista.todoist.history import parse_datetime_utc
+
+DEFAULT_STATS_SINCE = "1 year ago"
+DEFAULT_REPORT_DAYS = 7
+DEFAULT_ROLLING_WINDOW = 7
+DEFAULT_HABIT_LABEL = "habit"
+STATS_REPORTS = ("projects", "habits", "rolling")
+
+
+def get_numpy(use_numpy=None):
+    """ Return the numpy module, or None if it is not installed (or `use_numpy` is false). """
+    if use_numpy is None or use_numpy:
+        try:
+            import numpy
+        except ImportError:
+            if use_numpy:
+                raise
+            return None
+        return numpy
+    return None
+
+
+def get_completion_day(completed_date, local_tz=None):
+    """ Return the local date (as ordinal) on which a task was completed, from the item's `completed_date`. """
+    try:
+        # Fast path for the ISO format used by the v8 API, e.g. "2019-09-17T10:21:09Z":
+        dt = datetime.datetime.fromisoformat(completed_date.replace("Z", "+00:00"))
+    except ValueError:
+        dt = parse_datetime_utc(completed_date)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=datetime.timezone.utc)
+    return dt.astimezone(local_tz or tz.tzlocal()).date().toordinal()
+
+
+class CompletionColumns:
+    """ Completed items, stored column-wise.
+
+    Attributes:
+        day:            Local completion date (date ordinal) for each completed item.
+        project:        Project code for each item; the project name is `project_names[code]`.
+        task:           Task code for each item (completions of a recurring task share the same code);
+                        the task content is `task_contents[code]`.
+        habit:          Whether each item is a habit task.
+        np:             The numpy module, if the columns are numpy arrays (otherwise the columns are lists).
+    """
+
+    def __init__(self, items, projects=None, habit_task_ids=(), habit_label=DEFAULT_HABIT_LABEL, use_numpy=None):
+        """ Create columns from completed items (dicts), e.g. from `history.load_completed_archive()`.
+
+        Args:
+            items: Completed items.
+            projects: Dict of projects keyed by project id (used for the project names).
+            habit_task_ids: Ids of tasks that are habits (e.g. tasks with the habit label).
+            habit_label: Items whose content contains "@<habit_label>" are also considered habits.
+            use_numpy: Whether to use numpy. Default: Use numpy if it is installed.
+        """
+        self.np = get_numpy(use_numpy)
+        projects = projects or {}
+        habit_task_ids = set(habit_task_ids)
+        habit_tag = "@" + habit_label
+        local_tz = tz.tzlocal()
+        project_codes, task_codes = {}, {}
+        self.project_names, self.task_contents = [], []
+        day, project, task, habit = [], [], [], []
+        for item in items:
+            day.append(get_completion_day(item['completed_date'], local_tz))
+            pid = str(item.get('project_id'))
+            if pid not in project_codes:
+                project_codes[pid] = len(self.project_names)
+                self.project_names.append(projects.get(pid, {}).get('name', pid))
+            project.append(project_codes[pid])
+            task_id = item.get('task_id', item.get('id'))
+            if task_id not in task_codes:
+                task_codes[task_id] = len(self.task_contents)
+                self.task_contents.append(item.get('content', ""))
+            task.append(task_codes[task_id])
+            habit.append(task_id in habit_task_ids or habit_tag in item.get('content', ""))
+        if self.np is not None:
+            np = self.np
+            day, project, task = (np.array(column, dtype=np.int64) for column in (day, project, task))
+            habit = np.array(habit, dtype=bool)
+        self.day, self.project, self.task, self.habit = day, project, task, habit
+
+    def __len__(self):
+        return len(self.day)
+
+
+def count_by_project_and_day(columns, first_day, last_day):
+    """ Count completed items per project per day, for days `first_day` to `last_day` (date ordinals, inclusive).
+
+    Returns:
+        Dict mapping project name to a list of counts (one per day).
+    """
+    n_days = last_day - first_day + 1
+    n_projects = len(columns.project_names)
+    np = columns.np
+    if np is not None:
+        selected = (columns.day >= first_day) & (columns.day <= last_day)
+        keys = columns.project[selected] * n_days + (columns.day[selected] - first_day)
+        counts = np.bincount(keys, minlength=n_projects * n_days).reshape(n_projects, n_days).tolist()
+    else:
+        counts = [[0] * n_days for _ in range(n_projects)]
+        for day, project in zip(columns.day, columns.project):
+            if first_day <= day <= last_day:
+                counts[project][day - first_day] += 1
+    return {name: project_counts for name, project_counts in zip(columns.project_names, counts)
+            if any(project_counts)}
+
+
+def count_by_day(columns, first_day, last_day):
+    """ Count completed items per day, for days `first_day` to `last_day` (inclusive). Returns a list of counts. """
+    n_days = last_day - first_day + 1
+    np = columns.np
+    if np is not None:
+        selected = (columns.day >= first_day) & (columns.day <= last_day)
+        return np.bincount(columns.day[selected] - first_day, minlength=n_days).tolist()
+    counts = [0] * n_days
+    for day in columns.day:
+        if first_day <= day <= last_day:
+            counts[day - first_day] += 1
+    return counts
+
+
+def rolling_average(counts, window=DEFAULT_ROLLING_WINDOW):
+    """ Return the trailing rolling average of `counts` (averaging over fewer values for the first days). """
+    averages, total = [], 0
+    for i, count in enumerate(counts):
+        # Running sum, so the cost does not depend on the window size:
+        total += count
+        if i >= window:
+            total -= counts[i - window]
+        averages.append(total / min(i + 1, window))
+    return averages
+
+
+def get_habit_streaks(columns, today=None):
+    """ Calculate the current and longest streak (consecutive days with completions) for each habit task.
+
+    A streak is "current" if the task was completed today or yesterday.
+
+    Returns:
+        List of (content, current_streak, longest_streak, n_days_completed) tuples, longest current streak first.
+    """
+    today = today or datetime.date.today().toordinal()
+    np = columns.np
+    # Runs of consecutive days, as (task, last_day, length) tuples:
+    if np is not None:
+        if not columns.habit.any():
+            return []
+        min_day = int(columns.day.min())
+        span = int(columns.day.max()) - min_day + 1
+        # Unique (task, day) keys, sorted by task and then by day:
+        keys = np.unique(columns.task[columns.habit] * span + (columns.day[columns.habit] - min_day))
+        task, day = keys // span, keys % span + min_day
+        new_run = np.ones(len(keys), dtype=bool)
+        new_run[1:] = (task[1:] != task[:-1]) | (day[1:] != day[:-1] + 1)
+        starts = np.flatnonzero(new_run)
+        ends = np.append(starts[1:], len(keys))
+        runs = zip(task[starts].tolist(), day[ends - 1].tolist(), (ends - starts).tolist())
+    else:
+        runs = []
+        for task, day in sorted({(task, day) for task, day, habit in zip(columns.task, columns.day, columns.habit)
+                                 if habit}):
+            if runs and runs[-1][0] == task and runs[-1][1] == day - 1:
+                runs[-1] = (task, day, runs[-1][2] + 1)
+            else:
+                runs.append((task, day, 1))
+    streaks = {}  # task -> [current, longest, n_days]
+    for task, last_day, length in runs:
+        streak = streaks.setdefault(task, [0, 0, 0])
+        # Runs are sorted by day, so the last run for each task is the current one:
+        streak[0] = length if last_day >= today - 1 else 0
+        streak[1] = max(streak[1], length)
+        streak[2] += length
+    return sorted(((columns.task_contents[task], *streak) for task, streak in streaks.items()),
+                  key=lambda row: (-row[1], -row[2], row[0]))
+
+
+def print_project_day_table(columns, days=DEFAULT_REPORT_DAYS, today=None):
+    """ Print the number of completed tasks per project for each of the last `days` days. """
+    last_day = today or datetime.date.today().toordinal()
+    first_day = last_day - days + 1
+    counts = count_by_project_and_day(columns, first_day, last_day)
+    dates = [datetime.date.fromordinal(day) for day in range(first_day, last_day + 1)]
+    name_width = max([len("Project")] + [len(name) for name in counts])
+    print("\nCompleted tasks per project per day:")
+    print(f"{'Project':{name_width}} " + " ".join(f"{date:%a %d}" for date in dates) + "  Total")
+    for name, project_counts in sorted(counts.items(), key=lambda kv: -sum(kv[1])):
+        print(f"{name:{name_width}} " + " ".join(f"{count:6}" for count in project_counts)
+              + f"  {sum(project_counts):5}")
+    totals = [sum(day_counts) for day_counts in zip(*counts.values())] or [0] * days
+    print(f"{'Total':{name_width}} " + " ".join(f"{count:6}" for count in totals) + f"  {sum(totals):5}")
+
+
+def print_habit_streaks(columns, today=None):
+    """ Print current and longest streaks for habit tasks. """
+    streaks = get_habit_streaks(columns, today=today)
+    print("\nHabit streaks (days):")
+    if not streaks:
+        print(" - No completed habit tasks.")
+        return
+    content_width = max(len("Habit"), max(len(row[0]) for row in streaks))
+    print(f"{'Habit':{content_width}}  Current  Longest  Days done")
+    for content, current, longest, n_days in streaks:
+        print(f"{content:{content_width}}  {current:7}  {longest:7}  {n_days:9}")
+
+
+def print_rolling_average(columns, window=DEFAULT_ROLLING_WINDOW, days=DEFAULT_REPORT_DAYS, today=None):
+    """ Print completed tasks per day, with the rolling average over `window` days, for the last `days` days. """
+    if not len(columns):
+        print("\nNo completed tasks.")
+        return
+    last_day = today or datetime.date.today().toordinal()
+    first_day = min(columns.day)
+    counts = count_by_day(columns, first_day, last_day)
+    averages = rolling_average(counts, window=window)
+    print(f"\nCompleted tasks per day (rolling average over {window} days; "
+          f"{sum(counts)} tasks since {datetime.date.fromordinal(first_day)}, "
+          f"{sum(counts) / len(counts):.1f} per day):")
+    for day, count, average in list(zip(range(first_day, last_day + 1), counts, averages))[-days:]:
+        print(f"{datetime.date.fromordinal(day):%a %Y-%m-%d}  {count:4}  {average:6.1f}")
+
+
+def print_completion_stats(columns, reports=STATS_REPORTS, *, days=DEFAULT_REPORT_DAYS,
+                           window=DEFAULT_ROLLING_WINDOW, today=None):
+    """ Print one or more reports (see module docstring) for the completed items in `columns`. """
+    for report in reports:
+        if report == "projects":
+            print_project_day_table(columns, days=days, today=today)
+        elif report == "habits":
+            print_habit_streaks(columns, today=today)
+        elif report == "rolling":
+            print_rolling_average(columns, window=window, days=days, today=today)
+        else:
+            raise ValueError(f"Unknown stats report {report!r}; must be one of {', '.join(STATS_REPORTS)}.")
@@ -8,78 +8,55 @@ from pprint import pformat
 
 from actionista.todoist.tasks_utils import get_proper_priority_int
 from actionista.todoist.utils import get_todoist_api
+from actionista.todoist.sync_utils import commit_chunked, defer_commit, sync_resource_types
+from actionista.todoist.name_resolver import NameResolver
 
 
-def add_task(
-        content, due=None, project=None, labels=None, priority=None, note=None,
-        auto_reminder=None, auto_parse_labels=None, *,
-        sync=True, commit=True, show_queue=False, verbose=0,
-        api=None,
+def sync_for_add_tasks(api, sync=True, resolver=None, verbose=0):
+    """ Sync the projects, labels, and sections needed to resolve names when adding tasks.
+
+    Use `sync="all"` for a full sync. If `resolver` is given, its indexes are invalidated
+    for the resource types that changed.
+    """
+    resource_types = ["all"] if sync == "all" else ["projects", "labels", "sections"]
+    response = sync_resource_types(api, resource_types, verbose=verbose)
+    if resolver is not None:
+        resolver.invalidate(response)
+    return response
+
+
+def queue_task(
+        api, resolver, content, due=None, project=None, labels=None, priority=None, note=None,
+        auto_reminder=None, auto_parse_labels=None, section=None, *,
+        verbose=0,
 ):
-    """ Add a single task to Todoist.
+    """ Add a task (and optionally a note) to the api's local state and command queue, without syncing or committing.
 
     Args:
-        content: The task content (task name).
-        due: Due date (str)
-        project: Project name (str)
-        labels: List of task labels (names)
-        priority: Task priority, either number [1-4] or str ["p4", "p3", 'p2", "p1"].
-        note: Add a single note to the task.
-        auto_reminder: Automatically add a default reminder to the task, if task is due at a specific time of day.
-        auto_parse_labels: Automatically extract "@label" strings from the task content.
-        sync: Start by synching the Sync API cache (recommended, unless testing).
-        commit: End by committing the added task to the Todoist server (recommended, unless testing).
-        show_queue: Show API queue before submitting the changes to the server.
+        api: TodoistAPI object.
+        resolver: NameResolver, used to find project, label, and section ids from their names.
+        content, due, project, labels, priority, note, auto_reminder, auto_parse_labels: See `add_task()`.
+        section: Section name (within `project`, if given) or section id.
         verbose: Be extra verbose when printing information during function run.
-        api: Use this TodoistAPI object for the operation.
 
     Returns:
         The newly added task (todoist.models.Item object).
-
     """
-    if api is None:
-        api = get_todoist_api()
-    if sync:
-        api.sync()
-    if verbose >= 0:
-        print(f"\nAdding new task:", file=sys.stderr)
-        print(f" - content:", content, file=sys.stderr)
-        print(f" - project:", project, file=sys.stderr)
-        print(f" - labels:", list(labels) if labels else None, file=sys.stderr)
-        print(f" - priority:", priority, file=sys.stderr)
-        print(f" - due:", due, file=sys.stderr)
-        print(f" - note:", note, file=sys.stderr)
-
     params = {}
 
     if due:
         params['due'] = {"string": due}
 
+    project_id = None
     if project:
-        if isinstance(project, str):
-            # We need to find project_id from project_name:
-            project_name = project
-            try:
-                project_id = next(iter(p['id'] for p in api.projects.all() if p['name'].lower() == project_name.lower()))
-            except StopIteration:
-                msg = f'Project name "{project_name}" was not recognized. Please create project first. '
-                print(f"\n\nERROR: {msg}\n")
-                print("(You can use `todoist-cli print-projects` to see a list of available projects.)\n")
-                raise ValueError(msg) from None  # raise from None to not show the StopIteration exception.
-        else:
-            # Project should be a project_id:
-            assert isinstance(project, int)
-            project_id = project
-        params['project_id'] = project_id
+        # Project is either a project name or a project_id:
+        project_id = params['project_id'] = resolver.get_project_id(project)
+
+    if section:
+        params['section_id'] = resolver.get_section_id(section, project_id=project_id)
 
     if labels:
-        if isinstance(labels, str):
-            labels = [label.strip() for label in labels.split(",")]
-        if any(isinstance(label, str) for label in labels):
-            # Assume label-name: We need to find label_id from label_name (lower-cased):
-            labels_by_name = {label['name'].lower(): label for label in api.labels.all()}
-            labels = [label if isinstance(label, int) else labels_by_name[label.lower()]['id'] for label in labels]
-        params['labels'] = labels
+        params['labels'] = resolver.get_label_ids(labels)
 
     if priority is not None:
         params['priority'] = get_proper_priority_int(priority)
@@ -105,6 +82,89 @@ def add_task(
             print(f"\nNew note added:", file=sys.stderr)
             print(pformat(new_note.data), file=sys.stderr)
 
+    return new_task
+
+
+def commit_added_tasks(api, commit=True, chunk_size=None, verbose=0):
+    """ Commit (or defer, if `commit="later"`) the queued commands after adding tasks. """
+    if commit == 'later':
+        defer_commit(api, verbose=verbose)
+    elif commit:
+        if verbose >= 0:
+            print(f"\nSubmitting {len(api.queue)} commands to server...", file=sys.stderr)
+        commit_chunked(api, chunk_size, verbose=verbose)
+        if verbose >= 0:
+            print(f" - OK!", file=sys.stderr)
+    else:
+        if verbose >= 0:
+            print(f"\nNew tasks created - but not committed to server! (because `commit=False`)", file=sys.stderr)
+
+
+def add_task(
+        content, due=None, project=None, labels=None, priority=None, note=None,
+        auto_reminder=None, auto_parse_labels=None, section=None, *,
+        sync=None, commit=True, show_queue=False, verbose=0,
+        api=None, resolver=None,
+):
+    """ Add a single task to Todoist.
+
+    Args:
+        content: The task content (task name).
+        due: Due date (str)
+        project: Project name (str)
+        labels: List of task labels (names)
+        priority: Task priority, either number [1-4] or str ["p4", "p3", 'p2", "p1"].
+        note: Add a single note to the task.
+        auto_reminder: Automatically add a default reminder to the task, if task is due at a specific time of day.
+        auto_parse_labels: Automatically extract "@label" strings from the task content.
+        section: Section name (within `project`, if given).
+        sync: Start by synching the Sync API cache (recommended, unless testing).
+            Only projects, labels, and sections are synced, since these are needed to resolve names.
+            Use `sync="all"` for a full sync.
+            Default: Sync, unless `commit="later"`, in which case the cached projects and labels are used.
+        commit: End by committing the added task to the Todoist server (recommended, unless testing).
+            Use `commit="later"` to add the task to the local outbox, to be committed later
+            together with other deferred commands (see `sync_utils.flush_outbox()`).
+        show_queue: Show API queue before submitting the changes to the server.
+        verbose: Be extra verbose when printing information during function run.
+        api: Use this TodoistAPI object for the operation.
+        resolver: Use this NameResolver to resolve project, label, and section names.
+            Re-use the resolver when adding several tasks, or use `add_tasks()`.
+
+    Returns:
+        The newly added task (todoist.models.Item object).
+
+    """
+    if api is None:
+        api = get_todoist_api()
+    if resolver is None:
+        resolver = NameResolver(api)
+    if sync is None:
+        sync = commit != 'later'
+    if sync:
+        # We only need projects, labels, and sections to look up ids:
+        sync_for_add_tasks(api, sync, resolver=resolver, verbose=verbose)
+    if verbose >= 0:
+        print(f"\nAdding new task:", file=sys.stderr)
+        print(f" - content:", content, file=sys.stderr)
+        print(f" - project:", project, file=sys.stderr)
+        if section:
+            print(f" - section:", section, file=sys.stderr)
+        print(f" - labels:", list(labels) if labels else None, file=sys.stderr)
+        print(f" - priority:", priority, file=sys.stderr)
+        print(f" - due:", due, file=sys.stderr)
+        print(f" - note:", note, file=sys.stderr)
+
+    try:
+        new_task = queue_task(
+            api, resolver, content, due=due, project=project, labels=labels, priority=priority, note=note,
+            auto_reminder=auto_reminder, auto_parse_labels=auto_parse_labels, section=section, verbose=verbose)
+    except ValueError as exc:
+        print(f"\n\nERROR: {exc}\n")
+        if project and "Project name" in str(exc):
+            print("(You can use `todoist-cli print-projects` to see a list of available projects.)\n")
+        raise
+
     if show_queue:
         def get_obj_data(obj):
             return obj.data
@@ -113,14 +173,41 @@ def add_task(
         # This is actually the best, since it can use `default=get_obj_data` to represent model objects.
         print(json.dumps(api.queue, indent=2, default=get_obj_data))
 
-    if commit:
-        if verbose >= 0:
-            print(f"\nSubmitting new task to server...", file=sys.stderr)
-        api.commit()
-        if verbose >= 0:
-            print(f" - OK!", file=sys.stderr)
-    else:
-        if verbose >= 0:
-            print(f"\nNew task created - but not committed to server! (because `commit=False`)", file=sys.stderr)
+    commit_added_tasks(api, commit, verbose=verbose)
 
     return new_task
+
+
+def add_tasks(
+        tasks, *,
+        sync=None, commit=True, chunk_size=None, verbose=0,
+        api=None, resolver=None,
+):
+    """ Add many tasks to Todoist, with a single sync and a single (chunked) commit.
+
+    Args:
+        tasks: Iterable of dicts with `add_task()` arguments, e.g. `{"content": "Buy milk", "project": "Home"}`.
+        sync: Sync projects, labels, and sections once, before adding the tasks (see `add_task()`).
+        commit: Commit all the added tasks at the end, using `sync_utils.commit_chunked()`,
+            or `commit="later"` to add them to the local outbox.
+        chunk_size: The number of commands per request when committing.
+        verbose: Be extra verbose when printing information during function run.
+        api: Use this TodoistAPI object for the operation.
+        resolver: Use this NameResolver to resolve project, label, and section names.
+
+    Returns:
+        List of the newly added tasks (todoist.models.Item objects).
+    """
+    if api is None:
+        api = get_todoist_api()
+    if resolver is None:
+        resolver = NameResolver(api)
+    if sync is None:
+        sync = commit != 'later'
+    if sync:
+        sync_for_add_tasks(api, sync, resolver=resolver, verbose=verbose)
+    new_tasks = [queue_task(api, resolver, verbose=verbose - 1, **task) for task in tasks]
+    if verbose >= 0:
+        print(f"\nAdded {len(new_tasks)} new tasks.", file=sys.stderr)
+    commit_added_tasks(api, commit, chunk_size=chunk_size, verbose=verbose)
+    return new_tasks
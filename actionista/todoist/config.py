@@ -3,12 +3,23 @@
 
 Configuration module for Actionista for Todoist package and CLIs/apps.
 
+The config file is parsed at most once per process: `get_config()` caches the parsed config,
+keyed on the file's modification time and size, so the file is only re-read after it has been changed
+(e.g. by a long-running process). Each call returns a copy, which the caller is free to modify.
 
-
+Compiled config cache:
+Parsing YAML requires importing `yaml`, which is a noticeable part of the CLI startup time.
+With `todoist-cli compile-config`, the parsed config is additionally stored as JSON next to the config file,
+and subsequent processes read the JSON instead, as long as the config file has not been changed since
+(if it has, the YAML file is parsed and the compiled cache is updated).
+Use `todoist-cli compile-config --remove` to stop using the compiled cache.
 
 """
 import os
-import yaml
+import sys
+import copy
+import json
+# yaml is imported in the functions that need it, to keep CLI startup fast.
 
 
 # You can use the "precision" notation to truncate long strings during
@@ -51,6 +62,9 @@ FILEPATHS = {
     'config': CONFIG_PATHS,
     'token': TOKEN_PATHS
 }
+COMPILED_CONFIG_EXT = ".compiled.json"
+
+_config_cache = {}  # {config_fn: ((mtime_ns, size), config)}
 
 
 def get_config_file(name='config'):
@@ -62,23 +76,103 @@ def get_config_file(name='config'):
         return None
 
 
-def get_config(config_fn=None):
+def get_compiled_config_filepath(config_fn):
+    return os.path.splitext(config_fn)[0] + COMPILED_CONFIG_EXT
+
+
+def get_config_file_key(config_fn):
+    """ Return (mtime_ns, size) for the config file, used to detect changes to the file. """
+    stat = os.stat(config_fn)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def read_compiled_config(config_fn, file_key):
+    """ Return the config from the compiled cache, or None if there is no (up-to-date) compiled cache. """
+    try:
+        with open(get_compiled_config_filepath(config_fn)) as fp:
+            compiled = json.load(fp)
+    except (IOError, ValueError):
+        return None
+    if compiled.get('config_fn') != config_fn or tuple(compiled.get('file_key', ())) != file_key:
+        return None
+    return compiled['config']
+
+
+def write_compiled_config(config_fn, file_key, config):
+    """ Store the parsed config as JSON next to the config file (readable only by the user, like the token). """
+    compiled_fn = get_compiled_config_filepath(config_fn)
+    tmp_fn = compiled_fn + ".tmp"
+    fd = os.open(tmp_fn, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w') as fp:
+        json.dump({'config_fn': config_fn, 'file_key': file_key, 'config': config}, fp)
+    os.replace(tmp_fn, compiled_fn)
+    return compiled_fn
+
+
+def load_config_file(config_fn):
+    """ Parse the config file (uncached). """
+    import yaml
+    with open(config_fn) as fp:
+        return yaml.safe_load(fp)
+
+
+def get_config(config_fn=None, *, reload=False):
+    """ Load the user config, parsing the config file only if it has changed since it was last loaded.
+
+    Args:
+        config_fn: Path to the config file. Default: The first existing file in `CONFIG_PATHS`.
+        reload: Parse the config file, even if it has not changed.
+
+    Returns:
+        Config dict (a copy of the cached config), or None if no config file was found.
+    """
     if config_fn is None:
         config_fn = get_config_file()
     if config_fn is None:
         return
-    with open(config_fn) as fp:
-        config = yaml.safe_load(fp)
-    return config
+    file_key = get_config_file_key(config_fn)
+    cached = _config_cache.get(config_fn)
+    if reload or cached is None or cached[0] != file_key:
+        compiled_exists = os.path.exists(get_compiled_config_filepath(config_fn))
+        config = read_compiled_config(config_fn, file_key) if compiled_exists and not reload else None
+        if config is None:
+            config = load_config_file(config_fn)
+            if compiled_exists:
+                # The compiled cache is enabled, but stale; update it:
+                try:
+                    write_compiled_config(config_fn, file_key, config)
+                except (IOError, TypeError, ValueError) as exc:
+                    print(f"\nWARNING: Could not update compiled config cache: {exc!r}", file=sys.stderr)
+        cached = _config_cache[config_fn] = (file_key, config)
+    return copy.deepcopy(cached[1])
+
+
+def compile_config(config_fn=None, remove=False):
+    """ Create (or remove) the compiled config cache, which is used by `get_config()` if it exists.
+
+    Returns:
+        The path of the compiled config cache, or None if no config file was found.
+    """
+    if config_fn is None:
+        config_fn = get_config_file()
+    if config_fn is None:
+        return
+    compiled_fn = get_compiled_config_filepath(config_fn)
+    if remove:
+        if os.path.exists(compiled_fn):
+            os.remove(compiled_fn)
+        return compiled_fn
+    file_key = get_config_file_key(config_fn)
+    config = load_config_file(config_fn)
+    _config_cache[config_fn] = (file_key, config)
+    return write_compiled_config(config_fn, file_key, config)
 
 
 def get_config_and_filepath():
     config_fn = get_config_file()
     if config_fn is None:
         return None, None
-    with open(config_fn) as fp:
-        config = yaml.safe_load(fp)
-    return config, config_fn
+    return get_config(config_fn), config_fn
 
 
 def get_token(raise_if_missing=True, config=None):
@@ -87,6 +181,10 @@ def get_token(raise_if_missing=True, config=None):
     Will search standard token file locations (`TOKEN_PATHS`), and if no token files are found,
     will load config and return `config['token']`.
 
+    Args:
+        raise_if_missing: Raise ValueError if no token was found.
+        config: Config dict. Default: Load config from file (see `get_config()`).
+
     Returns:
         str token, or None if no token was found.
 
@@ -97,7 +195,8 @@ def get_token(raise_if_missing=True, config=None):
 
     """
     token = None
-    config = get_config()
+    if config is None:
+        config = get_config()
     if config is not None:
         token = config.get('token')
     if token:
@@ -132,8 +231,10 @@ def store_token(new_token=None):
                 return current_token
         print("\n - Updating config with new token:", new_token)
         config['token'] = new_token
+        import yaml
         with open(config_fn, 'w') as fp:
             yaml.safe_dump(config, fp)
+        _config_cache.pop(config_fn, None)
         print(" - OK, config saved with new login token.")
         return new_token
     token_file = get_config_file(name='token') or TOKEN_PATHS[0]
@@ -173,7 +274,9 @@ def store_default_user_config(overwrite_existing=False):
             print(" - Skipping.")
             return
     print("\nWriting default config to file:", config_fn)
+    import yaml
     with open(config_fn, 'w') as fp:
         yaml.safe_dump(DEFAULT_CONFIG, fp)
+    _config_cache.pop(config_fn, None)
     print(" - OK, default config saved.")
     return DEFAULT_CONFIG
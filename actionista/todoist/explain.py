@@ -0,0 +1,306 @@
+# Copyright 2019, Rasmus Sorensen <rasmusscholer@gmail.com>
+"""
+
+Query plans for action chains (`todoist-action-cli -explain ...`).
+
+`-explain` prints how the rest of the action chain would be executed, without executing it:
+
+    $ todoist-action-cli -explain -due before today -p1 -reschedule today -commit
+
+For each action, the plan shows how it is executed, the number of tasks going in and (estimated) coming out,
+the selectivity of filters, and the number of Sync API commands and HTTP requests the action would produce.
+A summary lists the total number of commands and requests, whether the chain syncs (and which resource types),
+and the derived task fields computed when the cache is loaded.
+
+Execution model: Actions run in the order given, each as a separate pass over the task list.
+Filters are linear scans (there are no task indexes, and filters are not fused or reordered),
+and the derived task fields (dates, project and label names) are computed eagerly for all tasks.
+
+Selectivity is estimated by evaluating the filters on a random sample of the tasks (all tasks,
+if there are no more than `sample_size`), with their output suppressed. Actions that change tasks
+or talk to the server are never invoked; their commands and requests are counted from the estimated
+number of tasks, the command queue, and the outbox.
+
+"""
+import io
+import os
+import math
+import time
+import random
+import contextlib
+
+from actionista.todoist.action_commands import PASS_THROUGH_ACTIONS, READ_ONLY_ACTIONS, TASK_ACTION_COMMANDS
+from actionista.todoist.sync_utils import (
+    DEFAULT_COMMIT_CHUNK_SIZE, group_resource_types, load_outbox, load_pending_commands)
+
+DEFAULT_EXPLAIN_SAMPLE_SIZE = 1000
+EXPLAIN_TABLE_COLUMNS = ("#", "Action", "Tasks in", "Tasks out", "Selectivity", "Commands", "Requests", "Execution")
+FETCH_ACTIONS = ('completed', 'fetch-completed', 'activity')  # Replace the task list with (paged) server data.
+NESTED_ACTIONS = ('script', 'shell', 'watch', 'explain')  # Run other action chains; not planned.
+DERIVED_FIELD_GROUPS = {
+    'inject_task_date_fields': "dates (due_date_safe_dt, due_date_iso, ...)",
+    'inject_task_project_fields': "project (project_name)",
+    'inject_task_labels_fields': "labels (label_names, labels_str)",
+}
+
+
+def sample_tasks(tasks, sample_size=DEFAULT_EXPLAIN_SAMPLE_SIZE):
+    """ Return a random sample of `tasks` (all tasks, if there are no more than `sample_size`).
+
+    The sample is deterministic, so running `-explain` twice on the same tasks gives the same plan.
+    """
+    sample_size = int(sample_size)
+    if len(tasks) <= sample_size:
+        return list(tasks)
+    return random.Random(0).sample(list(tasks), sample_size)
+
+
+def estimate_filter(action_func, sample, args, kwargs):
+    """ Evaluate a filter action on a sample of tasks, with all output suppressed.
+
+    Returns:
+        (selected sample, error) tuple; the selected sample is None if the filter raised an exception.
+    """
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        try:
+            return action_func(sample, *args, verbose=-1, **kwargs), None
+        except Exception as exc:
+            return None, exc
+
+
+def n_requests_for(n_commands, chunk_size):
+    """ Return the number of requests used by `commit_chunked()` to commit `n_commands` (None if unknown).
+
+    That is one request per chunk, plus the incremental sync after the last chunk (usually a single request).
+    """
+    if n_commands is None:
+        return None
+    return math.ceil(n_commands / chunk_size) + 1 if n_commands else 0
+
+
+def add_counts(a, b):
+    """ Add two (estimated) counts, where None means unknown. """
+    return None if a is None or b is None else a + b
+
+
+def fmt_count(value):
+    return "?" if value is None else f"{value:,}"
+
+
+def explain_chain(tasks, action_groups, actions, *, api, required_resource_types, config=None, base_kwargs=None,
+                  sample_size=DEFAULT_EXPLAIN_SAMPLE_SIZE):
+    """ Make a query plan for an action chain, without executing it.
+
+    Args:
+        tasks: The task list the chain would start from.
+        action_groups: List of (action_name, args, kwargs) tuples, as returned by `parse_argv()`.
+        actions: Dict with the available actions (filters are evaluated on a sample of the tasks).
+        api: TodoistAPI object (for the command queue, the outbox, and the sync tokens).
+        required_resource_types: The resource types synced by `-sync` without arguments.
+        config: Config dict, for e.g. `commit_chunk_size` and `stale_while_revalidate`.
+        base_kwargs: Base keyword arguments, e.g. `inject_task_project_fields=0`.
+        sample_size: The maximum number of tasks to evaluate the filters on.
+
+    Returns:
+        (steps, summary) tuple, where `steps` is a list of dicts (one per action), and `summary` a dict.
+    """
+    config = config or {}
+    base_kwargs = base_kwargs or {}
+    chunk_size = int(config.get('commit_chunk_size') or DEFAULT_COMMIT_CHUNK_SIZE)
+    n_all_tasks = len(api.state['items'])
+    n_tasks = len(tasks)
+    sample = sample_tasks(tasks, sample_size)
+    scale = n_tasks / len(sample) if sample else 0  # Tasks per sampled task.
+    n_queued = len(api.queue)  # Commands in the queue, not yet committed.
+    n_deferred = 0  # Commands added to the outbox by `-commit later`.
+    syncs = []
+    steps = []
+
+    def estimate(sample):
+        # Estimated number of tasks for a (selected) sample, or None if unknown:
+        return None if sample is None else round(len(sample) * scale)
+
+    for idx, (action, args, kwargs) in enumerate(action_groups, 1):
+        step = {"idx": idx, "action": action, "args": list(args), "n_in": estimate(sample), "n_out": None,
+                "selectivity": None, "n_commands": 0, "n_requests": 0, "execution": ""}
+        steps.append(step)
+        if action in PASS_THROUGH_ACTIONS:
+            step["n_out"] = step["n_in"]
+            if action == 'sort':
+                step["execution"] = "sort (in memory)"
+            elif action == 'print':
+                step["execution"] = "print"
+            else:
+                step["execution"] = "option (no tasks processed)"
+        elif action in READ_ONLY_ACTIONS:
+            if sample is None:
+                step["execution"] = "scan (selectivity unknown)"
+                continue
+            selected, error = estimate_filter(actions[action], sample, args, kwargs)
+            if error is not None:
+                step["execution"] = f"scan, ERROR when evaluated: {error!r}"
+                sample = None
+                continue
+            step["selectivity"] = len(selected) / len(sample) if sample else None
+            step["execution"] = f"scan {step['n_in']:,} tasks"
+            sample = selected
+            step["n_out"] = estimate(sample)
+        elif action in TASK_ACTION_COMMANDS:
+            step["n_out"] = step["n_commands"] = step["n_in"]
+            n_queued = add_counts(n_queued, step["n_in"])
+            step["execution"] = f"queue {fmt_count(step['n_in'])} {TASK_ACTION_COMMANDS[action]} commands (1 per task)"
+        elif action == 'add-task':
+            step["n_out"] = step["n_in"]
+            step["n_commands"] = 1
+            n_queued = add_counts(n_queued, 1)
+            commit = str(kwargs.get('commit', 0))
+            if commit == 'later':
+                n_deferred = add_counts(n_deferred, n_queued)
+                n_queued = 0
+                step["execution"] = "queue 1 item_add command, defer the queue to the outbox"
+            elif int(commit):
+                step["n_requests"] = n_requests_for(n_queued, chunk_size)
+                n_queued = 0
+                step["execution"] = "queue 1 item_add command, and commit the queue"
+            else:
+                step["execution"] = "queue 1 item_add command"
+        elif action == 'sync':
+            resource_types = list(args) or required_resource_types
+            groups = group_resource_types(api, resource_types)
+            step["n_requests"] = len(groups)
+            full = any(sync_token == '*' for _, sync_token in groups)
+            step["execution"] = (f"{'full' if full else 'incremental'} sync of {', '.join(resource_types)}, "
+                                 f"re-inject task fields")
+            syncs.append(", ".join(resource_types))
+            sample = sample_tasks(api.state['items'], sample_size)
+            scale = n_all_tasks / len(sample) if sample else 0
+            step["n_out"] = n_all_tasks
+        elif action == 'commit' and args and args[0] == 'later':
+            step["n_out"] = step["n_in"]
+            n_deferred = add_counts(n_deferred, n_queued)
+            step["execution"] = f"defer {fmt_count(n_queued)} commands to the outbox (no requests)"
+            n_queued = 0
+        elif action in ('commit', 'flush', 'resume-commit'):
+            if action == 'flush':
+                n_queued = add_counts(add_counts(n_queued, len(load_outbox(api))), n_deferred)
+                n_deferred = 0
+            elif action == 'resume-commit':
+                # The pending commands that are not already queued are committed together with the queue,
+                # but only if there are any (otherwise nothing is committed):
+                pending = load_pending_commands(api)
+                if not pending:
+                    step["n_out"] = step["n_in"]
+                    step["execution"] = "no pending commit found; nothing is committed"
+                    continue
+                queued_uuids = {cmd['uuid'] for cmd in api.queue}
+                n_queued = add_counts(n_queued, sum(cmd['uuid'] not in queued_uuids for cmd in pending))
+            commit_chunk_size = int(args[0]) if args else chunk_size
+            step["n_requests"] = n_requests_for(n_queued, commit_chunk_size)
+            step["execution"] = (f"commit {fmt_count(n_queued)} commands in {fmt_count(step['n_requests'])} requests "
+                                 f"(chunks of up to {commit_chunk_size}, then one sync), re-inject task fields")
+            n_queued = 0
+            sample = sample_tasks(api.state['items'], sample_size)
+            scale = n_all_tasks / len(sample) if sample else 0
+            step["n_out"] = n_all_tasks
+        elif action in FETCH_ACTIONS:
+            step["n_requests"] = None
+            step["execution"] = "replace the task list with data fetched from the server (paged requests)"
+            sample = None
+        elif action == 'delete-cache':
+            step["n_out"] = step["n_in"]
+            step["execution"] = "delete the local cache files"
+        elif action in NESTED_ACTIONS:
+            step["execution"] = "runs other action chains, which are not planned"
+            sample = None
+        else:
+            step["execution"] = "not planned"
+            sample = None
+
+    n_commands = [step["n_commands"] for step in steps]
+    n_requests = [step["n_requests"] for step in steps]
+    summary = {
+        "n_tasks": n_tasks,
+        "sample_size": min(int(sample_size), n_tasks),
+        "n_commands": sum(n for n in n_commands if n),
+        "commands_unknown": None in n_commands,
+        "n_requests": sum(n for n in n_requests if n),
+        "requests_unknown": None in n_requests,
+        "n_uncommitted": n_queued,
+        "n_deferred": n_deferred,
+        "syncs": syncs,
+        "stale_while_revalidate": bool(int(config.get('stale_while_revalidate', 0))),
+        "required_resource_types": required_resource_types,
+        "cache_age": get_cache_age(api),
+        "derived_fields": [description for key, description in DERIVED_FIELD_GROUPS.items()
+                           if int(base_kwargs.get('inject_derived_task_fields', 1)) and int(base_kwargs.get(key, 1))],
+    }
+    return steps, summary
+
+
+def get_cache_age(api):
+    """ Return the number of seconds since the local cache was written, or None if there is no cache file. """
+    if not getattr(api, 'cache', None):
+        return None
+    try:
+        return time.time() - os.path.getmtime(api.cache + api.token + ".json")
+    except OSError:
+        return None
+
+
+def format_age(seconds):
+    for unit, unit_seconds in (("days", 86400), ("hours", 3600), ("minutes", 60)):
+        if seconds >= unit_seconds:
+            return f"{seconds / unit_seconds:.1f} {unit}"
+    return f"{seconds:.0f} seconds"
+
+
+def format_plan(steps, summary):
+    """ Return the query plan as text: A table with one row per action, followed by the summary. """
+    def fmt(value, approx=False):
+        if value is None:
+            return "?"
+        return f"~{value:,}" if approx else f"{value:,}"
+    approx = summary["sample_size"] < summary["n_tasks"]
+    rows = [EXPLAIN_TABLE_COLUMNS]
+    for step in steps:
+        action_str = " ".join([f"-{step['action']}"] + [str(arg) for arg in step["args"]])
+        rows.append((
+            str(step["idx"]), action_str,
+            fmt(step["n_in"], approx and step["idx"] > 1), fmt(step["n_out"], approx),
+            "-" if step["selectivity"] is None else f"{step['selectivity']:.1%}",
+            fmt(step["n_commands"]), fmt(step["n_requests"]), step["execution"],
+        ))
+    widths = [max(len(row[i]) for row in rows) for i in range(len(EXPLAIN_TABLE_COLUMNS))]
+    lines = ["  ".join(cell.ljust(width) if i in (1, len(row) - 1) else cell.rjust(width)
+                       for i, (cell, width) in enumerate(zip(row, widths))).rstrip() for row in rows]
+    lines.insert(1, "-" * max(len(line) for line in lines))
+
+    lines.append("")
+    sample_note = (f"estimated from a sample of {summary['sample_size']:,} tasks" if approx
+                   else f"evaluated on all {summary['n_tasks']:,} tasks")
+    lines.append(f"Filters: linear scans in the given order (no indexes, fusion, or reordering); "
+                 f"selectivity {sample_note}.")
+    lines.append(f"Commands: {summary['n_commands']:,}{' + unknown' if summary['commands_unknown'] else ''}. "
+                 f"HTTP requests: {summary['n_requests']:,}{' + unknown' if summary['requests_unknown'] else ''}.")
+    if summary["n_uncommitted"] != 0:
+        lines.append(f"NOTICE: {fmt_count(summary['n_uncommitted'])} commands would be left in the queue, uncommitted "
+                     f"(add `-commit`).")
+    if summary["n_deferred"] != 0:
+        lines.append(f"Deferred: {fmt_count(summary['n_deferred'])} commands would be added to the outbox (use `-flush`).")
+    cache_age = summary["cache_age"]
+    cache_str = "no local cache" if cache_age is None else f"local cache written {format_age(cache_age)} ago"
+    if summary["syncs"]:
+        lines.append(f"Sync: {len(summary['syncs'])} sync(s) in the chain ({'; '.join(summary['syncs'])}); "
+                     f"actions before the first sync use the {cache_str}.")
+    elif summary["stale_while_revalidate"]:
+        lines.append(f"Sync: background sync of {', '.join(summary['required_resource_types'])} "
+                     f"(stale_while_revalidate=1); read-only actions first run on the {cache_str}.")
+    else:
+        lines.append(f"Sync: none; the chain runs on the {cache_str} "
+                     f"(`-sync` would fetch {', '.join(summary['required_resource_types'])}).")
+    if summary["derived_fields"]:
+        lines.append(f"Derived task fields, computed eagerly for all tasks when loaded and after each sync/commit: "
+                     f"{'; '.join(summary['derived_fields'])}.")
+    else:
+        lines.append("Derived task fields: none (disabled).")
+    return "\n".join(lines)
@@ -0,0 +1,473 @@
+# Copyright 2019, Rasmus Sorensen <rasmusscholer@gmail.com>
+"""
+
+Module for fetching and archiving task history (completed tasks) locally.
+
+The `completed/get_all` endpoint returns at most 200 completed items per request, so getting more than
+a single page of history requires paging with `limit` and `offset`. And since completed items never change,
+there is no reason to download the same items again on every run.
+
+`iter_completed_pages()` is a generator that pages through `completed/get_all`, fetching several pages
+concurrently (the requests still go through the api session's rate limiter, see `rate_limit.py`).
+
+`update_completed_archive()` appends newly completed items to a local, append-only archive
+(one JSON object per line), and stores a "high-water mark" (the latest `completed_date` in the archive),
+so the next run only fetches items completed after that.
+`load_completed_archive()` reads the archive back, e.g. as a task source for the action CLI:
+
+    $ todoist-action-cli -completed "monday" -print
+    $ todoist-cli fetch-completed
+
+The activity log (`activity/get` endpoint) is ingested the same way: `update_activity_log()` pages through
+all events since a persisted cursor, and appends them (in a compact form) to a local event log, which is
+indexed by object id and event date. `load_activity_events()` reads events from the log, using the index
+to only read the relevant lines, e.g. as a task source for "tasks completed this week" without network calls:
+
+    $ todoist-action-cli -activity "monday" fetch=0 -print
+    $ todoist-cli fetch-activity
+
+Archive files (in `~/.todoist-sync/history/`):
+    <token>.completed.jsonl:        Completed items, oldest first.
+    <token>.completed_state.json:   High-water mark, archive size, and the projects referenced by archived items.
+    <token>.activity.jsonl:         Activity log events, one compact JSON object per line, in the order fetched.
+    <token>.activity_index.json:    Byte offsets of the events in the log, by object id and by event date (UTC).
+    <token>.activity_state.json:    The ingestion cursor (`since`, `offset`, and the log size when it was saved).
+
+"""
+import os
+import sys
+import json
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import dateutil.parser
+from dateutil import tz
+
+from actionista.todoist.sync_utils import get_cache_dir, write_json_atomic
+
+HISTORY_DIRNAME = "history"
+COMPLETED_PAGE_SIZE = 200  # The maximum `limit` for the `completed/get_all` endpoint.
+DEFAULT_MAX_WORKERS = 4  # Max number of pages to fetch concurrently.
+API_DATETIME_FMT = "%Y-%m-%dT%H:%M"  # `since` and `until` format for the `completed/get_all` endpoint (UTC).
+ACTIVITY_PAGE_SIZE = 100  # The maximum `limit` for the `activity/get` endpoint.
+ACTIVITY_EVENT_KEYS = (
+    "id", "object_type", "object_id", "event_type", "event_date",
+    "parent_project_id", "parent_item_id", "initiator_id", "extra_data",
+)
+INDEX_DATE_FMT = "%Y-%m-%d"
+
+
+def get_history_dir(api=None):
+    history_dir = os.path.join(get_cache_dir(api), HISTORY_DIRNAME)
+    os.makedirs(history_dir, exist_ok=True)
+    return history_dir
+
+
+def get_completed_archive_filepath(api):
+    return os.path.join(get_history_dir(api), f"{api.token}.completed.jsonl")
+
+
+def get_completed_state_filepath(api):
+    return os.path.join(get_history_dir(api), f"{api.token}.completed_state.json")
+
+
+def load_json_state(filepath):
+    """ Load a JSON state file (empty dict if the file does not exist). """
+    if not os.path.exists(filepath):
+        return {}
+    with open(filepath) as fp:
+        return json.load(fp)
+
+
+def parse_datetime_utc(value):
+    """ Parse a date/time (datetime, ISO string, or natural language like "monday") to an aware UTC datetime.
+
+    Naive datetimes (and strings without timezone) are taken to be in local time.
+    """
+    if value is None or value == "":
+        return None
+    if isinstance(value, datetime.datetime):
+        dt = value
+    else:
+        dt = None
+        if value[:1].isdigit():
+            # ISO-formatted, e.g. "2019-09-17T10:21:09Z":
+            try:
+                dt = dateutil.parser.parse(value)
+            except (ValueError, OverflowError):
+                pass
+        if dt is None:
+            # Natural language, e.g. "monday" or "1 week ago" (dateutil would parse "monday" as the *next* monday),
+            # or the old Todoist date format, e.g. "Tue 17 Feb 2015 15:40:41 +0000":
+            import dateparser  # Slow to import, so only imported when needed.
+            dt = dateparser.parse(value)
+            if dt is None:
+                raise ValueError(f"Could not parse date/time {value!r}.")
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=tz.tzlocal())
+    return dt.astimezone(datetime.timezone.utc)
+
+
+def get_completed_page(api, offset=0, limit=COMPLETED_PAGE_SIZE, **params):
+    """ Get a single page from the `completed/get_all` endpoint. Returns the response dict. """
+    res = api.completed.get_all(offset=offset, limit=limit, **params)
+    if not isinstance(res, dict) or 'items' not in res:
+        raise RuntimeError(f"Unexpected response from the completed/get_all endpoint: {res!r}")
+    return res
+
+
+def iter_completed_pages(api, since=None, until=None, *, page_size=COMPLETED_PAGE_SIZE,
+                         max_workers=DEFAULT_MAX_WORKERS, verbose=0, **params):
+    """ Page through all completed items, fetching multiple pages concurrently.
+
+    The first page is fetched alone; if it is full, the following pages are fetched in increasingly
+    large batches (up to `max_workers` pages at a time), until a page is not full.
+
+    Args:
+        api: todoist.TodoistAPI object.
+        since, until: Only get items completed after/before this time (datetime or str, see `parse_datetime_utc()`).
+        page_size: Number of items per page (max 200).
+        max_workers: The maximum number of pages to fetch concurrently.
+        verbose: Increase or decrease the verbosity of the information printed during function run.
+        **params: Additional parameters for the endpoint, e.g. `project_id` or `annotate_notes`.
+
+    Yields:
+        (items, projects) tuple for each page, in order (most recently completed items first).
+    """
+    for key, value in (("since", since), ("until", until)):
+        if value is not None:
+            params[key] = parse_datetime_utc(value).strftime(API_DATETIME_FMT)
+    offset = 0
+    n_pages = 1
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while True:
+            futures = [executor.submit(get_completed_page, api, offset + i * page_size, page_size, **params)
+                       for i in range(n_pages)]
+            for future in futures:
+                res = future.result()
+                if verbose > 0:
+                    print(f" - Fetched completed items {offset}-{offset + len(res['items'])}.", file=sys.stderr)
+                offset += page_size
+                yield res['items'], res.get('projects') or {}
+                if len(res['items']) < page_size:
+                    for remaining in futures:
+                        remaining.cancel()
+                    return
+            n_pages = min(max_workers, n_pages * 2)
+
+
+def get_completed_date(item):
+    """ Return the item's `completed_date` as aware UTC datetime. """
+    return parse_datetime_utc(item['completed_date'])
+
+
+def update_completed_archive(api, *, since=None, page_size=COMPLETED_PAGE_SIZE,
+                             max_workers=DEFAULT_MAX_WORKERS, verbose=0):
+    """ Fetch items completed since the archive's high-water mark, and append them to the archive.
+
+    The `completed/get_all` endpoint only has minute resolution for `since`, so items completed
+    in the same minute as the high-water mark are fetched again; these are skipped using their ids.
+    The size of the archive is saved with the high-water mark. If a previous run was interrupted after appending
+    items to the archive, but before saving the state, the archive is truncated to the saved size first
+    (the items are then fetched again), so no items are archived twice.
+
+    Args:
+        api: todoist.TodoistAPI object.
+        since: Fetch items completed since this time, if the archive is empty (default: all history).
+        page_size: Number of items per page.
+        max_workers: The maximum number of pages to fetch concurrently.
+        verbose: Increase or decrease the verbosity of the information printed during function run.
+
+    Returns:
+        List of newly archived items.
+    """
+    state_filepath = get_completed_state_filepath(api)
+    state = load_json_state(state_filepath)
+    high_water_mark = state.get("high_water_mark") or since
+    seen_ids = set(state.get("high_water_mark_ids", []))
+    projects = state.get("projects", {})
+    archive_filepath = get_completed_archive_filepath(api)
+    if state.get("archive_size") is not None and os.path.exists(archive_filepath):
+        # Remove items appended after the state was saved:
+        with open(archive_filepath, 'r+b') as fp:
+            fp.truncate(state["archive_size"])
+    if verbose > -1:
+        print(f"\nFetching tasks completed since {high_water_mark or 'the beginning'}...", file=sys.stderr)
+    new_items = {}  # Keyed by id, in case items shift between pages while paging.
+    for items, page_projects in iter_completed_pages(
+            api, since=high_water_mark, page_size=page_size, max_workers=max_workers, verbose=verbose):
+        projects.update({str(pid): project for pid, project in page_projects.items()})
+        new_items.update((item['id'], item) for item in items if item['id'] not in seen_ids)
+    new_items = list(new_items.values())
+    if new_items:
+        new_items.sort(key=get_completed_date)
+        with open(archive_filepath, 'a') as fp:
+            for item in new_items:
+                fp.write(json.dumps(item) + "\n")
+        latest = get_completed_date(new_items[-1])
+        latest_minute = latest.strftime(API_DATETIME_FMT)
+        if state.get("high_water_mark") is None or (
+                parse_datetime_utc(state["high_water_mark"]).strftime(API_DATETIME_FMT) != latest_minute):
+            seen_ids = set()
+        seen_ids.update(item['id'] for item in new_items
+                        if get_completed_date(item).strftime(API_DATETIME_FMT) == latest_minute)
+        state["high_water_mark"] = latest.isoformat()
+        state["high_water_mark_ids"] = sorted(seen_ids)
+    state["projects"] = projects
+    state["archive_size"] = os.path.getsize(archive_filepath) if os.path.exists(archive_filepath) else 0
+    write_json_atomic(state_filepath, state)
+    if verbose > -1:
+        print(f" - {len(new_items)} new completed items archived.", file=sys.stderr)
+    return new_items
+
+
+def load_completed_archive(api, since=None, until=None):
+    """ Load completed items from the local archive (no network requests).
+
+    Args:
+        api: todoist.TodoistAPI object (only used for the token and cache dir).
+        since, until: Only include items completed after/before this time.
+
+    Returns:
+        (items, projects) tuple, where items is a list of completed item dicts (oldest first),
+        and projects is a dict of projects keyed by project id.
+    """
+    since, until = parse_datetime_utc(since), parse_datetime_utc(until)
+    items = []
+    filepath = get_completed_archive_filepath(api)
+    if os.path.exists(filepath):
+        with open(filepath) as fp:
+            for line in fp:
+                item = json.loads(line)
+                if since or until:
+                    completed_date = get_completed_date(item)
+                    if (since and completed_date < since) or (until and completed_date > until):
+                        continue
+                items.append(item)
+    projects = load_json_state(get_completed_state_filepath(api)).get("projects", {})
+    return items, projects
+
+
+def get_activity_log_filepath(api):
+    return os.path.join(get_history_dir(api), f"{api.token}.activity.jsonl")
+
+
+def get_activity_index_filepath(api):
+    return os.path.join(get_history_dir(api), f"{api.token}.activity_index.json")
+
+
+def get_activity_state_filepath(api):
+    return os.path.join(get_history_dir(api), f"{api.token}.activity_state.json")
+
+
+def get_activity_page(api, offset=0, limit=ACTIVITY_PAGE_SIZE, **params):
+    """ Get a single page of events from the `activity/get` endpoint. Returns a list of event dicts. """
+    res = api.activity.get(offset=offset, limit=limit, **params)
+    if isinstance(res, dict) and 'events' in res:
+        return res['events']
+    if isinstance(res, list):
+        # Older API versions return the list of events directly.
+        return res
+    raise RuntimeError(f"Unexpected response from the activity/get endpoint: {res!r}")
+
+
+def compact_event(event):
+    """ Return a copy of an activity event with only the fields we keep, and without empty values. """
+    event = {k: v for k, v in event.items() if k in ACTIVITY_EVENT_KEYS and v is not None}
+    if event.get('extra_data'):
+        event['extra_data'] = {k: v for k, v in event['extra_data'].items() if v is not None}
+    return event
+
+
+def add_event_to_index(index, event, offset):
+    """ Add the byte `offset` of `event` in the activity log to the index (by object id and by event date). """
+    index["objects"].setdefault(str(event.get('object_id')), []).append(offset)
+    day = parse_datetime_utc(event['event_date']).strftime(INDEX_DATE_FMT)
+    index["dates"].setdefault(day, []).append(offset)
+
+
+def build_activity_index(api):
+    """ (Re-)build the activity log index by reading the full log. Returns the index dict. """
+    index = {"objects": {}, "dates": {}, "size": 0}
+    filepath = get_activity_log_filepath(api)
+    if os.path.exists(filepath):
+        with open(filepath, 'rb') as fp:
+            offset = 0
+            for line in fp:
+                add_event_to_index(index, json.loads(line), offset)
+                offset += len(line)
+        index["size"] = offset
+    write_json_atomic(get_activity_index_filepath(api), index)
+    return index
+
+
+def load_activity_index(api):
+    """ Load the activity log index, rebuilding it if it is missing or out of date with the log. """
+    index = load_json_state(get_activity_index_filepath(api))
+    filepath = get_activity_log_filepath(api)
+    log_size = os.path.getsize(filepath) if os.path.exists(filepath) else 0
+    if not index or index.get("size") != log_size:
+        # E.g. if an ingestion was interrupted after writing events to the log, but before saving the index:
+        index = build_activity_index(api)
+    return index
+
+
+def update_activity_log(api, *, since=None, page_size=ACTIVITY_PAGE_SIZE, verbose=0):
+    """ Fetch activity events since the persisted cursor, and append them to the local activity log.
+
+    Events are returned most recent first, so new events arriving while paging only push the remaining
+    events to higher offsets, and the first events of the next page may be the last events of the previous page;
+    these are skipped using the ids of the previous page (kept in the cursor).
+    The cursor is saved after each page, together with the size of the log at that point, so an interrupted
+    ingestion can continue where it stopped: the log is first truncated to the saved size (removing the events
+    from the interrupted page, which are fetched again), so no events are added twice.
+    When paging completes, the cursor's `since` is moved to the latest event date.
+
+    Args:
+        api: todoist.TodoistAPI object.
+        since: Fetch events since this time, if the log is empty (default: all available history).
+        page_size: Number of events per request (max 100).
+        verbose: Increase or decrease the verbosity of the information printed during function run.
+
+    Returns:
+        Number of new events added to the log.
+    """
+    state_filepath = get_activity_state_filepath(api)
+    state = load_json_state(state_filepath)
+    since = state.get("since") or since
+    since_ids = set(state.get("since_ids", []))
+    cursor = state.get("cursor")
+    if verbose > -1:
+        print(f"\nFetching activity events since {since or 'the beginning'}...", file=sys.stderr)
+    log_filepath = get_activity_log_filepath(api)
+    if cursor is None or cursor.get("since") != since:
+        cursor = {"since": since, "offset": 0, "ids": [], "latest": None}
+    else:
+        if verbose > -1:
+            print(f" - Resuming interrupted ingestion at offset {cursor['offset']}.", file=sys.stderr)
+        if cursor.get("log_size") is not None and os.path.exists(log_filepath):
+            # Remove the events appended after the cursor was saved (they are fetched again):
+            with open(log_filepath, 'r+b') as fp:
+                fp.truncate(cursor["log_size"])
+    params = {"since": parse_datetime_utc(since).strftime(API_DATETIME_FMT)} if since else {}
+    index = load_activity_index(api)
+    n_new = 0
+    with open(log_filepath, 'ab') as fp:
+        while True:
+            events = get_activity_page(api, offset=cursor["offset"], limit=page_size, **params)
+            # Only the ids at the current offset boundary (the previous page) are needed to skip duplicates:
+            seen_ids = since_ids | set(cursor["ids"])
+            cursor["ids"] = [event['id'] for event in events]
+            for event in events:
+                if event['id'] in seen_ids:
+                    continue
+                event = compact_event(event)
+                add_event_to_index(index, event, fp.tell())
+                fp.write((json.dumps(event, separators=(',', ':')) + "\n").encode('utf-8'))
+                seen_ids.add(event['id'])
+                event_date = parse_datetime_utc(event['event_date'])
+                if cursor["latest"] is None or event_date > parse_datetime_utc(cursor["latest"]):
+                    cursor["latest"] = event_date.isoformat()
+                n_new += 1
+            fp.flush()
+            cursor["offset"] += len(events)
+            if verbose > 0:
+                print(f" - Fetched activity events {cursor['offset'] - len(events)}-{cursor['offset']}.",
+                      file=sys.stderr)
+            if len(events) < page_size:
+                break
+            # The index is only saved at the end (it is rebuilt from the log if we are interrupted).
+            cursor["log_size"] = fp.tell()
+            state["cursor"] = cursor
+            write_json_atomic(state_filepath, state)
+        index["size"] = fp.tell()
+    write_json_atomic(get_activity_index_filepath(api), index)
+    if cursor["latest"] is not None:
+        latest = parse_datetime_utc(cursor["latest"])
+        latest_minute = latest.strftime(API_DATETIME_FMT)
+        if since is None or parse_datetime_utc(since).strftime(API_DATETIME_FMT) != latest_minute:
+            since_ids = set()
+        # The endpoint only has minute resolution for `since`, so we remember the ids of the last minute's events:
+        with open(log_filepath, 'rb') as fp:
+            for line in iter_lines_at(fp, index["dates"].get(latest.strftime(INDEX_DATE_FMT), [])):
+                event = json.loads(line)
+                if parse_datetime_utc(event['event_date']).strftime(API_DATETIME_FMT) == latest_minute:
+                    since_ids.add(event['id'])
+        state["since"] = latest.isoformat()
+        state["since_ids"] = sorted(since_ids)
+    state["cursor"] = None
+    write_json_atomic(state_filepath, state)
+    if verbose > -1:
+        print(f" - {n_new} new activity events added to the log.", file=sys.stderr)
+    return n_new
+
+
+def iter_lines_at(fp, offsets):
+    """ Yield the lines starting at the given byte offsets in a file. """
+    for offset in offsets:
+        fp.seek(offset)
+        yield fp.readline()
+
+
+def load_activity_events(api, since=None, until=None, *, object_type=None, event_type=None, object_id=None):
+    """ Load events from the local activity log (no network requests).
+
+    The index is used to only read events for the given `object_id`, or within the given dates.
+
+    Args:
+        api: todoist.TodoistAPI object (only used for the token and cache dir).
+        since, until: Only include events after/before this time.
+        object_type: Only include events for this type of object, e.g. "item", "note", or "project".
+        event_type: Only include events of this type, e.g. "added", "updated", "completed", or "deleted".
+        object_id: Only include events for this object.
+
+    Returns:
+        List of event dicts, oldest first.
+    """
+    since, until = parse_datetime_utc(since), parse_datetime_utc(until)
+    filepath = get_activity_log_filepath(api)
+    if not os.path.exists(filepath):
+        return []
+    index = load_activity_index(api)
+    if object_id is not None:
+        offsets = index["objects"].get(str(object_id), [])
+    elif since or until:
+        first_day = since.strftime(INDEX_DATE_FMT) if since else ""
+        last_day = until.strftime(INDEX_DATE_FMT) if until else "9999"
+        offsets = [offset for day, day_offsets in index["dates"].items() if first_day <= day <= last_day
+                   for offset in day_offsets]
+    else:
+        offsets = None  # Read all events.
+    events = []
+    with open(filepath, 'rb') as fp:
+        for line in (fp if offsets is None else iter_lines_at(fp, sorted(offsets))):
+            event = json.loads(line)
+            if (object_type and event.get('object_type') != object_type
+                    or event_type and event.get('event_type') != event_type):
+                continue
+            if since or until:
+                event_date = parse_datetime_utc(event['event_date'])
+                if (since and event_date < since) or (until and event_date > until):
+                    continue
+            events.append(event)
+    events.sort(key=lambda event: parse_datetime_utc(event['event_date']))
+    return events
+
+
+def get_event_task_dict(event):
+    """ Return a task-like dict for an activity event, e.g. for using events as tasks in the action CLI. """
+    extra_data = event.get('extra_data') or {}
+    task = {
+        "id": event.get('object_id'),
+        "content": extra_data.get('content') or extra_data.get('name', ""),
+        "project_id": event.get('parent_project_id'),
+        "event_id": event['id'],
+        "event_type": event.get('event_type'),
+        "event_date": event['event_date'],
+        "object_type": event.get('object_type'),
+        "extra_data": extra_data,
+    }
+    if event.get('event_type') == 'completed':
+        task["completed_date"] = event['event_date']
+        task["checked"] = 1
+    return task
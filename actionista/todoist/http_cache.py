@@ -0,0 +1,218 @@
+# Copyright 2019, Rasmus Sorensen <rasmusscholer@gmail.com>
+"""
+
+On-disk HTTP cache with conditional GET requests, for the Todoist REST API client.
+
+`TodoistRestApi.get_tasks()` and `get_task_comments()` return the full payload on every call,
+even if nothing has changed since the last call. If the server returned an `ETag` or `Last-Modified`
+header with the previous response, we can instead send `If-None-Match` / `If-Modified-Since`,
+and if the server replies "304 Not Modified", we use the response body from the cache.
+
+Cache layout (in `~/.todoist-sync/http_cache/` by default):
+    index.json:     `{"entries": {key: {...}}, "stats": {"hits": ..., "misses": ..., ...}}`
+    <key>.json:     The cached response body for each entry.
+
+The key is a hash of the URL, the query parameters, and the Authorization header
+(so different accounts do not share cache entries).
+When the total size of the cached bodies exceeds `max_size`, the least recently used entries are evicted.
+
+The cache may be shared by several processes (e.g. a cron job and an interactive session).
+Body files are written atomically, and the index is saved while holding a file lock
+(`index.json.lock`, see `rate_limit.locked_file()`): the index on disk is re-read, and this process'
+changes (new, updated, and removed entries, and the counters) are merged into it.
+
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import threading
+
+from actionista.todoist.sync_utils import get_cache_dir, write_json_atomic
+from actionista.todoist.metrics import add_metric
+from actionista.todoist.rate_limit import locked_file
+
+DEFAULT_HTTP_CACHE_DIRNAME = "http_cache"
+DEFAULT_HTTP_CACHE_MAX_SIZE = 10 * 2**20  # bytes
+HTTP_CACHE_INDEX_FILENAME = "index.json"
+
+
+class HttpCache:
+    """ Size-bounded on-disk LRU cache for GET responses, using conditional requests to validate entries.
+
+    Hit/miss counters are kept both for the current process (`session_stats`), and cumulatively
+    in the cache index (`stats`), e.g. for reporting with `-verbose` or exporting as metrics.
+    """
+
+    def __init__(self, cache_dir=None, max_size=DEFAULT_HTTP_CACHE_MAX_SIZE, verbose=0):
+        if cache_dir is None:
+            cache_dir = os.path.join(get_cache_dir(), DEFAULT_HTTP_CACHE_DIRNAME)
+        self.cache_dir = os.path.expanduser(cache_dir)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.max_size = max_size
+        self.verbose = verbose
+        self.lock = threading.Lock()
+        index = self._load_index()
+        self.entries = index.get("entries", {})
+        self.stats = index.get("stats", {})
+        self.session_stats = {}
+        # Changes not yet saved to the index, merged with the index on disk by `_save_index()`:
+        self._changed_keys = set()
+        self._removed_keys = set()
+        self._unsaved_stats = {}
+
+    @property
+    def index_filepath(self):
+        return os.path.join(self.cache_dir, HTTP_CACHE_INDEX_FILENAME)
+
+    def _load_index(self):
+        try:
+            with open(self.index_filepath) as fp:
+                return json.load(fp)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_index(self):
+        """ Merge this process' changes into the index on disk (other processes may have changed it), and save it. """
+        with locked_file(self.index_filepath + ".lock"):
+            index = self._load_index()
+            entries = index.get("entries", {})
+            for key in self._removed_keys:
+                entries.pop(key, None)
+            entries.update({key: self.entries[key] for key in self._changed_keys if key in self.entries})
+            stats = index.get("stats", {})
+            for counter, n in self._unsaved_stats.items():
+                stats[counter] = stats.get(counter, 0) + n
+            self.entries, self.stats = entries, stats
+            self._evict()  # Entries stored by other processes also count towards `max_size`.
+            write_json_atomic(self.index_filepath, {"entries": self.entries, "stats": self.stats})
+            self._changed_keys, self._removed_keys, self._unsaved_stats = set(), set(), {}
+
+    def _body_filepath(self, key):
+        return os.path.join(self.cache_dir, key + ".json")
+
+    def _count(self, counter, n=1):
+        self.stats[counter] = self.stats.get(counter, 0) + n
+        self._unsaved_stats[counter] = self._unsaved_stats.get(counter, 0) + n
+        self.session_stats[counter] = self.session_stats.get(counter, 0) + n
+        add_metric("http_cache_events", n, event=counter)
+
+    @staticmethod
+    def get_key(url, params=None, authorization=None):
+        """ Return the cache key for a request. """
+        params = sorted((str(k), str(v)) for k, v in (params or {}).items() if v is not None)
+        # The Authorization header is only included as part of the hash, so tokens are not stored in the index.
+        return hashlib.sha1(json.dumps([url, params, authorization]).encode()).hexdigest()
+
+    def get_conditional_headers(self, key):
+        """ Return `If-None-Match` / `If-Modified-Since` headers for a cached entry (empty dict if not cached). """
+        entry = self.entries.get(key)
+        if entry is None or not os.path.exists(self._body_filepath(key)):
+            return {}
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def get(self, session, url, params=None, headers=None, **kwargs):
+        """ Make a (conditional) GET request with `session`, and return the parsed JSON response.
+
+        If the server replies "304 Not Modified", the cached response body is returned.
+        Other (successful) responses with an `ETag` or `Last-Modified` header are stored in the cache.
+        """
+        key = self.get_key(url, params, session.headers.get("Authorization"))
+        with self.lock:
+            request_headers = dict(headers or {}, **self.get_conditional_headers(key))
+        res = session.get(url, params=params, headers=request_headers, **kwargs)
+        if res.status_code == 304 and request_headers:
+            with self.lock:
+                try:
+                    with open(self._body_filepath(key), 'rb') as fp:
+                        body = fp.read()
+                    self.entries[key]["last_used"] = time.time()
+                    self._changed_keys.add(key)
+                except (OSError, KeyError):
+                    # The entry was evicted (by another thread or process) in the meantime:
+                    self.entries.pop(key, None)
+                    self._removed_keys.add(key)
+                    body = None
+                else:
+                    self._count("hits")
+                    self._count("bytes_saved", len(body))
+                    self._save_index()
+            if body is None:
+                # Re-request without conditional headers:
+                return self.get(session, url, params=params, headers=headers, **kwargs)
+            if self.verbose > 0:
+                print(f" - HTTP cache hit: {url} ({len(body)} bytes from cache).", file=sys.stderr)
+            return json.loads(body.decode('utf-8')) if body else None
+        res.raise_for_status()
+        with self.lock:
+            self._count("misses")
+            if res.headers.get("ETag") or res.headers.get("Last-Modified"):
+                self._store(key, res)
+            self._save_index()
+        if self.verbose > 0:
+            print(f" - HTTP cache miss: {url}", file=sys.stderr)
+        if res.status_code == 204 or not res.content:
+            return None
+        return res.json()
+
+    def _store(self, key, res):
+        body = res.content
+        if len(body) > self.max_size:
+            return
+        # Write to a temporary file first, so other processes never read a partially written body:
+        tmp_filepath = self._body_filepath(key) + ".tmp"
+        with open(tmp_filepath, 'wb') as fp:
+            fp.write(body)
+        os.replace(tmp_filepath, self._body_filepath(key))
+        self._changed_keys.add(key)
+        self.entries[key] = {
+            "etag": res.headers.get("ETag"),
+            "last_modified": res.headers.get("Last-Modified"),
+            "size": len(body),
+            "last_used": time.time(),
+        }
+        self._count("stores")
+        self._evict()
+
+    def _evict(self):
+        """ Remove least recently used entries until the total size is below `max_size`. """
+        total_size = sum(entry["size"] for entry in self.entries.values())
+        for key, entry in sorted(self.entries.items(), key=lambda kv: kv[1]["last_used"]):
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(self._body_filepath(key))
+            except OSError:
+                pass
+            del self.entries[key]
+            self._removed_keys.add(key)
+            total_size -= entry["size"]
+            self._count("evictions")
+
+    def clear(self):
+        """ Remove all cached responses (the cumulative stats are kept). """
+        with self.lock:
+            # Also remove the entries stored by other processes since this cache was loaded:
+            for key in set(self.entries) | set(self._load_index().get("entries", {})):
+                try:
+                    os.remove(self._body_filepath(key))
+                except OSError:
+                    pass
+                self._removed_keys.add(key)
+            self.entries = {}
+            self._save_index()
+
+    def format_stats(self, stats=None):
+        """ Return a one-line summary of the cache stats, e.g. for printing with `verbose`. """
+        stats = self.session_stats if stats is None else stats
+        hits, misses = stats.get("hits", 0), stats.get("misses", 0)
+        hit_rate = hits / (hits + misses) if hits + misses else 0
+        return (f"HTTP cache: {hits} hits, {misses} misses ({hit_rate:.0%} hit rate), "
+                f"{stats.get('evictions', 0)} evictions, {stats.get('bytes_saved', 0)} bytes saved; "
+                f"{len(self.entries)} entries, {sum(e['size'] for e in self.entries.values())} bytes cached.")
@@ -0,0 +1,216 @@
+# Copyright 2019, Rasmus Sorensen <rasmusscholer@gmail.com>
+"""
+
+Incremental ("streaming") parsing of JSON objects, e.g. Sync API responses and the local cache file.
+
+A full sync returns every task, project, note, etc. in a single JSON document.
+`json.loads()` needs the full text in memory, then builds all the dicts, after which `api._update_state()`
+builds a model object for every dict. Peak memory is thus several times the size of the payload.
+
+`iter_json_members()` instead parses the top-level JSON object incrementally, and yields the elements of
+large arrays (e.g. "items") one at a time, so they can be turned into model objects as they arrive,
+and then discarded.
+
+If the `ijson` package is installed, it is used for parsing. Otherwise, a (slower) fallback parser is used,
+which reads the input in chunks and uses the standard library's `json.JSONDecoder.raw_decode()`
+to decode each array element.
+
+"""
+import json
+import codecs
+
+DEFAULT_CHUNK_SIZE = 64 * 1024  # bytes
+JSON_WHITESPACE = ' \t\n\r'
+
+
+def iter_json_members(chunks, stream_keys=(), use_ijson=None):
+    """ Parse a JSON object incrementally, yielding `(key, value, is_element)` tuples.
+
+    For members whose key is in `stream_keys` and whose value is an array, each array element is
+    yielded separately, with `is_element=True`. All other members are yielded as a whole.
+    Empty streamed arrays are not yielded at all.
+
+    Args:
+        chunks: Iterable of str or bytes chunks (e.g. `response.iter_content(chunk_size)`),
+            or a file-like object with a `read()` method.
+        stream_keys: Top-level keys whose array values should be yielded one element at a time.
+        use_ijson: Whether to use `ijson` for parsing. Default: Use ijson if it is installed.
+
+    Yields:
+        (key, value, is_element) tuples.
+    """
+    if use_ijson is None or use_ijson:
+        try:
+            import ijson
+        except ImportError:
+            if use_ijson:
+                raise
+            use_ijson = False
+        else:
+            use_ijson = True
+    if use_ijson:
+        fp = chunks if hasattr(chunks, 'read') else ChunksReader(chunks)
+        return _iter_members_ijson(fp, stream_keys)
+    if hasattr(chunks, 'read'):
+        chunks = iter_file_chunks(chunks)
+    return _iter_members_chunked(chunks, stream_keys)
+
+
+def iter_file_chunks(fp, chunk_size=DEFAULT_CHUNK_SIZE):
+    """ Read a file-like object in chunks. """
+    while True:
+        chunk = fp.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+class ChunksReader:
+    """ Minimal file-like wrapper around an iterable of bytes chunks (for `ijson`). """
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.buffer = b""
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                break
+            self.buffer += chunk.encode('utf-8') if isinstance(chunk, str) else chunk
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+
+def _iter_members_ijson(fp, stream_keys):
+    """ `iter_json_members()` implementation using `ijson` parser events. """
+    import ijson
+    from ijson.common import ObjectBuilder
+    try:
+        events = ijson.parse(fp, use_float=True)
+    except TypeError:
+        # Older ijson versions always return decimal.Decimal for non-integer numbers.
+        events = ijson.parse(fp)
+    keys = {}  # Share key strings between objects, like `json.loads()` does.
+    depth = 0
+    key = None
+    streaming = False  # True while inside one of the top-level arrays being streamed.
+    builder, builder_depth = None, None
+    for _, event, value in events:
+        if builder is not None:
+            if event == 'map_key':
+                value = keys.setdefault(value, value)
+            builder.event(event, value)
+            if event in ('start_map', 'start_array'):
+                depth += 1
+            elif event in ('end_map', 'end_array'):
+                depth -= 1
+                if depth == builder_depth:
+                    yield key, builder.value, streaming
+                    builder = None
+        elif event in ('start_map', 'start_array'):
+            if depth == 0:
+                if event != 'start_map':
+                    raise ValueError("Expected a JSON object.")
+                depth = 1
+            elif depth == 1 and event == 'start_array' and key in stream_keys:
+                streaming = True
+                depth = 2
+            else:
+                builder = ObjectBuilder()
+                builder.event(event, value)
+                builder_depth = depth
+                depth += 1
+        elif event in ('end_map', 'end_array'):
+            depth -= 1
+            streaming = streaming and depth > 1
+        elif event == 'map_key':
+            key = value
+        else:
+            yield key, value, streaming
+
+
+class _ChunkedDecoder:
+    """ Decode JSON values one at a time from an iterable of chunks, reading more chunks as needed. """
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        # `json.loads()` shares key strings between all objects in a document, but `raw_decode()` only does that
+        # within each call. Sharing keys between array elements reduces the memory used by e.g. tasks considerably.
+        keys = {}
+        self.decoder = json.JSONDecoder(
+            object_pairs_hook=lambda pairs: {keys.setdefault(k, k): v for k, v in pairs})
+        self.utf8_decoder = codecs.getincrementaldecoder('utf-8')()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        """ Read the next chunk, discarding the part of the buffer that has already been parsed. """
+        chunk = next(self.chunks, None)
+        if chunk is None:
+            self.eof = True
+            chunk = self.utf8_decoder.decode(b"", final=True)
+        elif isinstance(chunk, bytes):
+            chunk = self.utf8_decoder.decode(chunk)
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+
+    def peek(self):
+        """ Return the next non-whitespace character (without consuming it), or "" at the end of input. """
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in JSON_WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer) or self.eof:
+                return self.buffer[self.pos:self.pos+1]
+            self.fill()
+
+    def expect(self, chars):
+        """ Consume and return the next non-whitespace character, which must be one of `chars`. """
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError(f"Expected one of {chars!r} at position {self.pos}, got {char!r}.")
+        self.pos += 1
+        return char
+
+    def value(self):
+        """ Decode and return the next JSON value. """
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            else:
+                # A number at the end of the buffer may continue in the next chunk:
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            self.fill()
+
+
+def _iter_members_chunked(chunks, stream_keys):
+    """ `iter_json_members()` fallback implementation, using only the standard library. """
+    reader = _ChunkedDecoder(chunks)
+    reader.expect('{')
+    if reader.peek() == '}':
+        return
+    while True:
+        key = reader.value()
+        reader.expect(':')
+        if key in stream_keys and reader.peek() == '[':
+            reader.expect('[')
+            if reader.peek() == ']':
+                reader.expect(']')
+            else:
+                while True:
+                    yield key, reader.value(), True
+                    if reader.expect(',]') == ']':
+                        break
+        else:
+            yield key, reader.value(), False
+        if reader.expect(',}') == '}':
+            break
@@ -0,0 +1,193 @@
+# Copyright 2019, Rasmus Sorensen <rasmusscholer@gmail.com>
+"""
+
+Optional export of run metrics (sync latency, delta sizes, commits, retries, action durations, cache hits)
+as OpenMetrics/Prometheus text, e.g. for CLI runs from cron, monitored with the node-exporter textfile collector.
+
+Enable by adding one of the following keys to the config file (`~/.todoist_config.yaml`):
+
+    metrics_textfile_dir: /var/lib/node_exporter/textfile_collector  # Writes `actionista_todoist_<command>.prom`.
+    metrics_file: ~/.todoist-sync/metrics.prom                        # Writes to this file.
+
+The file is written (atomically) when the process exits, and describes the last run of the command,
+so all metrics are gauges, labelled with the command name (the name of the CLI program, or `metrics_command`).
+Use a different `metrics_command` for each cron job, so the jobs do not overwrite each other's metrics file.
+
+When no metrics file is configured, the `add_metric()` and `set_metric()` calls return immediately.
+
+"""
+import os
+import re
+import sys
+import time
+import atexit
+
+METRIC_PREFIX = "actionista_todoist_"
+METRICS_FILENAME_FMT = "actionista_todoist_{command}.prom"
+METRICS_HELP = {
+    "run_success": "1 if the last run completed without an uncaught exception, else 0.",
+    "run_duration_seconds": "Duration of the last run.",
+    "last_run_timestamp_seconds": "Unix time when the last run finished.",
+    "syncs": "Number of syncs (pulling updates from the server).",
+    "sync_duration_seconds": "Time spent fetching (and, when streaming, applying) sync responses.",
+    "sync_objects": "Number of objects in the sync responses (the delta), by resource type.",
+    "sync_response_bytes": "Size of the Sync API responses.",
+    "commit_commands": "Number of commands committed.",
+    "commit_chunks": "Number of requests used to commit commands.",
+    "commit_errors": "Number of committed commands that failed.",
+    "request_retries": "Number of retried Sync API requests.",
+    "action_duration_seconds": "Time spent in each action of the action chain.",
+    "action_calls": "Number of times each action was invoked.",
+    "http_cache_events": "REST API HTTP cache events (hits, misses, stores, evictions, and bytes_saved).",
+    "http_cache_hit_ratio": "Fraction of cacheable REST API requests served from the HTTP cache.",
+    "result_cache_events": "Action chain result cache events (hits, misses, stores, and evictions).",
+    "rate_limit_requests": "Number of requests that passed through the client-side rate limiter.",
+    "rate_limit_waits": "Number of times a request had to wait for the rate limiter.",
+    "rate_limit_wait_seconds": "Time spent waiting for the rate limiter.",
+}
+
+_sink = None
+
+
+class MetricsSink:
+    """ Collects metric values for this process, and writes them to an OpenMetrics text file. """
+
+    def __init__(self, filepath, command):
+        self.filepath = filepath
+        self.command = command
+        self.values = {}  # {(name, ((label, value), ...)): value}
+        self.start_time = time.time()
+        self.written = False
+
+    def add(self, name, value, labels):
+        key = (name, tuple(sorted(labels.items())))
+        self.values[key] = self.values.get(key, 0) + value
+
+    def set(self, name, value, labels):
+        self.values[(name, tuple(sorted(labels.items())))] = value
+
+    def collect(self):
+        """ Add metrics kept elsewhere (rate limiter) and the run metrics. """
+        # Imported here, to avoid a circular import (rate_limit -> sync_utils -> metrics):
+        from actionista.todoist import rate_limit
+        rate_limiter = rate_limit._rate_limiter
+        if rate_limiter is not None:
+            self.set("rate_limit_requests", rate_limiter.n_requests, {})
+            self.set("rate_limit_waits", rate_limiter.n_waits, {})
+            self.set("rate_limit_wait_seconds", rate_limiter.total_wait, {})
+        n_hits = self.values.get(("http_cache_events", (("event", "hits"),)), 0)
+        n_misses = self.values.get(("http_cache_events", (("event", "misses"),)), 0)
+        if n_hits + n_misses:
+            self.set("http_cache_hit_ratio", n_hits / (n_hits + n_misses), {})
+        now = time.time()
+        self.set("run_duration_seconds", now - self.start_time, {})
+        self.set("last_run_timestamp_seconds", now, {})
+        if ("run_success", ()) not in self.values:
+            # `sys.last_value` is set when the interpreter prints an uncaught exception:
+            self.set("run_success", 0 if getattr(sys, "last_value", None) is not None else 1, {})
+
+    def format(self):
+        """ Return the metrics in OpenMetrics text format. """
+        by_name = {}
+        for (name, labels), value in self.values.items():
+            by_name.setdefault(name, []).append((labels, value))
+        lines = []
+        for name in sorted(by_name):
+            metric = METRIC_PREFIX + name
+            lines.append(f"# HELP {metric} {METRICS_HELP.get(name, name)}")
+            lines.append(f"# TYPE {metric} gauge")
+            for labels, value in sorted(by_name[name]):
+                label_str = ",".join(f'{label}="{format_label_value(label_value)}"'
+                                     for label, label_value in (("command", self.command),) + labels)
+                lines.append(f"{metric}{{{label_str}}} {value!r}")
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def write(self):
+        """ Write the metrics file atomically (the textfile collector must never see a partial file). """
+        self.collect()
+        os.makedirs(os.path.dirname(self.filepath) or ".", exist_ok=True)
+        # The temporary file must not end with ".prom", or the textfile collector may read it:
+        tmp_filepath = f"{self.filepath}.{os.getpid()}.tmp"
+        with open(tmp_filepath, "w") as fp:
+            fp.write(self.format())
+        os.replace(tmp_filepath, self.filepath)
+        self.written = True
+        return self.filepath
+
+
+def format_label_value(value):
+    return str(value).replace("\\", r"\\").replace("\n", r"\n").replace('"', r'\"')
+
+
+def get_command_name(command=None):
+    """ Return the command name for labels and file names. Default: The name of the CLI program. """
+    command = command or os.path.splitext(os.path.basename(sys.argv[0]))[0] or "python"
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", command)
+
+
+def get_metrics_filepath(config, command):
+    """ Return the metrics file path from the config (`metrics_file` or `metrics_textfile_dir`), or None. """
+    if config.get("metrics_file"):
+        return os.path.expanduser(config["metrics_file"])
+    if config.get("metrics_textfile_dir"):
+        return os.path.join(os.path.expanduser(config["metrics_textfile_dir"]),
+                            METRICS_FILENAME_FMT.format(command=command))
+    return None
+
+
+def enable_metrics(config, command=None):
+    """ Start collecting metrics, if a metrics file is configured. The file is written when the process exits.
+
+    Args:
+        config: Config dict, with the `metrics_file` or `metrics_textfile_dir` key (and optionally `metrics_command`).
+        command: The command name, used as label and in the file name. Default: The name of the CLI program.
+
+    Returns:
+        The MetricsSink, or None if metrics are not enabled. If metrics were already enabled, the existing sink.
+    """
+    global _sink
+    if _sink is not None or not config:
+        return _sink
+    command = get_command_name(config.get("metrics_command") or command)
+    filepath = get_metrics_filepath(config, command)
+    if filepath is None:
+        return None
+    _sink = MetricsSink(filepath, command)
+    atexit.register(write_metrics)
+    return _sink
+
+
+def metrics_enabled():
+    return _sink is not None
+
+
+def add_metric(name, value=1, **labels):
+    """ Add `value` to the metric, e.g. `add_metric("commit_commands", 100)`. Does nothing if metrics are disabled. """
+    if _sink is None:
+        return
+    _sink.add(name, value, labels)
+
+
+def set_metric(name, value, **labels):
+    """ Set the metric to `value`. Does nothing if metrics are disabled. """
+    if _sink is None:
+        return
+    _sink.set(name, value, labels)
+
+
+def count_bytes(chunks, name, **labels):
+    """ Pass through an iterable of byte chunks (e.g. a streamed response), adding their size to the metric. """
+    for chunk in chunks:
+        add_metric(name, len(chunk), **labels)
+        yield chunk
+
+
+def write_metrics():
+    """ Write the metrics file (if metrics are enabled and the file has not been written already). """
+    if _sink is None or _sink.written:
+        return
+    try:
+        return _sink.write()
+    except OSError as exc:
+        print(f"\nWARNING: Could not write metrics file {_sink.filepath}: {exc!r}", file=sys.stderr)
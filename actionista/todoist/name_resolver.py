@@ -0,0 +1,106 @@
+# Copyright 2019, Rasmus Sorensen <rasmusscholer@gmail.com>
+"""
+
+Resolve project, label, and section names to ids, using cached, case-folded name indexes.
+
+Looking up a name by scanning e.g. `api.projects.all()` is fine for a single task,
+but when adding many tasks (see `api_commands.add_tasks()`), the indexes are built once and re-used.
+An index is only rebuilt when the local state of its resource type changes:
+either after a sync that returned changes for that resource type (call `resolver.invalidate(response)`),
+or when objects have been added to or removed from the local state.
+
+    >>> resolver = NameResolver(api)
+    >>> resolver.get_project_id("Inbox")
+    >>> resolver.get_label_ids(["habit", "Errands"])
+    >>> resolver.get_section_id("Groceries", project_id=resolver.get_project_id("Home"))
+
+"""
+
+RESOLVER_RESOURCE_TYPES = ("projects", "labels", "sections")
+
+
+class NameResolver:
+    """ Cached name -> id lookups for projects, labels, and sections. """
+
+    def __init__(self, api):
+        self.api = api
+        self.indexes = {}  # {resource_type: (fingerprint, {casefolded_name: id})}
+        self.section_indexes = {}  # {project_id: {casefolded_name: id}}, built with the "sections" index.
+
+    def get_fingerprint(self, resource_type):
+        """ Cheap check for changes to the local state that did not come from a sync (e.g. `api.projects.add()`). """
+        objs = self.api.state[resource_type]
+        return id(objs), len(objs)
+
+    def invalidate(self, response=None):
+        """ Drop cached indexes, e.g. after a sync.
+
+        Args:
+            response: Sync response (e.g. from `sync_utils.sync_resource_types()`). If given, only the indexes for
+                resource types with changes in the response are dropped. If None, all indexes are dropped.
+        """
+        if response is None or response.get("full_sync"):
+            self.indexes.clear()
+        else:
+            for resource_type in RESOLVER_RESOURCE_TYPES:
+                if response.get(resource_type):
+                    self.indexes.pop(resource_type, None)
+
+    def get_index(self, resource_type):
+        """ Return the `{casefolded_name: id}` index for a resource type, (re-)building it if needed. """
+        fingerprint = self.get_fingerprint(resource_type)
+        cached = self.indexes.get(resource_type)
+        if cached is not None and cached[0] == fingerprint:
+            return cached[1]
+        index = {}
+        section_indexes = {}
+        for obj in self.api.state[resource_type]:
+            if obj.data.get("is_deleted"):
+                continue
+            name = obj["name"].casefold()
+            # If multiple objects have the same name, the first one is used (like the previous linear search):
+            index.setdefault(name, obj["id"])
+            if resource_type == "sections":
+                section_indexes.setdefault(obj["project_id"], {}).setdefault(name, obj["id"])
+        self.indexes[resource_type] = (fingerprint, index)
+        if resource_type == "sections":
+            self.section_indexes = section_indexes
+        return index
+
+    def get_project_id(self, project):
+        """ Return the id of the project with the given name (case-insensitive). Ids are returned unchanged. """
+        if not isinstance(project, str):
+            return project
+        try:
+            return self.get_index("projects")[project.casefold()]
+        except KeyError:
+            raise ValueError(f'Project name "{project}" was not recognized. Please create project first.') from None
+
+    def get_label_ids(self, labels):
+        """ Return label ids for a list of label names (or ids), or a comma-separated string of label names. """
+        if isinstance(labels, str):
+            labels = [label.strip() for label in labels.split(",")]
+        index = self.get_index("labels")
+        label_ids = []
+        for label in labels:
+            if not isinstance(label, str):
+                label_ids.append(label)
+                continue
+            try:
+                label_ids.append(index[label.lstrip("@").casefold()])
+            except KeyError:
+                raise ValueError(f'Label "{label}" was not recognized. Please create label first.') from None
+        return label_ids
+
+    def get_section_id(self, section, project_id=None):
+        """ Return the id of the section with the given name, within the given project (if specified). """
+        if not isinstance(section, str):
+            return section
+        index = self.get_index("sections")
+        if project_id is not None:
+            index = self.section_indexes.get(project_id, {})
+        try:
+            return index[section.casefold()]
+        except KeyError:
+            raise ValueError(f'Section name "{section}" was not recognized. Please create section first.') from None
+
@@ -0,0 +1,194 @@
+# Copyright 2019, Rasmus Sorensen <rasmusscholer@gmail.com>
+"""
+
+Client-side rate limiting, shared between all clients and processes.
+
+Todoist limits the number of requests per user (currently 450 requests per 15 minutes for the Sync API).
+When e.g. a cron job, a couple of `todoist-add-task` invocations, and a large `-commit` overlap,
+the limit is easily exceeded, and then the remaining requests fail with HTTP 429.
+
+This module implements a token bucket, whose state is kept in a file in the cache directory,
+and which is locked while being updated, so the limit is shared by all processes.
+Requests that exceed the limit are not rejected; instead, each request reserves the next available
+slot in the bucket, and then waits until that time (so requests are queued in order).
+
+The rate limiter is applied to a `requests.Session` by mounting a `RateLimitedAdapter`:
+
+    >>> install_rate_limiter(api.session)
+
+This is done for the sessions created by `utils.get_todoist_api()`, `action_cli`,
+and the REST clients in `rest_api.py`.
+
+Config keys:
+    rate_limit_requests:    The number of requests allowed per period (0 to disable rate limiting).
+    rate_limit_period:      The period, in seconds.
+    rate_limit_burst:       The maximum number of requests that can be made in a burst, without waiting.
+
+"""
+import os
+import sys
+import json
+import time
+import threading
+import contextlib
+
+from requests.adapters import HTTPAdapter
+
+from actionista.todoist.config import get_config
+from actionista.todoist.sync_utils import get_cache_dir
+
+DEFAULT_RATE_LIMIT_REQUESTS = 450
+DEFAULT_RATE_LIMIT_PERIOD = 15 * 60  # seconds
+DEFAULT_RATE_LIMIT_BURST = 50
+RATE_LIMIT_STATE_FILENAME = "rate_limit.json"
+WAIT_REPORT_THRESHOLD = 1.0  # Only report waits longer than this (seconds).
+
+_rate_limiter = None  # Shared rate limiter for the current process, c.f. `get_rate_limiter()`.
+
+
+@contextlib.contextmanager
+def locked_file(filepath):
+    """ Open `filepath` for reading and writing, holding an exclusive lock (across processes) while open. """
+    with open(filepath, 'a+') as fp:
+        if os.name == 'nt':
+            import msvcrt
+            fp.seek(0)
+            msvcrt.locking(fp.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield fp
+            finally:
+                fp.seek(0)
+                msvcrt.locking(fp.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(fp.fileno(), fcntl.LOCK_EX)
+            try:
+                yield fp
+            finally:
+                fcntl.flock(fp.fileno(), fcntl.LOCK_UN)
+
+
+class TokenBucketRateLimiter:
+    """ Token bucket rate limiter, with the bucket state stored in a lock-protected file. """
+
+    def __init__(self, requests=DEFAULT_RATE_LIMIT_REQUESTS, period=DEFAULT_RATE_LIMIT_PERIOD,
+                 burst=DEFAULT_RATE_LIMIT_BURST, filepath=None, verbose=0):
+        self.rate = requests / period  # tokens per second
+        self.capacity = burst
+        self.filepath = filepath or os.path.join(get_cache_dir(), RATE_LIMIT_STATE_FILENAME)
+        self.verbose = verbose
+        self.lock = threading.Lock()  # In addition to the file lock, for platforms where it is per-process.
+        self.n_requests = 0
+        self.n_waits = 0
+        self.total_wait = 0.0
+
+    def reserve(self, n=1):
+        """ Take `n` tokens from the bucket, and return how long to wait (seconds) before they are available.
+
+        The bucket may go "negative", which is how waiting requests are queued:
+        each request reserves the tokens that will be added to the bucket next.
+        """
+        with self.lock, locked_file(self.filepath) as fp:
+            fp.seek(0)
+            try:
+                state = json.loads(fp.read())
+            except ValueError:
+                state = {}
+            now = time.time()
+            tokens = state.get("tokens", self.capacity)
+            tokens = min(self.capacity, tokens + (now - state.get("updated", now)) * self.rate)
+            tokens -= n
+            fp.seek(0)
+            fp.truncate()
+            json.dump({"tokens": tokens, "updated": now}, fp)
+            fp.flush()
+        return max(0.0, -tokens / self.rate)
+
+    def acquire(self, n=1):
+        """ Wait until `n` requests can be made within the rate limit. Returns the time waited (seconds). """
+        wait = self.reserve(n)
+        self.n_requests += n
+        if wait > 0:
+            if wait >= WAIT_REPORT_THRESHOLD and self.verbose > -1:
+                print(f" - Rate limit: Waiting {wait:0.1f} s before the next request "
+                      f"(limit is {self.rate * 60:0.1f} requests/min).", file=sys.stderr)
+            time.sleep(wait)
+            self.n_waits += 1
+            self.total_wait += wait
+        return wait
+
+    def format_stats(self):
+        """ Return a one-line summary of the time spent waiting, e.g. for printing with `verbose`. """
+        return (f"Rate limit: {self.n_requests} requests, waited {self.n_waits} times "
+                f"for a total of {self.total_wait:0.1f} s.")
+
+
+class NoRateLimiter:
+    """ Stand-in for `TokenBucketRateLimiter` when rate limiting is disabled. """
+    n_requests = n_waits = 0
+    total_wait = 0.0
+
+    def acquire(self, n=1):
+        return 0.0
+
+    def format_stats(self):
+        return "Rate limit: Disabled."
+
+
+class RateLimitedAdapter(HTTPAdapter):
+    """ Transport adapter that waits for the rate limiter before sending each request. """
+
+    def __init__(self, rate_limiter=None, **kwargs):
+        super().__init__(**kwargs)
+        self.rate_limiter = rate_limiter or get_rate_limiter()
+
+    def send(self, request, **kwargs):
+        self.rate_limiter.acquire()
+        return super().send(request, **kwargs)
+
+
+def get_rate_limiter(config=None, verbose=0):
+    """ Return the shared rate limiter for this process, creating it (from config values) if needed.
+
+    Args:
+        config: Config dict with `rate_limit_*` keys (see module docstring). Default: Load config from file.
+        verbose: Increase or decrease the verbosity of the information printed.
+
+    Returns:
+        TokenBucketRateLimiter (or NoRateLimiter, if `rate_limit_requests` is 0).
+    """
+    global _rate_limiter
+    if _rate_limiter is None:
+        if config is None:
+            config = get_config() or {}
+        n_requests = float(config.get('rate_limit_requests', DEFAULT_RATE_LIMIT_REQUESTS))
+        if n_requests <= 0:
+            _rate_limiter = NoRateLimiter()
+        else:
+            _rate_limiter = TokenBucketRateLimiter(
+                requests=n_requests,
+                period=float(config.get('rate_limit_period', DEFAULT_RATE_LIMIT_PERIOD)),
+                burst=float(config.get('rate_limit_burst', DEFAULT_RATE_LIMIT_BURST)),
+                verbose=verbose,
+            )
+    return _rate_limiter
+
+
+def install_rate_limiter(session, rate_limiter=None, config=None, **adapter_kwargs):
+    """ Mount a `RateLimitedAdapter` on the session, for both http and https URLs.
+
+    Args:
+        session: requests.Session object.
+        rate_limiter: The rate limiter to use. Default: The shared rate limiter (`get_rate_limiter()`).
+        config: Config dict, passed to `get_rate_limiter()`.
+        **adapter_kwargs: Passed to `HTTPAdapter`, e.g. `pool_maxsize`.
+
+    Returns:
+        The rate limiter.
+    """
+    if rate_limiter is None:
+        rate_limiter = get_rate_limiter(config=config)
+    adapter = RateLimitedAdapter(rate_limiter, **adapter_kwargs)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return rate_limiter
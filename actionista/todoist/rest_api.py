@@ -19,11 +19,48 @@ Update: The REST API is out.
     * https://developer.todoist.com/rest/v1/?python#create-a-new-task
 * https://developer.todoist.com/rest/v1/?python
 
+
+Bulk operations:
+The REST API does not have batch endpoints, so closing 500 tasks means 500 round trips.
+`AsyncTodoistRestApi` runs these concurrently (with a bounded number of requests in flight),
+using a shared connection pool, e.g.:
+
+    >>> async def main():
+    ...     async with AsyncTodoistRestApi() as api:
+    ...         return await api.close_tasks(task_ids)
+    >>> results = run_async(main())  # {task_id: None or exception}
+
+Both `TodoistRestApi` and `AsyncTodoistRestApi` take a `base_url` argument, e.g. to test against a local server.
+
+Caching:
+`TodoistRestApi.get()` requests (e.g. `get_tasks()`, `get_task_comments()`) go through an on-disk HTTP cache
+(see `http_cache.py`), which sends conditional requests and serves "304 Not Modified" responses from the cache.
+Cache hits and misses are printed with `verbose=1`; `api.http_cache.format_stats()` gives a summary.
+
 """
 
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
 
 from actionista.todoist.config import get_token
+from actionista.todoist.sync_utils import get_retry_delay
+from actionista.todoist.http_cache import HttpCache
+from actionista.todoist.rate_limit import install_rate_limiter
+
+DEFAULT_MAX_CONCURRENCY = 10  # Max number of concurrent requests for bulk operations.
+DEFAULT_REQUEST_TIMEOUT = 30  # seconds
+DEFAULT_MAX_RETRIES = 3
+RETRY_HTTP_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+def parse_response(res):
+    """ Return the parsed JSON response, or None if the response has no content (e.g. "204 No Content"). """
+    if res.status_code == 204 or not res.content:
+        return None
+    return res.json()
 
 
 class TodoistRestApi:
@@ -32,12 +69,27 @@ class TodoistRestApi:
     API_BASE_URL = "https://api.todoist.com/rest/v1/"
 
 
-    def __init__(self, token=None):
+    def __init__(self, token=None, base_url=None, http_cache=None, verbose=0):
+        """
+        Args:
+            token: Todoist API token. Default: Read token from file or config.
+            base_url: API base URL, e.g. for testing against a local server.
+            http_cache: `http_cache.HttpCache` object, used to cache GET responses and make conditional requests.
+                Default: Use a cache in the default cache dir. Use `http_cache=False` to disable caching.
+            verbose: Increase or decrease the verbosity of the information printed.
+        """
         self._token = None
         if token is None:
             token = get_token()
-        self.update_token(token)
+        if base_url is not None:
+            self.API_BASE_URL = base_url
+        if http_cache is None:
+            http_cache = HttpCache(verbose=verbose)
+        self.http_cache = http_cache or None
+        self.verbose = verbose
         self.session = requests.Session()
+        install_rate_limiter(self.session)
+        self.update_token(token)
 
     def update_token(self, token):
         self._token = token
@@ -46,39 +98,41 @@ class TodoistRestApi:
 
     def get(self, endpoint, **kwargs):
         endpoint_url = self.API_BASE_URL + endpoint
+        if self.http_cache is not None:
+            return self.http_cache.get(self.session, endpoint_url, **kwargs)
         res = self.session.get(url=endpoint_url, **kwargs)
         res.raise_for_status()
-        return res.json()
+        return parse_response(res)
 
     def post(self, endpoint, **kwargs):
         endpoint_url = self.API_BASE_URL + endpoint
         res = self.session.post(url=endpoint_url, **kwargs)
         res.raise_for_status()
-        return res.json()
+        return parse_response(res)
 
     def delete(self, endpoint, **kwargs):
         endpoint_url = self.API_BASE_URL + endpoint
         res = self.session.delete(url=endpoint_url, **kwargs)
         res.raise_for_status()
-        return res.json()
+        return parse_response(res)
 
     def get_tasks(self, project_id=None, label_id=None, filter=None):
         kwargs = dict(project_id=project_id, label_id=label_id, filter=filter)
         kwargs = {k: v for k, v in kwargs.items() if v is not None}
-        return self.get(endpoint='tasks', **kwargs)
+        return self.get(endpoint='tasks', params=kwargs)
 
     def close_task(self, task_id: int):
         assert isinstance(task_id, int)
         endpoint = f"tasks/{task_id}/close"
         res = self.post(endpoint=endpoint)
-        print(f"Closed task {task_id}; response: {res}  (should be 204).")
+        print(f"Closed task {task_id}; response: {res}  (should be None, i.e. 204 No Content).")
         return res
 
     def delete_task(self, task_id: int):
         assert isinstance(task_id, int)
         endpoint = f"tasks/{task_id}"
         res = self.delete(endpoint=endpoint)
-        print(f"Deleted task {task_id}; response: {res}  (should be 204).")
+        print(f"Deleted task {task_id}; response: {res}  (should be None, i.e. 204 No Content).")
         return res
 
     def get_task_comments(self, task_id: int):
@@ -87,3 +141,114 @@ class TodoistRestApi:
         params = {"task_id": task_id}
         return self.get(endpoint=endpoint, params=params)
 
+
+
+class AsyncTodoistRestApi:
+    """ Asyncio counterpart to `TodoistRestApi`, for running many requests concurrently.
+
+    Requests are made with a shared `requests.Session` (and connection pool) in a thread pool,
+    with at most `max_concurrency` requests in flight at any time.
+    Requests that fail with HTTP 429 or 5xx are retried (honoring the `Retry-After` header).
+
+    The bulk methods, e.g. `close_tasks(task_ids)`, return a dict with the result for each task id.
+    If the request for a task failed, the result is the exception, so one failed request does not
+    prevent the other tasks from being processed.
+    """
+
+    API_BASE_URL = TodoistRestApi.API_BASE_URL
+
+    def __init__(self, token=None, base_url=None, *, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                 timeout=DEFAULT_REQUEST_TIMEOUT, max_retries=DEFAULT_MAX_RETRIES):
+        if token is None:
+            token = get_token()
+        if base_url is not None:
+            self.API_BASE_URL = base_url
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.session = requests.Session()
+        # Requests share the rate limit with other clients (see `rate_limit.py`):
+        install_rate_limiter(self.session, pool_connections=1, pool_maxsize=max_concurrency)
+        self.session.headers.update({"Authorization": "Bearer %s" % token})
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency)
+        # The semaphore is created when first used, since (before Python 3.10) it binds to the current event loop:
+        self._semaphore = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self.session.close()
+
+    async def request(self, method, endpoint, **kwargs):
+        """ Make a request in the thread pool, and return the parsed JSON response (None for 204 No Content). """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        loop = asyncio.get_event_loop()
+        request = functools.partial(
+            self.session.request, method, self.API_BASE_URL + endpoint, timeout=self.timeout, **kwargs)
+        attempt = 0
+        while True:
+            async with self._semaphore:
+                res = await loop.run_in_executor(self._executor, request)
+            if res.status_code not in RETRY_HTTP_STATUS_CODES or attempt >= self.max_retries:
+                break
+            await asyncio.sleep(get_retry_delay(attempt, retry_after=res.headers.get("Retry-After")))
+            attempt += 1
+        res.raise_for_status()
+        return parse_response(res)
+
+    async def get(self, endpoint, **kwargs):
+        return await self.request("GET", endpoint, **kwargs)
+
+    async def post(self, endpoint, **kwargs):
+        return await self.request("POST", endpoint, **kwargs)
+
+    async def delete(self, endpoint, **kwargs):
+        return await self.request("DELETE", endpoint, **kwargs)
+
+    async def get_tasks(self, project_id=None, label_id=None, filter=None):
+        params = dict(project_id=project_id, label_id=label_id, filter=filter)
+        return await self.get("tasks", params={k: v for k, v in params.items() if v is not None})
+
+    async def close_task(self, task_id: int):
+        return await self.post(f"tasks/{task_id}/close")
+
+    async def delete_task(self, task_id: int):
+        return await self.delete(f"tasks/{task_id}")
+
+    async def get_task_comments(self, task_id: int):
+        return await self.get("comments", params={"task_id": task_id})
+
+    async def for_each_id(self, method, ids):
+        """ Invoke `method(id)` concurrently for each id, and return a dict with `{id: result or exception}`. """
+        ids = list(ids)
+        results = await asyncio.gather(*[method(id_) for id_ in ids], return_exceptions=True)
+        return dict(zip(ids, results))
+
+    async def close_tasks(self, task_ids):
+        """ Close (complete) tasks. Returns dict with `{task_id: None or exception}`. """
+        return await self.for_each_id(self.close_task, task_ids)
+
+    async def delete_tasks(self, task_ids):
+        """ Delete tasks. Returns dict with `{task_id: None or exception}`. """
+        return await self.for_each_id(self.delete_task, task_ids)
+
+    async def get_comments_for(self, task_ids):
+        """ Get comments for tasks. Returns dict with `{task_id: list of comments or exception}`. """
+        return await self.for_each_id(self.get_task_comments, task_ids)
+
+
+def run_async(coro):
+    """ Run a coroutine to completion (`asyncio.run()` is only available in Python 3.7+). """
+    if hasattr(asyncio, 'run'):
+        return asyncio.run(coro)
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
@@ -0,0 +1,241 @@
+# Copyright 2019, Rasmus Sorensen <rasmusscholer@gmail.com>
+"""
+
+On-disk result cache for read-only action chains (`todoist-action-cli result_cache=1 -due today -sort -print`).
+
+The same read-only chains are often run many times between actual changes to the tasks.
+With the result cache enabled, the printed output of a chain consisting only of read-only actions
+(filtering, sorting, and printing) is stored, and replayed on later runs with the same key,
+skipping loading the cache, injecting the derived task fields, and evaluating the chain.
+
+The key is a hash of:
+    * The local sync state: The sync token, the per-resource-type sync tokens, and the modification time
+      and size of the local cache file (so any sync or commit invalidates the cached results).
+    * The normalized action chain, as returned by `parse_argv()`.
+    * The config (including base arguments such as `inject_task_project_fields=0`).
+    * The current date, since filters like `-due before today` are relative to the current date.
+    * The actionista version.
+
+Note: Filters relative to the current time of day (rather than the date) are not invalidated during the day;
+use `result_cache=0` for such chains.
+
+Cache layout (in `~/.todoist-sync/result_cache/` by default):
+    index.json:     `{"entries": {key: {"size": ..., "last_used": ..., "argv": ...}}, "stats": {...}}`
+    <key>.out:      The output of the chain.
+
+When the total size of the cached outputs exceeds `max_size`, the least recently used entries are evicted.
+
+Like the HTTP cache (see `http_cache.py`), the result cache may be used by several processes at once
+(e.g. cron jobs): outputs are written atomically (via uniquely named temporary files), and the index is saved
+while holding a file lock (`index.json.lock`), merging this process' changes into the index on disk.
+The index is not saved on a miss (the miss is counted when the output is stored).
+
+"""
+import io
+import os
+import sys
+import json
+import time
+import hashlib
+import datetime
+import tempfile
+import contextlib
+
+import actionista
+from actionista.todoist.action_commands import READ_ONLY_ACTIONS
+from actionista.todoist.sync_utils import DEFAULT_CACHE_DIR, RESOURCE_SYNC_TOKENS_FILENAME_FMT
+from actionista.todoist.sync_utils import get_cache_dir, write_json_atomic
+from actionista.todoist.metrics import add_metric
+from actionista.todoist.rate_limit import locked_file
+
+DEFAULT_RESULT_CACHE_DIRNAME = "result_cache"
+DEFAULT_RESULT_CACHE_MAX_SIZE = 5 * 2**20  # bytes
+RESULT_CACHE_INDEX_FILENAME = "index.json"
+
+
+def is_cacheable(action_groups):
+    """ Return True if the action chain only consists of read-only actions (so the output can be cached). """
+    return bool(action_groups) and all(agroup[0] in READ_ONLY_ACTIONS for agroup in action_groups)
+
+
+def get_sync_state(token, cache_dir=DEFAULT_CACHE_DIR):
+    """ Return a description of the local sync state, which changes whenever the local cache is updated.
+
+    This only reads the (small) sync token files and stats the cache file, without loading the cache.
+    """
+    cache_dir = os.path.expanduser(cache_dir)
+    state = []
+    for filename in (token + ".sync", RESOURCE_SYNC_TOKENS_FILENAME_FMT.format(token=token)):
+        try:
+            with open(os.path.join(cache_dir, filename)) as fp:
+                state.append(fp.read())
+        except OSError:
+            state.append(None)
+    try:
+        stat = os.stat(os.path.join(cache_dir, token + ".json"))
+        state.append([stat.st_mtime_ns, stat.st_size])
+    except OSError:
+        state.append(None)
+    return state
+
+
+class TeeWriter:
+    """ File-like object writing to a stream (e.g. `sys.stdout`) while keeping a copy of the output. """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.buffer = io.StringIO()
+
+    def write(self, text):
+        self.buffer.write(text)
+        return self.stream.write(text)
+
+    def flush(self):
+        self.stream.flush()
+
+    def getvalue(self):
+        return self.buffer.getvalue()
+
+
+class ResultCache:
+    """ Size-bounded on-disk LRU cache for the output of read-only action chains, see module docstring. """
+
+    def __init__(self, cache_dir=None, max_size=DEFAULT_RESULT_CACHE_MAX_SIZE, verbose=0):
+        if cache_dir is None:
+            cache_dir = os.path.join(get_cache_dir(), DEFAULT_RESULT_CACHE_DIRNAME)
+        self.cache_dir = os.path.expanduser(cache_dir)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.max_size = int(max_size)
+        self.verbose = verbose
+        index = self._load_index()
+        self.entries = index.get("entries", {})
+        self.stats = index.get("stats", {})
+        # Changes not yet saved to the index, merged with the index on disk by `_save_index()`:
+        self._changed_keys = set()
+        self._removed_keys = set()
+        self._unsaved_stats = {}
+
+    @property
+    def index_filepath(self):
+        return os.path.join(self.cache_dir, RESULT_CACHE_INDEX_FILENAME)
+
+    def _load_index(self):
+        try:
+            with open(self.index_filepath) as fp:
+                return json.load(fp)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_index(self):
+        """ Merge this process' changes into the index on disk (other processes may have changed it), and save it. """
+        with locked_file(self.index_filepath + ".lock"):
+            index = self._load_index()
+            entries = index.get("entries", {})
+            for key in self._removed_keys:
+                entries.pop(key, None)
+            entries.update({key: self.entries[key] for key in self._changed_keys if key in self.entries})
+            stats = index.get("stats", {})
+            for counter, n in self._unsaved_stats.items():
+                stats[counter] = stats.get(counter, 0) + n
+            self.entries, self.stats = entries, stats
+            self._evict()  # Entries stored by other processes also count towards `max_size`.
+            write_json_atomic(self.index_filepath, {"entries": self.entries, "stats": self.stats})
+            self._changed_keys, self._removed_keys, self._unsaved_stats = set(), set(), {}
+
+    def _output_filepath(self, key):
+        return os.path.join(self.cache_dir, key + ".out")
+
+    def _count(self, counter, n=1):
+        self.stats[counter] = self.stats.get(counter, 0) + n
+        self._unsaved_stats[counter] = self._unsaved_stats.get(counter, 0) + n
+        add_metric("result_cache_events", n, event=counter)
+
+    @staticmethod
+    def get_key(token, action_groups, config, cache_dir=DEFAULT_CACHE_DIR, date=None):
+        """ Return the cache key for an action chain (see module docstring).
+
+        Args:
+            token: The Todoist API token (the local cache files are per token).
+            action_groups: List of (action_name, args, kwargs) tuples, as returned by `parse_argv()`.
+            config: The config dict (including the base arguments).
+            cache_dir: The local cache directory, with the sync token and cache files.
+            date: The current date (default: today), for relative date filters.
+        """
+        date = date or datetime.date.today()
+        action_groups = [[name, list(args), sorted(kwargs.items())] for name, args, kwargs in action_groups]
+        key_data = [get_sync_state(token, cache_dir), action_groups, config, date.isoformat(),
+                    actionista.__version__]
+        # The token (and config) are only included as part of the hash, so they are not stored in the index:
+        key_data.append(token)
+        return hashlib.sha1(json.dumps(key_data, sort_keys=True, default=str).encode()).hexdigest()
+
+    def get(self, key):
+        """ Return the cached output for `key`, or None if it is not cached. """
+        try:
+            with open(self._output_filepath(key), encoding='utf-8') as fp:
+                output = fp.read()
+        except OSError:
+            self._count("misses")  # Saved with the index when the output is stored.
+            if self.entries.pop(key, None) is not None:
+                self._removed_keys.add(key)
+            if self.verbose > 0:
+                print(" - Result cache miss.", file=sys.stderr)
+            return None
+        if key in self.entries:
+            self.entries[key]["last_used"] = time.time()
+            self._changed_keys.add(key)
+        self._count("hits")
+        self._save_index()
+        if self.verbose > 0:
+            print(f" - Result cache hit ({len(output)} characters of output replayed).", file=sys.stderr)
+        return output
+
+    def put(self, key, output, argv=None):
+        """ Store the output for `key`, evicting least recently used entries if the cache is too large. """
+        size = len(output.encode('utf-8'))
+        if size > self.max_size:
+            return
+        fd, tmp_filepath = tempfile.mkstemp(dir=self.cache_dir, prefix=key + ".", suffix=".tmp")
+        with os.fdopen(fd, 'w', encoding='utf-8') as fp:
+            fp.write(output)
+        os.replace(tmp_filepath, self._output_filepath(key))
+        self.entries[key] = {"size": size, "last_used": time.time(), "argv": argv}
+        self._changed_keys.add(key)
+        self._count("stores")
+        self._evict()
+        self._save_index()
+
+    @contextlib.contextmanager
+    def recording(self, key, argv=None):
+        """ Context manager, which copies everything printed to stdout, and stores it if no exception is raised. """
+        tee = TeeWriter(sys.stdout)
+        with contextlib.redirect_stdout(tee):
+            yield tee
+        self.put(key, tee.getvalue(), argv=argv)
+
+    def _evict(self):
+        """ Remove least recently used entries until the total size is below `max_size`. """
+        total_size = sum(entry["size"] for entry in self.entries.values())
+        for key, entry in sorted(self.entries.items(), key=lambda kv: kv[1]["last_used"]):
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(self._output_filepath(key))
+            except OSError:
+                pass
+            del self.entries[key]
+            self._removed_keys.add(key)
+            total_size -= entry["size"]
+            self._count("evictions")
+
+    def clear(self):
+        """ Remove all cached results (the cumulative stats are kept). """
+        # Also remove the entries stored by other processes since this cache was loaded:
+        for key in set(self.entries) | set(self._load_index().get("entries", {})):
+            try:
+                os.remove(self._output_filepath(key))
+            except OSError:
+                pass
+            self._removed_keys.add(key)
+        self.entries = {}
+        self._save_index()
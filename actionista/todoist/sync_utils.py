@@ -0,0 +1,816 @@
+# Copyright 2019, Rasmus Sorensen <rasmusscholer@gmail.com>
+"""
+
+Module for syncing and committing against the Todoist Sync API.
+
+The official `todoist-python` package commits the whole command queue in a single POST request
+with `api.commit()`. That is fine for a handful of changes, but e.g.
+`todoist-action-cli -due before today -reschedule tomorrow -commit` on a neglected account can
+easily produce thousands of `item_update` commands, which exceeds the server's per-request
+command limit (100 commands), and then the whole commit fails.
+
+This module provides `commit_chunked()`, which splits the queue into chunks,
+submits each chunk in turn, and collects errors for each command (keyed by command uuid),
+rather than failing everything at the first error.
+
+Workflow, in brief:
+    1. Queue commands, e.g. `task.update(...)` -> `api.queue.append(cmd)`.
+    2. Commit: `commit_chunked(api)` -> `post_sync_commands(api, chunk, resource_types=[])` for each chunk.
+        The chunks only carry commands (no resource types), so each response just has the command statuses
+        and temp id mappings, and the sync token is not advanced.
+    3. After the last chunk, a single incremental sync (`sync_resource_types()`) fetches the changes,
+        and writes the cache.
+
+Before anything is sent, the queue is saved to a (per-account) "pending commit" file in the cache directory.
+Requests that time out or fail with HTTP 429/5xx are retried with exponential backoff (and jitter).
+Each command has a uuid, and the server will not apply a command with the same uuid twice,
+so it is safe to re-submit commands when we don't know whether a request went through.
+After each chunk, commands listed in the response's `sync_status` are dropped from the pending file.
+If the commit is interrupted, the remaining commands can be re-submitted with `resume_commit()`
+(`todoist-action-cli -resume-commit`).
+
+Deferred commits ("outbox"):
+Scripts that invoke `todoist-add-task` or `todoist-action-cli ... -commit` many times in a row
+pay for a full sync+commit round trip on every invocation. Instead, commands can be added to a
+persistent local (per-account) outbox with `defer_commit()` (`-commit later`, `todoist-add-task --commit-later`),
+and everything accumulated can then be sent in one chunked commit with `flush_outbox()` (`-flush`).
+Objects created by deferred commands keep their temporary ids in the local cache until the outbox
+is flushed, so later commands (also in later invocations) can refer to them.
+
+Resource-scoped ("partial") sync:
+`api.sync()` always asks for all resource types (notes, reminders, filters, collaborators, etc).
+A pipeline like `todoist-action-cli -due today -print` only needs items, projects and labels.
+`sync_resource_types(api, ["items", "projects", "labels"])` fetches updates for just those resource
+types, leaving the rest of the cached state untouched. Since the server only has a single sync token
+per request, we keep a separate sync token for each resource type (in the cache directory), and only
+advance the global `api.sync_token` on full syncs. Resource types without their own token fall back to
+the global sync token, which is always safe: an older token just means the server sends a larger delta.
+
+Streaming:
+A full sync (e.g. after `-delete-cache`) returns all objects in one large JSON document, and `api.sync()`
+holds the raw text, the parsed dicts, and the model objects in memory at the same time.
+`stream_sync()` instead parses the response incrementally (see `json_stream.py`) and applies objects
+to the local state in batches as they arrive. `read_cache_file()` and `write_cache_file()` do the same
+for the local cache file. `sync_resource_types()` streams by default.
+
+"""
+import os
+import sys
+import json
+import time
+import random
+import tempfile
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+import todoist
+
+from actionista.todoist.json_stream import iter_json_members
+from actionista.todoist.metrics import add_metric, count_bytes, metrics_enabled
+from actionista.action_cli_core.hooks import run_hooks
+
+# Todoist will reject requests with more than 100 commands:
+DEFAULT_COMMIT_CHUNK_SIZE = 100
+DEFAULT_REQUEST_TIMEOUT = 120  # seconds
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_BACKOFF_BASE = 1.0  # seconds
+DEFAULT_BACKOFF_MAX = 60.0  # seconds
+RETRY_HTTP_STATUS_CODES = (429, 500, 502, 503, 504)
+PENDING_COMMIT_FILENAME_FMT = "{token}.pending_commit.json"  # Per-account, like the cache file.
+OUTBOX_FILENAME_FMT = "{token}.outbox.json"  # Per-account, like the cache file.
+RESOURCE_SYNC_TOKENS_FILENAME_FMT = "{token}.resource_tokens.json"  # Per-account, like `api._write_cache()`.
+DEFAULT_CACHE_DIR = "~/.todoist-sync/"  # Same as `todoist.TodoistAPI`.
+# Object types in the local state (and in sync responses), c.f. `api._update_state()`:
+SYNC_DATATYPES = ("collaborators", "collaborator_states", "filters", "items", "labels", "live_notifications",
+                  "notes", "project_notes", "projects", "reminders", "sections")
+SYNC_DATATYPE_MODELS = {
+    "collaborators": todoist.models.Collaborator,
+    "filters": todoist.models.Filter,
+    "items": todoist.models.Item,
+    "labels": todoist.models.Label,
+    "live_notifications": todoist.models.LiveNotification,
+    "notes": todoist.models.Note,
+    "project_notes": todoist.models.ProjectNote,
+    "projects": todoist.models.Project,
+    "reminders": todoist.models.Reminder,
+    "sections": todoist.models.Section,
+}
+DEFAULT_STREAM_BATCH_SIZE = 500  # Number of objects to apply at a time when streaming a sync response.
+DEFAULT_STREAM_CHUNK_SIZE = 64 * 1024  # bytes
+# Command args that may reference a temporary id of an object created by an earlier command:
+TEMP_ID_ARGS = ('id', 'item_id', 'project_id', 'parent_id', 'section_id', 'label_id', 'note_id')
+
+
+def get_api_sync_url(api):
+    """ Return the URL of the 'sync' endpoint used by the given api object. """
+    # Note: `action_cli` may override `api.get_api_url()` to use a non-standard API url.
+    return api.get_api_url() + "sync"
+
+
+def get_cache_dir(api=None):
+    """ Return the local cache directory used by `api`, or the default cache directory. """
+    cache_dir = getattr(api, 'cache', None) or os.path.expanduser(DEFAULT_CACHE_DIR)
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+
+def write_json_atomic(filepath, data):
+    """ Write `data` as JSON to `filepath`, replacing any existing file atomically.
+
+    The data is written to a uniquely named temporary file first, so concurrent writers (e.g. two processes
+    saving the same index) never write to, or replace, each other's temporary file.
+    """
+    fd, tmp_filepath = tempfile.mkstemp(dir=os.path.dirname(filepath) or ".",
+                                        prefix=os.path.basename(filepath) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w') as fp:
+            json.dump(data, fp, default=todoist.api.state_default)
+        os.replace(tmp_filepath, filepath)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp_filepath)
+        raise
+
+
+def get_pending_commit_filepath(api):
+    return os.path.join(get_cache_dir(api), PENDING_COMMIT_FILENAME_FMT.format(token=api.token))
+
+
+def save_pending_commands(api, commands):
+    """ Save commands to the pending commit file, or remove the file if there are no commands. """
+    filepath = get_pending_commit_filepath(api)
+    if commands:
+        write_json_atomic(filepath, commands)
+    elif os.path.exists(filepath):
+        os.remove(filepath)
+
+
+def load_pending_commands(api):
+    """ Load commands from the pending commit file (empty list if there is no pending commit). """
+    filepath = get_pending_commit_filepath(api)
+    if not os.path.exists(filepath):
+        return []
+    with open(filepath) as fp:
+        return json.load(fp)
+
+
+def get_retry_delay(attempt, backoff_base=DEFAULT_BACKOFF_BASE, backoff_max=DEFAULT_BACKOFF_MAX, retry_after=None):
+    """ Exponential backoff with "full jitter", honoring the server's `Retry-After` header (seconds), if given. """
+    delay = random.uniform(0, min(backoff_max, backoff_base * 2 ** attempt))
+    if retry_after:
+        try:
+            delay = max(delay, float(retry_after))
+        except ValueError:
+            pass  # Retry-After may also be an HTTP date; just use our own delay.
+    return delay
+
+
+def post_sync_commands(api, commands, resource_types=None, sync_token=None, *,
+                       timeout=DEFAULT_REQUEST_TIMEOUT, max_retries=DEFAULT_MAX_RETRIES,
+                       backoff_base=DEFAULT_BACKOFF_BASE, backoff_max=DEFAULT_BACKOFF_MAX, verbose=0):
+    """ Post a list of commands to the Sync API and return the parsed JSON response.
+
+    Unlike `api.sync(commands)`, this does not update the local state or write the cache.
+    Use `apply_sync_response()` for that.
+
+    Requests that time out, fail to connect, or fail with HTTP 429/5xx are retried up to
+    `max_retries` times, with exponential backoff and jitter between attempts.
+
+    Args:
+        api: todoist.TodoistAPI object.
+        commands: List of command dicts, e.g. from `api.queue`.
+        resource_types: The resource types to fetch updates for. Default: `["all"]`.
+            Use an empty list to only submit commands, without fetching any updates.
+        sync_token: Sync token to use. Default: `api.sync_token`.
+        timeout: Request timeout, in seconds.
+        max_retries: The maximum number of times to retry a failed request.
+        backoff_base: The base delay (seconds) for the exponential backoff.
+        backoff_max: The maximum delay (seconds) between retries.
+        verbose: Increase or decrease the verbosity of the information printed during function run.
+
+    Returns:
+        dict with the parsed JSON response.
+    """
+    post_data = get_sync_post_data(api, commands, resource_types=resource_types, sync_token=sync_token)
+    res = post_with_retries(api, post_data, timeout=timeout, max_retries=max_retries,
+                            backoff_base=backoff_base, backoff_max=backoff_max, verbose=verbose)
+    add_metric("sync_response_bytes", len(res.content))
+    return res.json()
+
+
+def get_sync_post_data(api, commands=None, resource_types=None, sync_token=None):
+    """ Return the form data for a Sync API request (same as used by `api.sync()`). """
+    return {
+        "token": api.token,
+        "sync_token": api.sync_token if sync_token is None else sync_token,
+        "day_orders_timestamp": api.state["day_orders_timestamp"],
+        "include_notification_settings": 1,
+        "resource_types": todoist.api.json_dumps(["all"] if resource_types is None else resource_types),
+        "commands": todoist.api.json_dumps(commands or []),
+    }
+
+
+def post_with_retries(api, post_data, *, stream=False,
+                      timeout=DEFAULT_REQUEST_TIMEOUT, max_retries=DEFAULT_MAX_RETRIES,
+                      backoff_base=DEFAULT_BACKOFF_BASE, backoff_max=DEFAULT_BACKOFF_MAX, verbose=0):
+    """ POST `post_data` to the Sync API, retrying as described in `post_sync_commands()`.
+
+    Returns:
+        requests.Response object. If `stream=True`, the response body has not yet been read.
+    """
+    attempt = 0
+    while True:
+        retry_after = None
+        try:
+            res = api.session.post(get_api_sync_url(api), data=post_data, timeout=timeout, stream=stream)
+            if res.status_code in RETRY_HTTP_STATUS_CODES:
+                retry_after = res.headers.get("Retry-After")
+            res.raise_for_status()
+            return res
+        except (requests.Timeout, requests.ConnectionError, requests.HTTPError) as exc:
+            retriable = not isinstance(exc, requests.HTTPError) or exc.response.status_code in RETRY_HTTP_STATUS_CODES
+            if not retriable or attempt >= max_retries:
+                raise
+            delay = get_retry_delay(attempt, backoff_base, backoff_max, retry_after=retry_after)
+            attempt += 1
+            add_metric("request_retries")
+            if verbose > -1:
+                print(f" - Request failed ({exc!r}); retrying in {delay:0.1f} s "
+                      f"(attempt {attempt} of {max_retries})...", file=sys.stderr)
+            time.sleep(delay)
+
+
+def apply_sync_response(api, response, write_cache=False):
+    """ Update the api's local state with a response returned by `post_sync_commands()`.
+
+    This does the same as the second half of `api.sync()`.
+    """
+    if response.get("temp_id_mapping"):
+        replace_temp_ids(api, response["temp_id_mapping"])
+    api._update_state(response)
+    if write_cache:
+        write_cache_file(api)
+    return response
+
+
+def replace_temp_ids(api, temp_id_mapping):
+    """ Replace temporary ids with real ids in the local state, and update `api.temp_ids`. """
+    api.temp_ids.update(temp_id_mapping)
+    # Unlike `api._replace_temp_id()`, this also matches objects loaded from the cache (which has no
+    # `temp_id` attribute), e.g. tasks added in an earlier invocation with a deferred commit:
+    for datatype in ("filters", "items", "labels", "notes", "project_notes", "projects", "reminders", "sections"):
+        for obj in api.state[datatype]:
+            if obj.temp_id in temp_id_mapping:
+                obj["id"] = temp_id_mapping[obj.temp_id]
+            elif obj["id"] in temp_id_mapping:
+                obj["id"] = temp_id_mapping[obj["id"]]
+
+
+def apply_json_stream(api, chunks, *, update_sync_token=True, batch_size=DEFAULT_STREAM_BATCH_SIZE):
+    """ Parse a sync response (or cache file) incrementally, and apply it to the api's local state.
+
+    Objects (items, projects, notes, etc.) are turned into model objects in batches of `batch_size`
+    as they are parsed, so the raw response text never needs to be held in memory.
+
+    Args:
+        api: todoist.TodoistAPI object.
+        chunks: Iterable of bytes/str chunks, or a file-like object (see `json_stream.iter_json_members()`).
+        update_sync_token: If False, `api.sync_token` is not updated (used for resource-scoped syncs).
+        batch_size: The number of objects to apply at a time.
+
+    Returns:
+        The parsed response, e.g. `{"items": [...], "sync_token": "..."}`.
+        The objects in the lists are the same dicts that were applied to the local state (not copies).
+    """
+    response = {}
+    indexes = {}
+    batch_datatype, batch = None, []
+    for key, value, is_element in iter_json_members(chunks, stream_keys=SYNC_DATATYPES):
+        if batch and (not is_element or key != batch_datatype or len(batch) >= batch_size):
+            apply_objects(api, batch_datatype, batch, indexes)
+            batch = []
+        if is_element:
+            batch_datatype = key
+            batch.append(value)
+            response.setdefault(key, []).append(value)
+            continue
+        response[key] = value
+        if key == "temp_id_mapping" and value:
+            replace_temp_ids(api, value)
+            indexes.clear()
+        elif key != "sync_token" or update_sync_token:
+            api._update_state({key: value})
+    if batch:
+        apply_objects(api, batch_datatype, batch, indexes)
+    return response
+
+
+def apply_objects(api, datatype, objs, indexes=None):
+    """ Add, update, or remove objects of a single type, like `api._update_state({datatype: objs})`.
+
+    `api._update_state()` does a linear search through the local state for every object, which makes
+    a full sync (or reading the cache) quadratic in the number of tasks. This uses an id index instead.
+
+    Args:
+        api: todoist.TodoistAPI object.
+        datatype: The object type, e.g. "items".
+        objs: List of object dicts, e.g. from a sync response.
+        indexes: Dict of `{datatype: (id_index, temp_id_index)}`, to be re-used between batches.
+            If the local state is modified by other means in the meantime, the indexes must be cleared.
+    """
+    model = SYNC_DATATYPE_MODELS.get(datatype)
+    if model is None:
+        # E.g. collaborator_states, which are not identified by an id.
+        api._update_state({datatype: objs})
+        return
+    if indexes is None:
+        indexes = {}
+    local_objs = api.state[datatype]
+    if datatype not in indexes:
+        indexes[datatype] = (
+            {obj["id"]: obj for obj in local_objs},
+            {obj.temp_id: obj for obj in local_objs if obj.temp_id},
+        )
+    id_index, temp_id_index = indexes[datatype]
+    for remoteobj in objs:
+        # Same as `api._find_object()`, which matches on either id or temp_id:
+        localobj = id_index.get(remoteobj["id"]) or temp_id_index.get(str(remoteobj["id"]))
+        is_deleted = remoteobj.get("is_deleted", 0)
+        if localobj is not None:
+            if is_deleted == 0 or is_deleted is False:
+                localobj.data.update(remoteobj)
+                id_index[localobj["id"]] = localobj
+            else:
+                local_objs.remove(localobj)
+                id_index.pop(remoteobj["id"], None)
+        elif is_deleted == 0 or is_deleted is False:
+            newobj = model(remoteobj, api)
+            local_objs.append(newobj)
+            id_index[newobj["id"]] = newobj
+
+
+def stream_sync(api, resource_types=None, sync_token=None, *, timeout=DEFAULT_REQUEST_TIMEOUT, verbose=0):
+    """ Like `post_sync_commands(api, [], ...)` + `apply_sync_response()`, but streaming the response.
+
+    Use this for (potentially) large syncs, e.g. a full sync after the cache has been deleted.
+    The global `api.sync_token` is only updated for full ("all" resource types) syncs.
+
+    Returns:
+        The parsed response (see `apply_json_stream()`).
+    """
+    post_data = get_sync_post_data(api, [], resource_types=resource_types, sync_token=sync_token)
+    res = post_with_retries(api, post_data, stream=True, timeout=timeout, verbose=verbose)
+    chunks = res.iter_content(chunk_size=DEFAULT_STREAM_CHUNK_SIZE)
+    if metrics_enabled():
+        chunks = count_bytes(chunks, "sync_response_bytes")
+    try:
+        return apply_json_stream(api, chunks, update_sync_token=not resource_types or "all" in resource_types)
+    finally:
+        res.close()
+
+
+def read_cache_file(api, cache_dir=DEFAULT_CACHE_DIR):
+    """ Load the api's local state from the cache, like `api._read_cache()`, but parsing the file incrementally.
+
+    Use with `todoist.TodoistAPI(token, cache=None)`, to prevent `TodoistAPI.__init__` from reading
+    the whole cache file into memory.
+    """
+    api.cache = os.path.expanduser(cache_dir)
+    os.makedirs(api.cache, exist_ok=True)
+    try:
+        with open(api.cache + api.token + ".json", 'rb') as fp:
+            apply_json_stream(api, fp)
+        with open(api.cache + api.token + ".sync") as fp:
+            api.sync_token = fp.read()
+    except Exception:
+        # Same as `api._read_cache()`: If the cache can't be read, we just start from scratch.
+        return
+
+
+def write_cache_file(api):
+    """ Write the api's local state to the cache, like `api._write_cache()`, but without building
+    the full JSON string in memory first. The cache files are replaced atomically.
+    """
+    if not api.cache:
+        return
+    filepath = api.cache + api.token + ".json"
+    with open(filepath + ".tmp", 'w') as fp:
+        json.dump(api.state, fp, indent=2, sort_keys=True, default=todoist.api.state_default)
+    os.replace(filepath + ".tmp", filepath)
+    with open(api.cache + api.token + ".sync", "w") as fp:
+        fp.write(api.sync_token)
+
+
+def start_background_sync(api, resource_types=None, verbose=0):
+    """ Start fetching updates from the server in a background thread.
+
+    The response is NOT applied to the local state, so the current (cached) state can safely be used
+    while the request is in flight. Use `apply_sync_response(api, future.result())` to apply it.
+
+    Returns:
+        concurrent.futures.Future, whose result is the parsed sync response.
+    """
+    executor = ThreadPoolExecutor(max_workers=1)
+    future = executor.submit(post_sync_commands, api, [], resource_types=resource_types, verbose=verbose)
+    executor.shutdown(wait=False)
+    return future
+
+
+def get_resource_sync_tokens_filepath(api):
+    return os.path.join(get_cache_dir(api), RESOURCE_SYNC_TOKENS_FILENAME_FMT.format(token=api.token))
+
+
+def load_resource_sync_tokens(api):
+    """ Load the per-resource-type sync tokens (empty dict if none have been saved). """
+    filepath = get_resource_sync_tokens_filepath(api)
+    if not os.path.exists(filepath):
+        return {}
+    with open(filepath) as fp:
+        return json.load(fp)
+
+
+def save_resource_sync_tokens(api, resource_sync_tokens):
+    """ Save the per-resource-type sync tokens, or remove the file if there are none. """
+    filepath = get_resource_sync_tokens_filepath(api)
+    if resource_sync_tokens:
+        write_json_atomic(filepath, resource_sync_tokens)
+    elif os.path.exists(filepath):
+        os.remove(filepath)
+
+
+def group_resource_types(api, resource_types=None):
+    """ Group resource types by their current sync token.
+
+    A request is needed for each group (usually, all requested resource types were last synced together,
+    so this is a single request).
+
+    Returns:
+        List of (resource_types, sync_token) tuples. `[(["all"], api.sync_token)]` for a full sync.
+    """
+    if not resource_types or "all" in resource_types:
+        return [(["all"], api.sync_token)]
+    resource_sync_tokens = load_resource_sync_tokens(api)
+    groups = {}
+    for rtype in resource_types:
+        groups.setdefault(resource_sync_tokens.get(rtype, api.sync_token), []).append(rtype)
+    return [(group, sync_token) for sync_token, group in groups.items()]
+
+
+def fetch_resource_types(api, resource_types=None, *, verbose=0):
+    """ Fetch updates for the given resource types from the server, without applying them.
+
+    Args:
+        api: todoist.TodoistAPI object.
+        resource_types: List of resource types, e.g. `["items", "projects", "labels"]`.
+            If None, or if the list includes "all", a regular full sync is made.
+        verbose: Increase or decrease the verbosity of the information printed during function run.
+
+    Returns:
+        List of (resource_types, response) tuples, to be applied with `apply_resource_responses()`.
+    """
+    groups = group_resource_types(api, resource_types)
+    if verbose > 0:
+        print(f" - Syncing resource types: {', '.join(resource_types or ['all'])} "
+              f"({len(groups)} request(s)).", file=sys.stderr)
+    start_time = time.perf_counter()
+    results = [
+        (group, post_sync_commands(api, [], resource_types=group, sync_token=sync_token, verbose=verbose))
+        for group, sync_token in groups
+    ]
+    add_metric("sync_duration_seconds", time.perf_counter() - start_time)
+    return results
+
+
+def apply_resource_responses(api, results, write_cache=True, applied=False):
+    """ Apply responses returned by `fetch_resource_types()` and update the sync tokens.
+
+    Responses for a subset of resource types only advance the sync tokens for those resource types;
+    the global `api.sync_token` is kept, so a later full sync will still include everything else.
+
+    Args:
+        api: todoist.TodoistAPI object.
+        results: List of (resource_types, response) tuples.
+        write_cache: Write the local cache after applying the responses.
+        applied: If True, the responses have already been applied (by `stream_sync()`),
+            and only the sync tokens are updated.
+
+    Returns:
+        dict with the merged responses, e.g. `{"items": [...], "projects": [...], "full_sync": False}`.
+    """
+    resource_sync_tokens = load_resource_sync_tokens(api)
+    merged = {}
+    for group, response in results:
+        if group == ["all"]:
+            if not applied:
+                apply_sync_response(api, response)
+            # All resource types are now at least as fresh as the global sync token:
+            resource_sync_tokens = {}
+        else:
+            if not applied:
+                global_sync_token = api.sync_token
+                apply_sync_response(api, response)
+                api.sync_token = global_sync_token
+            resource_sync_tokens.update({rtype: response["sync_token"] for rtype in group})
+        for key, value in response.items():
+            if isinstance(value, list):
+                merged.setdefault(key, []).extend(value)
+        merged["full_sync"] = merged.get("full_sync") or response.get("full_sync", False)
+    add_metric("syncs")
+    if metrics_enabled():
+        for datatype in SYNC_DATATYPES:
+            if datatype in merged:
+                add_metric("sync_objects", len(merged[datatype]), resource_type=datatype)
+    save_resource_sync_tokens(api, resource_sync_tokens)
+    if write_cache:
+        write_cache_file(api)
+    return merged
+
+
+def sync_resource_types(api, resource_types=None, *, stream=True, write_cache=True, verbose=0):
+    """ Pull updates for the given resource types from the server and apply them to the local state.
+
+    This is like `api.sync()`, but only requests the given resource types, e.g. `["items", "projects"]`.
+    Use `resource_types=["all"]` (or None) for a regular full sync.
+
+    Args:
+        api: todoist.TodoistAPI object.
+        resource_types: List of resource types to sync.
+        stream: Parse and apply the responses incrementally (see `stream_sync()`), to limit peak memory.
+        write_cache: Write the local cache after syncing.
+        verbose: Increase or decrease the verbosity of the information printed during function run.
+
+    Returns:
+        dict with the merged sync responses (see `apply_resource_responses()`).
+    """
+    run_hooks("before_sync", api=api, resource_types=resource_types)
+    start_time = time.perf_counter()
+    if not stream:
+        results = fetch_resource_types(api, resource_types, verbose=verbose)
+        response = apply_resource_responses(api, results, write_cache=write_cache)
+    else:
+        groups = group_resource_types(api, resource_types)
+        results = [(group, stream_sync(api, group, sync_token, verbose=verbose)) for group, sync_token in groups]
+        add_metric("sync_duration_seconds", time.perf_counter() - start_time)  # Includes applying the responses.
+        response = apply_resource_responses(api, results, write_cache=write_cache, applied=True)
+    run_hooks("after_sync", api=api, resource_types=resource_types, response=response,
+              n_items=len(response.get("items", [])), duration=time.perf_counter() - start_time)
+    return response
+
+
+def start_background_resource_sync(api, resource_types=None, verbose=0):
+    """ Like `start_background_sync()`, but using `fetch_resource_types()`.
+
+    Use `apply_resource_responses(api, future.result())` to apply the result.
+    """
+    executor = ThreadPoolExecutor(max_workers=1)
+    future = executor.submit(fetch_resource_types, api, resource_types, verbose=verbose)
+    executor.shutdown(wait=False)
+    return future
+
+
+def has_state_changes(response, resource_types=("items", "projects", "labels", "sections")):
+    """ Return True if the sync response contains any changes to the given resource types. """
+    return bool(response.get("full_sync")) or any(response.get(rtype) for rtype in resource_types)
+
+
+def resolve_temp_ids(commands, temp_ids):
+    """ Replace temporary ids in command args with the real ids from `temp_ids`.
+
+    The server resolves temporary ids within a single request, but when a large queue is split
+    into multiple chunks, a command may reference an object that was created in an earlier chunk.
+    """
+    if not temp_ids:
+        return commands
+    for cmd in commands:
+        args = cmd.get('args') or {}
+        for key in TEMP_ID_ARGS:
+            val = args.get(key)
+            if isinstance(val, str) and val in temp_ids:
+                args[key] = temp_ids[val]
+    return commands
+
+
+def get_sync_status_errors(response):
+    """ Return dict with {uuid: error} for all commands in `response` that did not succeed. """
+    return {uuid: status for uuid, status in (response.get("sync_status") or {}).items() if status != "ok"}
+
+
+def submit_chunks(api, chunks, commands, *, resource_types=None, pipeline=True, persist=True,
+                  max_retries=DEFAULT_MAX_RETRIES, verbose=0):
+    """ Submit chunks of commands in order, for `commit_chunked()`, and return {uuid: error} for failed commands.
+
+    Committed commands are removed from `api.queue` (and from `commands`, the pending commands, which are saved
+    to the pending commit file after each chunk, if `persist` is True). The chunks only carry commands; after the last chunk,
+    the changes for `resource_types` are fetched with a single incremental sync.
+    """
+    n_chunks = len(chunks)
+    n_commands = sum(len(chunk) for chunk in chunks)
+    # The worker thread posts with this sync token, rather than reading `api.sync_token` while it may be updated.
+    # The token does not matter for command-only requests, and is not advanced by their responses:
+    sync_token = api.sync_token
+
+    def submit(chunk):
+        # Runs in the worker thread. Temp ids are resolved here, right before submitting,
+        # so that we can use the temp_id_mapping from the chunk submitted just before this one.
+        resolve_temp_ids(chunk, api.temp_ids)
+        response = post_sync_commands(api, chunk, resource_types=[], sync_token=sync_token,
+                                      max_retries=max_retries, verbose=verbose)
+        api.temp_ids.update(response.get("temp_id_mapping") or {})
+        return response
+
+    errors = {}
+    n_committed = 0
+    # A single worker ensures that chunks are submitted strictly in order:
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(submit, chunks[0]) if pipeline else None
+        for chunk_idx, chunk in enumerate(chunks):
+            if pipeline:
+                response = future.result()
+                if chunk_idx + 1 < n_chunks:
+                    # Submit the next chunk while we parse the response for this one:
+                    future = executor.submit(submit, chunks[chunk_idx + 1])
+            else:
+                response = submit(chunk)
+            # Remove the committed commands from the queue (and from the pending commit file).
+            # Commands listed in `sync_status` have been processed by the server (successfully or not):
+            committed_uuids = {cmd['uuid'] for cmd in chunk} & set(response.get("sync_status") or {})
+            api.queue[:] = [cmd for cmd in api.queue if cmd['uuid'] not in committed_uuids]
+            if persist:
+                commands = [cmd for cmd in commands if cmd['uuid'] not in committed_uuids]
+                # The temp id mapping is not saved, so the remaining commands are saved with the real ids
+                # of objects created by the committed chunks (for `resume_commit()` in a later process):
+                save_pending_commands(api, resolve_temp_ids(commands, api.temp_ids))
+            apply_sync_response(api, response)  # Replaces temp ids in the local state.
+            api.sync_token = sync_token
+            chunk_errors = get_sync_status_errors(response)
+            errors.update(chunk_errors)
+            n_committed += len(chunk)
+            add_metric("commit_commands", len(chunk))
+            add_metric("commit_chunks")
+            add_metric("commit_errors", len(chunk_errors))
+            if verbose > -1 and n_chunks > 1:
+                print(f"   - Chunk {chunk_idx + 1}/{n_chunks}: {n_committed}/{n_commands} commands committed"
+                      f"{f' ({len(chunk_errors)} errors)' if chunk_errors else ''}.", file=sys.stderr)
+    try:
+        sync_resource_types(api, resource_types, verbose=verbose - 1)  # Also writes the cache.
+    except Exception as exc:
+        # The commands have been committed; the changes will be fetched by the next sync.
+        print(f"\nWARNING: Sync after commit failed ({exc!r}); use `-sync` to fetch the changes.", file=sys.stderr)
+        write_cache_file(api)
+    return errors
+
+
+def commit_chunked(api, chunk_size=None, *, resource_types=None, pipeline=True, raise_on_error=True, persist=True,
+                   max_retries=DEFAULT_MAX_RETRIES, verbose=0):
+    """ Commit all queued commands in chunks, rather than all-or-nothing in a single request.
+
+    Args:
+        api: todoist.TodoistAPI object, with commands in `api.queue`.
+        chunk_size: The maximum number of commands to submit in each request.
+        resource_types: The resource types to sync after the last chunk has been committed,
+            e.g. `["items", "projects", "labels"]`. Default: All resource types (incremental sync).
+        pipeline: If True, the next chunk is submitted (in a background thread) while the response
+            for the previous chunk is being parsed and applied to the local state.
+            Chunks are still submitted strictly in order, one request at a time.
+        raise_on_error: Raise a `todoist.api.SyncError` after committing all chunks,
+            if one or more commands failed.
+        persist: Save the queue to the pending commit file before submitting anything,
+            so an interrupted commit can be resumed with `resume_commit()`.
+            Commands left in the pending commit file by an earlier, interrupted commit are kept in the file
+            (merged by uuid), so they are not lost; they are only submitted by `resume_commit()`.
+        max_retries: The maximum number of times to retry each request (see `post_sync_commands()`).
+        verbose: Increase or decrease the verbosity of the information printed during function run.
+
+    Returns:
+        errors: dict with {uuid: error} for all commands that failed.
+
+    Commands that have been submitted are removed from `api.queue`. If a request fails
+    (e.g. because of a network error, after retrying), the remaining commands are left in the queue
+    and in the pending commit file.
+    """
+    if chunk_size is None:
+        chunk_size = DEFAULT_COMMIT_CHUNK_SIZE
+    chunk_size = int(chunk_size)
+    commands = list(api.queue)
+    n_commands = len(commands)
+    if n_commands == 0:
+        return {}
+    pending = commands
+    if persist:
+        queued_uuids = {cmd['uuid'] for cmd in commands}
+        earlier = [cmd for cmd in load_pending_commands(api) if cmd['uuid'] not in queued_uuids]
+        if earlier and verbose > -1:
+            print(f"\nWARNING: {len(earlier)} commands from an earlier, interrupted commit are still pending. "
+                  f"They are kept, but not submitted; use `-resume-commit` to submit them.", file=sys.stderr)
+        pending = earlier + commands
+        save_pending_commands(api, pending)
+    chunks = [commands[i:i + chunk_size] for i in range(0, n_commands, chunk_size)]
+    n_chunks = len(chunks)
+    if verbose > -1 and n_chunks > 1:
+        print(f" - Committing {n_commands} commands in {n_chunks} chunks of up to {chunk_size} commands...",
+              file=sys.stderr)
+
+    run_hooks("before_commit", api=api, n_commands=n_commands, chunk_size=chunk_size)
+    start_time = time.perf_counter()
+    try:
+        errors = submit_chunks(api, chunks, pending, resource_types=resource_types, pipeline=pipeline,
+                               persist=persist, max_retries=max_retries, verbose=verbose)
+    except Exception as exc:
+        run_hooks("after_commit", api=api, n_commands=n_commands, n_errors=None,
+                  duration=time.perf_counter() - start_time, error=exc)
+        raise
+    run_hooks("after_commit", api=api, n_commands=n_commands, n_errors=len(errors),
+              duration=time.perf_counter() - start_time, error=None)
+
+    if errors:
+        if verbose > -1:
+            print(f"\nERROR: {len(errors)} of {n_commands} commands failed:", file=sys.stderr)
+            for uuid, error in errors.items():
+                print(f" - {uuid}: {json.dumps(error)}", file=sys.stderr)
+        if raise_on_error:
+            raise todoist.api.SyncError(f"{len(errors)} of {n_commands} commands failed.", errors)
+    return errors
+
+
+def resume_commit(api, chunk_size=None, *, resource_types=None, raise_on_error=True, verbose=0):
+    """ Resume an interrupted commit by re-submitting the commands in the pending commit file.
+
+    Commands that were already applied by the server will not be applied again,
+    since the server recognizes the command uuids.
+
+    Returns:
+        errors: dict with {uuid: error} for all commands that failed.
+    """
+    pending = load_pending_commands(api)
+    if not pending:
+        if verbose > -1:
+            print(" - No pending commit found; nothing to resume.", file=sys.stderr)
+        return {}
+    queued_uuids = {cmd['uuid'] for cmd in api.queue}
+    pending = [cmd for cmd in pending if cmd['uuid'] not in queued_uuids]
+    if verbose > -1:
+        print(f" - Resuming commit of {len(pending)} pending commands...", file=sys.stderr)
+    api.queue[:0] = pending  # Pending commands go first, before anything queued in this session.
+    return commit_chunked(api, chunk_size=chunk_size, resource_types=resource_types,
+                          raise_on_error=raise_on_error, verbose=verbose)
+
+
+def get_outbox_filepath(api):
+    return os.path.join(get_cache_dir(api), OUTBOX_FILENAME_FMT.format(token=api.token))
+
+
+def load_outbox(api):
+    """ Load the list of deferred commands from the outbox (empty list if the outbox is empty). """
+    filepath = get_outbox_filepath(api)
+    if not os.path.exists(filepath):
+        return []
+    with open(filepath) as fp:
+        return json.load(fp)
+
+
+def defer_commit(api, *, verbose=0):
+    """ Move all queued commands to the persistent outbox, to be committed later with `flush_outbox()`.
+
+    The local state (including new objects with temporary ids) is written to the cache,
+    so that commands queued in later invocations can refer to objects created by the deferred commands.
+
+    Returns:
+        The number of commands now in the outbox.
+    """
+    outbox = load_outbox(api)
+    outbox_uuids = {cmd['uuid'] for cmd in outbox}
+    outbox.extend(cmd for cmd in api.queue if cmd['uuid'] not in outbox_uuids)
+    write_json_atomic(get_outbox_filepath(api), outbox)
+    if verbose > -1:
+        print(f" - {len(api.queue)} commands added to the outbox ({len(outbox)} commands in outbox). "
+              f"Use `-flush` to commit them.", file=sys.stderr)
+    del api.queue[:]
+    write_cache_file(api)
+    return len(outbox)
+
+
+def flush_outbox(api, chunk_size=None, *, resource_types=None, raise_on_error=True, verbose=0):
+    """ Commit all deferred commands in the outbox (and anything in `api.queue`) in one chunked commit.
+
+    Returns:
+        errors: dict with {uuid: error} for all commands that failed.
+    """
+    outbox = load_outbox(api)
+    queued_uuids = {cmd['uuid'] for cmd in api.queue}
+    outbox = [cmd for cmd in outbox if cmd['uuid'] not in queued_uuids]
+    if verbose > -1:
+        print(f" - Flushing {len(outbox)} commands from the outbox...", file=sys.stderr)
+    api.queue[:0] = outbox  # Deferred commands go first, so temp ids are created before they are referenced.
+    try:
+        return commit_chunked(api, chunk_size=chunk_size, resource_types=resource_types,
+                              raise_on_error=raise_on_error, verbose=verbose)
+    finally:
+        # Commands that were not submitted are still in `api.queue` and the pending commit file,
+        # so the outbox only needs to hold those (they are re-sent by the next flush or `resume_commit()`).
+        queued_uuids = {cmd['uuid'] for cmd in api.queue}
+        remaining = [cmd for cmd in outbox if cmd['uuid'] in queued_uuids]
+        if remaining:
+            write_json_atomic(get_outbox_filepath(api), remaining)
+        elif os.path.exists(get_outbox_filepath(api)):
+            os.remove(get_outbox_filepath(api))
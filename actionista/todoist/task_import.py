@@ -0,0 +1,233 @@
+# Copyright 2019, Rasmus Sorensen <rasmusscholer@gmail.com>
+"""
+
+Bulk import of tasks from CSV, TSV, JSONL, or plain text files (see `todoist-cli add-tasks`).
+
+Rows are read one at a time, and added/committed in batches, so files with thousands of tasks
+never have to be held in memory (neither the rows nor the command queue):
+
+    $ todoist-cli add-tasks samples.csv --project "Lab" --label samples --map "Sample ID=content" --map "Date=due"
+    $ todoist-add-tasks checklist.txt --due today --priority p2
+
+Input formats (default: inferred from the file extension):
+    csv, tsv:   One task per row. The first row is the header, with the column names.
+                Columns are mapped to task fields (content, due, project, labels, priority, note, section)
+                by name, or with `column_map`.
+    jsonl:      One JSON object per line, with task fields as keys (also mapped with `column_map`).
+    text:       One task (content) per line. Blank lines and lines starting with "#" are skipped.
+
+Empty values are replaced by the per-file defaults (e.g. `--project`), if given.
+
+Crash safety:
+After each batch has been committed, the number of committed rows is saved to a progress file.
+If the import is interrupted, running it again resumes after the last committed row.
+The command uuids are derived from an import id (saved in the progress file) and the row number,
+so if a batch was committed right before the crash, re-submitting it does not create duplicate tasks
+(the server ignores commands whose uuid it has already processed).
+The progress file is removed when the import completes.
+
+Rows rejected by the server (e.g. because of an invalid due date) do not stop the import: the progress is saved
+as usual, and the failed rows are reported (by row number) at the end, where a `todoist.api.SyncError` is raised.
+
+"""
+import os
+import sys
+import csv
+import json
+import uuid
+import hashlib
+import contextlib
+
+import todoist
+
+from actionista.todoist.api_commands import queue_task, sync_for_add_tasks
+from actionista.todoist.name_resolver import NameResolver
+from actionista.todoist.sync_utils import commit_chunked, get_cache_dir, write_json_atomic
+from actionista.todoist.history import load_json_state
+
+IMPORT_TASK_FIELDS = ("content", "due", "project", "labels", "priority", "note", "section")
+IMPORT_FORMATS_BY_EXTENSION = {
+    ".csv": "csv", ".tsv": "tsv", ".tab": "tsv",
+    ".jsonl": "jsonl", ".ndjson": "jsonl",
+    ".txt": "text", ".md": "text",
+}
+DEFAULT_IMPORT_BATCH_SIZE = 500  # Rows per batch (each batch is committed in chunks of `chunk_size` commands).
+IMPORT_PROGRESS_DIRNAME = "imports"
+
+
+def get_input_format(filepath, input_format=None):
+    """ Return the input format for a file, inferred from the file extension unless `input_format` is given. """
+    if input_format:
+        return input_format.lower()
+    return IMPORT_FORMATS_BY_EXTENSION.get(os.path.splitext(filepath)[1].lower(), "text")
+
+
+def iter_task_rows(fp, input_format, column_map=None):
+    """ Read task rows (dicts with task fields) from an open text file, one row at a time.
+
+    Args:
+        fp: Open file (text mode).
+        input_format: One of "csv", "tsv", "jsonl", or "text".
+        column_map: Dict mapping input column names (or JSON keys) to task fields, e.g. `{"Sample ID": "content"}`.
+
+    Yields:
+        Dict for each row, with task fields as keys.
+    """
+    column_map = column_map or {}
+    if input_format in ("csv", "tsv"):
+        rows = csv.DictReader(fp, delimiter="," if input_format == "csv" else "\t")
+    elif input_format == "jsonl":
+        rows = (json.loads(line) for line in fp if line.strip())
+    elif input_format == "text":
+        rows = ({"content": line.strip()} for line in fp if line.strip() and not line.lstrip().startswith("#"))
+    else:
+        raise ValueError(f"Unknown input format {input_format!r}; must be one of csv, tsv, jsonl, or text.")
+    for row in rows:
+        yield {column_map.get(key, key): value for key, value in row.items() if key is not None}
+
+
+def get_task_args(row, defaults=None):
+    """ Return `api_commands.queue_task()` arguments for a row, using `defaults` for missing or empty values. """
+    task = {field: value for field, value in (defaults or {}).items() if value not in (None, "", ())}
+    task.update({field: value for field, value in row.items()
+                 if field in IMPORT_TASK_FIELDS and value not in (None, "", [])})
+    if not task.get("content"):
+        raise ValueError("Missing task content.")
+    priority = task.get("priority")
+    if isinstance(priority, str):
+        priority = priority.strip().lower()
+        task["priority"] = int(priority) if priority.isdigit() else priority
+    return task
+
+
+def get_import_progress_filepath(api, filepath):
+    progress_dir = os.path.join(get_cache_dir(api), IMPORT_PROGRESS_DIRNAME)
+    os.makedirs(progress_dir, exist_ok=True)
+    path_hash = hashlib.sha1(os.path.abspath(filepath).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(progress_dir, f"{api.token}.{path_hash}.json")
+
+
+def get_command_uuid(import_id, row_number, command_index):
+    """ Return a deterministic command uuid, so re-submitting a row after a crash does not add it twice. """
+    name = f"actionista-todoist:add-tasks:{import_id}:{row_number}:{command_index}"
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, name))
+
+
+@contextlib.contextmanager
+def open_input(filepath):
+    """ Open the input file, or use stdin if `filepath` is "-". """
+    if filepath == "-":
+        yield sys.stdin
+    else:
+        # utf-8-sig, so the byte order mark written by e.g. Excel is not included in the first column name.
+        with open(filepath, newline="", encoding="utf-8-sig") as fp:
+            yield fp
+
+
+def import_tasks(
+        api, filepath, input_format=None, column_map=None, defaults=None, *,
+        batch_size=DEFAULT_IMPORT_BATCH_SIZE, chunk_size=None, sync=True, resume=True, verbose=0,
+):
+    """ Add tasks from a CSV, TSV, JSONL, or text file, streaming rows and committing in batches.
+
+    Args:
+        api: TodoistAPI object.
+        filepath: The file to import tasks from ("-" for stdin, in which case the import cannot be resumed).
+        input_format: "csv", "tsv", "jsonl", or "text". Default: Inferred from the file extension.
+        column_map: Dict mapping column names to task fields.
+        defaults: Dict with default values for task fields, e.g. `{"project": "Lab", "due": "today"}`.
+        batch_size: The number of rows to add before committing.
+        chunk_size: The maximum number of commands per request (see `sync_utils.commit_chunked()`).
+        sync: Sync projects, labels, and sections before importing (needed to resolve names).
+        resume: Resume an interrupted import of the same file. If False, any saved progress is discarded.
+        verbose: Increase or decrease the verbosity of the information printed during function run.
+
+    Returns:
+        The number of tasks added.
+
+    Raises:
+        todoist.api.SyncError: If the server rejected one or more rows (after importing all other rows).
+            The error's second argument is a dict with {row_number: error}.
+    """
+    input_format = get_input_format(filepath, input_format)
+    resolver = NameResolver(api)
+    if sync:
+        sync_for_add_tasks(api, sync, resolver=resolver, verbose=verbose)
+    progress_filepath = get_import_progress_filepath(api, filepath) if filepath != "-" else None
+    progress = load_json_state(progress_filepath) if progress_filepath and resume else {}
+    n_skip = progress.get("rows_committed", 0)
+    import_id = progress.get("import_id") or uuid.uuid4().hex
+    if verbose > -1:
+        if n_skip:
+            print(f"\nResuming import of {filepath} after row {n_skip}...", file=sys.stderr)
+        else:
+            print(f"\nImporting tasks from {filepath} ({input_format})...", file=sys.stderr)
+    digest = hashlib.sha1()  # Digest of the committed rows, to detect if the file was changed before resuming.
+    n_added = 0
+    row_number = n_batch = 0
+    batch_rows = {}  # {command uuid: row number}, for the commands in the current batch.
+    failed_rows = {}  # {row number: error}
+
+    def save_progress():
+        if progress_filepath:
+            write_json_atomic(progress_filepath, {
+                "filepath": os.path.abspath(filepath), "import_id": import_id,
+                "rows_committed": row_number, "rows_digest": digest.hexdigest(),
+            })
+
+    def commit_batch():
+        # Rejected commands do not raise, so the progress is always saved (re-running would not fix them):
+        errors = commit_chunked(api, chunk_size, raise_on_error=False, verbose=verbose - 1)
+        save_progress()
+        for command_uuid, error in errors.items():
+            failed_rows.setdefault(batch_rows.get(command_uuid), error)
+        batch_rows.clear()
+        if verbose > -1:
+            print(f" - {row_number} rows processed, {n_added - len(failed_rows)} tasks added.", file=sys.stderr)
+
+    if not n_skip:
+        # Save the import id before committing anything, so the command uuids are the same if we are interrupted:
+        save_progress()
+
+    with open_input(filepath) as fp:
+        for row_number, row in enumerate(iter_task_rows(fp, input_format, column_map), start=1):
+            digest.update(json.dumps(row, sort_keys=True).encode('utf-8'))
+            if row_number <= n_skip:
+                if row_number == n_skip and digest.hexdigest() != progress.get("rows_digest"):
+                    raise ValueError(
+                        f"The file {filepath} has changed since the interrupted import. "
+                        f"Use `--restart` to discard the saved progress (tasks from the first {n_skip} rows "
+                        f"were already added).")
+                continue
+            try:
+                task = get_task_args(row, defaults)
+                n_queued = len(api.queue)
+                queue_task(api, resolver, verbose=verbose - 1, **task)
+            except (ValueError, TypeError) as exc:
+                raise ValueError(f"Error in {filepath}, row {row_number}: {exc}") from exc
+            for command_index, command in enumerate(api.queue[n_queued:]):
+                command["uuid"] = get_command_uuid(import_id, row_number, command_index)
+                batch_rows[command["uuid"]] = row_number
+            n_added += 1
+            n_batch += 1
+            if n_batch >= batch_size:
+                commit_batch()
+                n_batch = 0
+    if row_number < n_skip:
+        raise ValueError(f"The file {filepath} has fewer rows than the interrupted import ({n_skip} rows). "
+                         f"Use `--restart` to discard the saved progress.")
+    if n_batch:
+        commit_batch()
+    if progress_filepath and os.path.exists(progress_filepath):
+        os.remove(progress_filepath)
+    n_added -= len(failed_rows)
+    if verbose > -1:
+        print(f"\nDone: {n_added} tasks added from {filepath}"
+              f"{f' (resumed after row {n_skip})' if n_skip else ''}.", file=sys.stderr)
+    if failed_rows:
+        print(f"\nERROR: {len(failed_rows)} rows were rejected by the server (fix and import these rows again):",
+              file=sys.stderr)
+        for failed_row, error in sorted(failed_rows.items(), key=lambda kv: kv[0] or 0):
+            print(f" - Row {failed_row}: {json.dumps(error)}", file=sys.stderr)
+        raise todoist.api.SyncError(f"{len(failed_rows)} rows from {filepath} failed.", failed_rows)
+    return n_added
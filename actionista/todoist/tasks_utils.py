@@ -20,7 +20,6 @@ import sys
 import datetime
 import re
 import dateutil.parser
-import pytz
 from dateutil import tz
 from todoist.models import Item, Project, Label
 from copy import deepcopy
@@ -239,7 +238,7 @@ def add_task_date_fields(
         output_dict = {}
 
     # Parse due date:
-    if input_dict.get('due'):
+    if input_dict.get('due') and input_dict['due'].get('date'):
         # v8 (and v7.1) Sync API has separate 'due' child dict - expand these to the old v7.0 format:
         output_dict['due_date'] = input_dict['due']['date']
         output_dict['due_string'] = input_dict['due']['string']
@@ -273,13 +272,20 @@ def add_task_date_fields(
                 # datetime object using `localize()`, then convert that timezone-aware datetime to
                 # computer-local time using `astimezone(tz.tzlocal())`:
                 # print("Task '{content}': due: {due} => dt: {due_date_dt}".format(due_date_dt=output_dict['due_date_dt'], **input_dict))
-                # Make it aware of the timezone:
+                # Make it aware of the timezone (pytz is only imported if there are tasks with a due timezone):
+                import pytz
                 output_dict['due_date_dt'] = pytz.timezone(input_dict['due']['timezone']).localize(output_dict['due_date_dt'])
             # Convert from UTC (or whatever timezone it has) to local datetime:
             output_dict['due_date_dt'] = output_dict['due_date_dt'].astimezone(tz.tzlocal())
             # output_dict['due_date_dt'] = pytz.utc.localize()
         output_dict['due_date_pretty_safe'] = output_dict['due_date_dt'].strftime(
             DATE_NO_TIME_FMT if output_dict['is_allday'] else DATE_TIME_FMT)
+    elif input_dict.get('due'):
+        # Due date was changed locally (e.g. `-reschedule` with `-commit later`), and hasn't been parsed by the server:
+        output_dict['due_string'] = input_dict['due'].get('string')
+        output_dict['due_string_safe'] = input_dict['due'].get('string')
+        output_dict['is_allday'] = True
+        output_dict['due_date_pretty_safe'] = NO_DUE_DATE_PRETTY_STR
     elif input_dict.get('due_date_utc'):
         # I have some old tasks where "due_date_utc" attribute is present but set to None. (weird)
         # print("Task '{content}': parsing due_date_utc: {due_date_utc}   (string: {date_string})".format(**input_dict))
@@ -353,6 +359,24 @@ def get_input_output_dicts(task, output_attr="_custom_data", deepcopy_data=True)
     return input_data, output_data
 
 
+def reset_custom_task_data(tasks, task_ids=None, output_attr="_custom_data"):
+    """ Remove derived/custom data from tasks, e.g. after a sync has updated the original task data.
+
+    Args:
+        tasks: A list of tasks.
+        task_ids: Only reset tasks with these ids (e.g. the items returned in a sync response).
+            Default: Reset all tasks.
+        output_attr: The task attribute where the custom data is stored.
+
+    Returns:
+        None; tasks are updated in-place, and custom data is re-created by `add_custom_task_fields()`.
+    """
+    for task in tasks:
+        if task_ids is None or task['id'] in task_ids:
+            if output_attr in vars(task):
+                delattr(task, output_attr)
+
+
 def add_custom_task_fields(
         tasks,
         api,
@@ -567,7 +591,8 @@ def inject_tasks_labels_fields(
     for task in tasks:
         # Update either `task.data` or `task._custom_data`:
         input_data, output_data = get_input_output_dicts(task, output_attr=output_attr, deepcopy_data=True)
-        task_labels = [labels_by_id[lid] for lid in input_data['labels']]
+        # Tasks added locally (not yet committed) may not have a 'labels' field:
+        task_labels = [labels_by_id[lid] for lid in input_data.get('labels') or []]
         label_dicts = [label.data if isinstance(label, Label) else label for label in task_labels]
         output_data['label_names'] = [label['name'] for label in label_dicts]
         # if lowercase_label_names:
@@ -15,7 +15,11 @@ from pprint import pprint
 
 from actionista.todoist.api_commands import add_task
 from .utils import get_todoist_api
-from .config import get_config
+from .sync_utils import flush_outbox
+from .task_import import import_tasks, DEFAULT_IMPORT_BATCH_SIZE
+from .history import update_completed_archive, update_activity_log, DEFAULT_MAX_WORKERS
+from .config import get_config, compile_config
+from .metrics import enable_metrics
 from .config import DEFAULT_PROJECT_PRINT_FMT, DEFAULT_PROJECT_SORT_KEYS, DEFAULT_PROJECT_SORT_ORDER
 
 
@@ -28,7 +32,8 @@ def todoist_cli():
 
     See also: `todoist-adhoc` CLI command.
     """
-    pass
+    # Separate metrics (file) for each sub-command, e.g. `todoist-cli-flush`:
+    enable_metrics(get_config(), command=f"todoist-cli-{click.get_current_context().invoked_subcommand}")
 
 # todoist_cli.add_command(add_task)  # Add manually (without decorator).
 
@@ -43,16 +48,20 @@ def todoist_cli():
 @click.option("--note", metavar="NOTE")
 @click.option("--auto-reminder/--no-auto-reminder", default=True)
 @click.option("--auto-parse-labels/--no-auto-parse-labels", default=True)
-@click.option("--sync/--no-sync", default=True)
+@click.option("--sync/--no-sync", default=None)
 @click.option("--commit/--no-commit", default=True)
+@click.option("--commit-later", is_flag=True, default=False,
+              help="Add the task to the local outbox instead of committing it. Use `todoist-cli flush` to commit.")
 @click.option("--show-queue/--no-show-queue", default=False)
 @click.option("--verbose", "-v", count=True)
 def add_task_cli(
         content, due=None, project=None, labels=None, priority=None, note=None,
         auto_reminder=None, auto_parse_labels=None,
-        sync=True, commit=True, show_queue=False, verbose=0,
+        sync=None, commit=True, commit_later=False, show_queue=False, verbose=0,
 ):
     """ Actionista for Todoist: Add-task CLI """
+    if commit_later:
+        commit = 'later'
     return add_task(
         content, due=due, project=project, labels=labels, priority=priority, note=note,
         auto_reminder=auto_reminder, auto_parse_labels=auto_parse_labels,
@@ -61,11 +70,73 @@ def add_task_cli(
     )
 
 
+@todoist_cli.command("add-tasks")  # NOT click.command().
+@click.argument("tasks_file")
+@click.option("--format", "input_format", type=click.Choice(["csv", "tsv", "jsonl", "text"]),
+              help="Input format (default: inferred from the file extension).")
+@click.option("--map", "column_map", multiple=True, metavar="COLUMN=FIELD",
+              help="Map an input column to a task field (content, due, project, labels, priority, note, section).")
+@click.option("--due", metavar="DUE-DATE", help="Default due date.")
+@click.option("--project", metavar="PROJECT-NAME", help="Default project.")
+@click.option("--section", metavar="SECTION-NAME", help="Default section.")
+@click.option("--label", "labels", multiple=True, metavar="LABEL", help="Default label(s).")
+@click.option("--priority", type=click.Choice(["p1", "p2", "p3", "p4"]), help="Default priority.")
+@click.option("--batch-size", type=int, default=DEFAULT_IMPORT_BATCH_SIZE, help="Number of rows per commit.")
+@click.option("--chunk-size", type=int, default=None, help="Max number of commands per request.")
+@click.option("--sync/--no-sync", default=True)
+@click.option("--restart", is_flag=True, default=False, help="Discard the progress of an interrupted import.")
+@click.option("--verbose", "-v", count=True)
 def add_tasks_cli(
-        tasks_file, input_format=None, due=None, project=None, labels=None, priority=None
+        tasks_file, input_format=None, column_map=(), due=None, project=None, section=None, labels=None,
+        priority=None, batch_size=DEFAULT_IMPORT_BATCH_SIZE, chunk_size=None, sync=True, restart=False, verbose=0,
 ):
-    """ Add multiple tasks from text or CSV/TSV file. """
-    raise NotImplementedError("Add-tasks-CLI (for adding multiple tasks from csv/text file is not yet implemented.")
+    """ Add multiple tasks from a CSV, TSV, JSONL, or text file (one task per line).
+
+    Rows are streamed and committed in batches; an interrupted import is resumed when run again.
+    See `task_import.py` for details.
+    """
+    try:
+        column_map = dict(mapping.split("=", 1) for mapping in column_map)
+    except ValueError:
+        raise click.BadParameter("Column mappings must be given as COLUMN=FIELD.", param_hint="--map") from None
+    defaults = dict(due=due, project=project, section=section, labels=list(labels or []), priority=priority)
+    api = get_todoist_api()
+    import todoist
+    try:
+        return import_tasks(
+            api, tasks_file, input_format=input_format, column_map=column_map, defaults=defaults,
+            batch_size=batch_size, chunk_size=chunk_size, sync=sync, resume=not restart, verbose=verbose,
+        )
+    except todoist.api.SyncError:
+        sys.exit(1)  # The failed rows have already been printed.
+
+
+@todoist_cli.command("flush")  # NOT click.command().
+@click.option("--chunk-size", type=int, default=None)
+@click.option("--verbose", "-v", count=True)
+def flush_cli(chunk_size=None, verbose=0):
+    """ Commit all tasks and changes deferred to the local outbox (e.g. with `--commit-later`). """
+    api = get_todoist_api()
+    flush_outbox(api, chunk_size=chunk_size, verbose=verbose)
+
+
+@todoist_cli.command("fetch-completed")  # NOT click.command().
+@click.option("--since", metavar="DATE", help="Fetch history since this date, if the local archive is empty.")
+@click.option("--max-workers", type=int, default=DEFAULT_MAX_WORKERS, help="Max number of pages to fetch concurrently.")
+@click.option("--verbose", "-v", count=True)
+def fetch_completed_cli(since=None, max_workers=DEFAULT_MAX_WORKERS, verbose=0):
+    """ Update the local archive of completed tasks (only tasks completed since the last fetch are fetched). """
+    api = get_todoist_api()
+    update_completed_archive(api, since=since, max_workers=max_workers, verbose=verbose)
+
+
+@todoist_cli.command("fetch-activity")  # NOT click.command().
+@click.option("--since", metavar="DATE", help="Fetch events since this date, if the local activity log is empty.")
+@click.option("--verbose", "-v", count=True)
+def fetch_activity_cli(since=None, verbose=0):
+    """ Update the local activity log (only events since the last fetch are fetched). """
+    api = get_todoist_api()
+    update_activity_log(api, since=since, verbose=verbose)
 
 
 @todoist_cli.command("print-projects")  # NOT click.command().
@@ -76,7 +147,7 @@ def add_tasks_cli(
 @click.option("--verbose", "-v", count=True)
 def print_projects_cli(print_fmt=None, sort_keys=None, sort_order=None, sep="\n", sync=True, verbose=0):
     """ Print projects. """
-    config = get_config()
+    config = get_config() or {}
     if print_fmt is None:
         print_fmt = config.get("default_project_print_fmt", DEFAULT_PROJECT_PRINT_FMT)
     if sort_keys is None:
@@ -86,7 +157,7 @@ def print_projects_cli(print_fmt=None, sort_keys=None, sort_order=None, sep="\n"
     if isinstance(sort_keys, str):
         sort_keys = [k.strip() for k in sort_keys.split(",")]
 
-    api = get_todoist_api()
+    api = get_todoist_api(config=config)
     if sync:
         if verbose:
             print("\nSyncing data with server...", file=sys.stderr)
@@ -110,6 +181,17 @@ def print_projects_cli(print_fmt=None, sort_keys=None, sort_order=None, sep="\n"
             print(print_fmt.format(**fmt_kwargs), end=sep)
 
 
+@todoist_cli.command("compile-config")  # NOT click.command().
+@click.option("--remove", is_flag=True, help="Remove the compiled config cache (read the config file directly).")
+def compile_config_cli(remove=False):
+    """ Store the parsed config file as JSON, which is faster to load (kept up-to-date automatically). """
+    compiled_fn = compile_config(remove=remove)
+    if compiled_fn is None:
+        print("No config file found.", file=sys.stderr)
+    else:
+        print(f"Compiled config cache {'removed' if remove else 'written'}: {compiled_fn}", file=sys.stderr)
+
+
 if __name__ == '__main__':
     # todoist_cli()  # `todoist-cli` entry point
     # add_task_cli()  # `todoist-add-task` entry point.
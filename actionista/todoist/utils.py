@@ -10,7 +10,10 @@ import requests
 # import maya  # Kenneth's "Date and time for Humans" package.
 # import moment
 # import zulu
-from actionista.todoist.config import get_token
+from actionista.todoist.config import get_config, get_token
+from actionista.todoist.metrics import enable_metrics
+from actionista.todoist.sync_utils import read_cache_file
+from actionista.todoist.rate_limit import install_rate_limiter
 from actionista import __version__
 
 DEFAULT_VERBOSE_PRINT_FILE = sys.stderr
@@ -33,12 +36,18 @@ def set_session_user_agent(session: requests.Session):
         session.headers["User-Agent"] += " " + get_user_agent()
 
 
-def get_todoist_api(token=None):
+def get_todoist_api(token=None, config=None):
     """ Returns Todoist API object with token read from file or config. """
+    if config is None:
+        config = get_config()
+    enable_metrics(config)  # Optional run metrics export (see `metrics.py`).
     if token is None:
-        token = get_token()
-    api = todoist.TodoistAPI(token=token)
+        token = get_token(config=config)
+    # Read the cache incrementally, rather than letting `TodoistAPI.__init__` load the whole file at once:
+    api = todoist.TodoistAPI(token=token, cache=None)
+    read_cache_file(api)
     set_session_user_agent(api.session)
+    install_rate_limiter(api.session, config=config)
     return api
 
 
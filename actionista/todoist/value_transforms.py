@@ -13,10 +13,15 @@ This module just imports all value transformation functions into a single module
 from builtins import *  # provides int, float, eval (!), etc.
 from datetime import time, datetime
 from dateutil.parser import parse as parse_dateutil
-from dateparser import parse as parse_dateparser
 
 parse_date = parse_dateutil
 
 
+def parse_dateparser(date_string, *args, **kwargs):
+    """ Parse a date using `dateparser.parse()` (imported on first use, since it is slow to import). """
+    import dateparser
+    return dateparser.parse(date_string, *args, **kwargs)
+
+
 
 
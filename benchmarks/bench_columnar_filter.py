@@ -0,0 +1,132 @@
+# Copyright 2019, Rasmus Sorensen <rasmusscholer@gmail.com>
+"""
+
+Check that the columnar operators give the same results as the scalar operators, and compare their speed.
+
+Two checks are made, on synthetic tasks with int, float, str, and timezone-aware datetime fields
+(with some missing values):
+    * Each columnar operator in `columnar_operators` is compared with `binary_operators`, for several
+      comparison values, both with and without NumPy (if it is installed).
+    * `filter_tasks()` with `columnar=True` is compared with `columnar=False`, for all `missing` modes
+      and with `negate`, and both are timed.
+
+Usage:
+    $ python benchmarks/bench_columnar_filter.py [n_tasks]
+
+Exits with status 1 if any result differs, e.g. for use in CI.
+
+"""
+import sys
+import time
+import random
+import datetime
+
+from actionista import binary_operators, columnar_operators
+from actionista.todoist.action_commands import filter_tasks
+
+DEFAULT_N_TASKS = 20000
+N_RUNS = 3
+# (field, operators, comparison values):
+CASES = [
+    ("priority", ["eq", "ne", "lt", "le", "gt", "ge"], [1, 3, 5]),
+    ("score", ["eq", "ne", "lt", "le", "gt", "ge"], [0.5, 2, -1.0]),
+    ("content", ["eq", "ne", "lt", "le", "gt", "ge", "ieq", "ine", "ilt", "igt",
+                 "startswith", "istartswith", "endswith", "iendswith", "contains", "icontains", "iin", "glob", "iglob", "re", "ire"],
+     ["Task 1", "task 1", "Email", "*Report*", "[Tt]ask 1?", "Task [0-9]+ ", "sk 2", "ASK"]),
+    ("due_date_dt", ["eq", "ne", "lt", "le", "gt", "ge"],
+     [datetime.datetime(2019, 9, 17, 12, tzinfo=datetime.timezone.utc),
+      datetime.datetime(2019, 9, 17, 14, tzinfo=datetime.timezone(datetime.timedelta(hours=2)))]),
+]
+
+
+def make_tasks(n_tasks, seed=0):
+    """ Create synthetic task dicts, with some missing (None) values. """
+    rng = random.Random(seed)
+    base = datetime.datetime(2019, 9, 1, tzinfo=datetime.timezone.utc)
+    words = ["Task", "task", "Email", "Report", "weekly", "REPORT", "Call", "ask"]
+    return [{
+        "id": i,
+        "priority": rng.randint(1, 4),
+        "score": rng.choice([rng.uniform(-2, 4), 0.5, float("nan")]),
+        "content": f"{rng.choice(words)} {rng.randint(0, 30)} {rng.choice(words)}",
+        "due_date_dt": (base + datetime.timedelta(hours=rng.randint(0, 24 * 30))
+                        if rng.random() < 0.8 else None),
+    } for i in range(n_tasks)]
+
+
+def check_operators(tasks):
+    """ Compare each columnar operator with the scalar operator. Returns the number of mismatches. """
+    n_failed = 0
+    for field, op_names, values in CASES:
+        column = [task[field] for task in tasks if task[field] is not None]
+        for op_name in op_names:
+            for value in values:
+                column_op = getattr(columnar_operators, op_name)
+                kind = columnar_operators.get_column_kind(column)
+                if kind not in column_op.kinds or not columnar_operators.is_compatible(kind, value):
+                    continue
+                scalar_op = getattr(binary_operators, op_name)
+                try:
+                    expected = [bool(scalar_op(a, value)) for a in column]
+                except Exception:
+                    continue  # E.g. "*Report*" is not a valid regular expression.
+                for use_numpy in (False, True):
+                    min_size = columnar_operators.NUMPY_MIN_SIZE
+                    columnar_operators.NUMPY_MIN_SIZE = min_size if use_numpy else len(column) + 1
+                    try:
+                        result = column_op(column, value)
+                    finally:
+                        columnar_operators.NUMPY_MIN_SIZE = min_size
+                    result = [bool(match) for match in result]
+                    if result != expected:
+                        n_failed += 1
+                        print(f"MISMATCH: {op_name}({field}, {value!r}), numpy={use_numpy}: "
+                              f"{sum(r != e for r, e in zip(result, expected))} values differ.")
+    return n_failed
+
+
+def best_time(func):
+    times = []
+    for _ in range(N_RUNS):
+        t0 = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - t0)
+    return min(times), result
+
+
+def check_filter_tasks(tasks):
+    """ Compare `filter_tasks()` with and without `columnar`, and print the timings. Returns the number of mismatches. """
+    n_failed = 0
+    print(f"{'filter':45} {'scalar':>10} {'columnar':>10} {'speedup':>8}")
+    for field, op_names, values in CASES:
+        for op_name in op_names:
+            for missing, negate in (("exclude", False), ("include", True), ("default", False)):
+                value = values[0]
+                kwargs = dict(taskkey=field, op_name=op_name, value=value, missing=missing, negate=negate,
+                              default=values[-1], verbose=-1)
+                try:
+                    scalar_time, expected = best_time(lambda: filter_tasks(tasks, columnar=False, **kwargs))
+                except Exception:
+                    continue  # E.g. an invalid regular expression, or comparing None with a datetime.
+                columnar_time, result = best_time(lambda: filter_tasks(tasks, columnar=True, **kwargs))
+                if [task["id"] for task in result] != [task["id"] for task in expected]:
+                    n_failed += 1
+                    print(f"MISMATCH: filter_tasks({field} {op_name} {value!r}, missing={missing}, negate={negate})")
+                name = f"{field} {op_name} {str(value)[:12]} ({missing}{', negate' if negate else ''})"
+                print(f"{name:45} {scalar_time * 1000:8.1f}ms {columnar_time * 1000:8.1f}ms "
+                      f"{scalar_time / columnar_time:7.1f}x")
+    return n_failed
+
+
+def main(n_tasks=DEFAULT_N_TASKS):
+    n_tasks = int(n_tasks)
+    tasks = make_tasks(n_tasks)
+    print(f"{n_tasks} tasks, numpy {'installed' if columnar_operators.get_numpy() else 'NOT installed'}.\n")
+    n_failed = check_operators(tasks) + check_filter_tasks(tasks)
+    print(f"\n{'FAILED' if n_failed else 'OK'}: {n_failed} mismatches.")
+    if n_failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
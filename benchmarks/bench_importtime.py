@@ -0,0 +1,62 @@
+# Copyright 2019, Rasmus Sorensen <rasmusscholer@gmail.com>
+"""
+
+Benchmark CLI cold-start time (importing the CLI modules), and fail if it exceeds the budget.
+
+Each module is imported in a fresh interpreter with `python -X importtime`, a few times,
+and the fastest run is compared to the budget. The benchmark also fails if any of the heavy,
+rarely-needed dependencies (`LAZY_MODULES`) are imported at startup; these must only be imported
+on the code paths that use them (e.g. `dateparser` for parsing human dates).
+
+Usage:
+    $ python benchmarks/bench_importtime.py [budget_ms]
+
+Exits with status 1 if the budget is exceeded or a lazy module is imported, e.g. for use in CI.
+
+"""
+import sys
+import subprocess
+
+DEFAULT_BUDGET_MS = 400
+N_RUNS = 5
+CLI_MODULES = [
+    "actionista.todoist.action_cli",
+    "actionista.todoist.todoist_cli",
+]
+LAZY_MODULES = ["dateparser", "parsedatetime", "pytz", "yaml", "numpy", "ijson"]
+
+
+def import_time(module):
+    """ Import `module` in a fresh interpreter, and return (total import time in ms, set of imported modules). """
+    res = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        stderr=subprocess.PIPE, universal_newlines=True, check=True,
+    )
+    total_us, imported = 0, set()
+    for line in res.stderr.splitlines():
+        # Format: "import time: self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        total_us += int(self_us)
+        imported.add(name.strip())
+    return total_us / 1000, imported
+
+
+def main(budget_ms=DEFAULT_BUDGET_MS):
+    failed = False
+    for module in CLI_MODULES:
+        import_time(module)  # Warm up the file system cache (and compile .pyc files, if missing).
+        runs = [import_time(module) for _ in range(N_RUNS)]
+        best_ms = min(ms for ms, _ in runs)
+        eager = sorted(name for name in LAZY_MODULES if name in runs[0][1])
+        ok = best_ms <= budget_ms and not eager
+        failed = failed or not ok
+        print(f"{module:35} {best_ms:7.1f} ms (budget {budget_ms} ms)"
+              f"{f', imports {eager}' if eager else ''}  {'OK' if ok else 'FAIL'}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main(*[float(arg) for arg in sys.argv[1:]])
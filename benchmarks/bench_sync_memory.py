@@ -0,0 +1,82 @@
+# Copyright 2019, Rasmus Sorensen <rasmusscholer@gmail.com>
+"""
+
+Benchmark peak memory (and time) when applying a large full-sync response to the local state.
+
+Compares:
+    * "buffered": What `api.sync()` and `api._read_cache()` do: read the whole response, `json.loads()` it,
+        then `api._update_state()`.
+    * "streamed": `sync_utils.apply_json_stream()`, using ijson (if installed) or the fallback chunked parser.
+
+Usage:
+    $ python benchmarks/bench_sync_memory.py [n_items]
+
+Peak memory is measured with `tracemalloc` (Python allocations only), so absolute numbers are lower
+than the process RSS, but the ratio between the two approaches is what matters.
+
+"""
+import os
+import sys
+import json
+import time
+import tempfile
+import tracemalloc
+
+import todoist
+
+from actionista.todoist.sync_utils import apply_json_stream
+
+
+def make_sync_response(n_items):
+    """ Create a synthetic full-sync response with `n_items` tasks. """
+    return {
+        "full_sync": True,
+        "sync_token": "benchmark",
+        "items": [{
+            "id": 1000000 + i, "content": f"Task number {i} with a reasonably long description", "project_id": 1 + i % 10,
+            "labels": [7] if i % 3 == 0 else [], "checked": 0, "priority": 1 + i % 4, "child_order": i,
+            "due": {"date": "2019-09-17", "string": "every day", "is_recurring": True, "timezone": None, "lang": "en"},
+            "date_added": "2019-01-01T00:00:00Z", "in_history": 0, "is_deleted": 0, "parent_id": None,
+        } for i in range(n_items)],
+        "projects": [{"id": i, "name": f"Project {i}"} for i in range(1, 11)],
+        "labels": [{"id": 7, "name": "habit"}],
+        "user": {"inbox_project": 1},
+    }
+
+
+def bench(name, func, filepath):
+    api = todoist.TodoistAPI(token="benchmark", cache=None)
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    func(api, filepath)
+    duration = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:>10}: {len(api.state['items']):7} items, peak {peak / 2**20:7.1f} MiB, {duration:6.2f} s")
+    return peak
+
+
+def apply_buffered(api, filepath):
+    with open(filepath) as fp:
+        text = fp.read()
+    api._update_state(json.loads(text))
+
+
+def apply_streamed(api, filepath):
+    with open(filepath, 'rb') as fp:
+        apply_json_stream(api, fp)
+
+
+def main(n_items=5000):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filepath = os.path.join(tmpdir, "response.json")
+        with open(filepath, 'w') as fp:
+            json.dump(make_sync_response(n_items), fp)
+        print(f"Response size: {os.path.getsize(filepath) / 2**20:0.1f} MiB")
+        peak_buffered = bench("buffered", apply_buffered, filepath)
+        peak_streamed = bench("streamed", apply_streamed, filepath)
+        print(f"Peak memory ratio (streamed/buffered): {peak_streamed / peak_buffered:0.2f}")
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
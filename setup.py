@@ -66,6 +66,7 @@ setup(
             # todoist_cli entry points (click-based):
             'todoist-cli=actionista.todoist.todoist_cli:todoist_cli',
             'todoist-add-task=actionista.todoist.todoist_cli:add_task_cli',
+            'todoist-add-tasks=actionista.todoist.todoist_cli:add_tasks_cli',
 
             # Entry points for adhoc_cli commands (argparse-based):
             # 'todoist-adhoc=actionista.todoist.adhoc_cli:main',
@@ -84,6 +85,10 @@ setup(
         'parsedatetime',    # Has better concept of accuracy of parsed date/time than dateparser.
         'click',            # CLI package. (Only used for auxiliary CLI programs)
     ],
+    extras_require={
+        'streaming': ['ijson'],  # Faster incremental parsing of large sync responses (optional).
+        'analytics': ['numpy'],  # Faster aggregation for the `-stats` reports (optional).
+    },
     python_requires='>=3.6',  # Type-hints, f-strings,
     classifiers=[
         # How mature is this project? Common values are